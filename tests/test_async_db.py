@@ -0,0 +1,129 @@
+"""Tests for the asynchronous DB facade."""
+import pytest
+import asyncio
+import contextvars
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+import db
+from async_db import AsyncDB
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "gallery.db")
+    monkeypatch.setattr(db, "DATA_DIR", tmp_path)
+    db.init_db()
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps([{"id": f"img_{i}", "local_path": f"wiki/{i}.jpg"} for i in range(3)]))
+    db.import_manifest(manifest)
+    return tmp_path
+
+
+class TestAsyncDB:
+    def test_db_functions_are_awaitable(self, temp_db):
+        async def scenario():
+            async with AsyncDB() as adb:
+                assert len(await adb.get_pending()) == 3
+                await adb.save_analysis("img_0", {"ship_type": "cruiser"})
+                return await adb.get_pending()
+
+        assert [row["id"] for row in asyncio.run(scenario())] == ["img_1", "img_2"]
+
+    def test_wal_is_opt_in_and_reverted(self, temp_db, monkeypatch):
+        def journal_mode():
+            conn = sqlite3.connect(db.DB_PATH)
+            try:
+                return conn.execute("PRAGMA journal_mode").fetchone()[0]
+            finally:
+                conn.close()
+
+        async def scenario(**kwargs):
+            async with AsyncDB(**kwargs) as adb:
+                await adb.get_pending()
+
+        monkeypatch.delenv("NAVAL_GALLERY_SQLITE_WAL", raising=False)
+        asyncio.run(scenario())
+        assert journal_mode() == "delete"
+        monkeypatch.setenv("NAVAL_GALLERY_SQLITE_WAL", "1")
+        asyncio.run(scenario())
+        assert journal_mode() == "wal"
+        asyncio.run(scenario(wal=False))
+        assert journal_mode() == "delete"
+
+    def test_writes_run_in_order_on_one_thread(self):
+        seen, threads = [], set()
+
+        def record(n):
+            time.sleep(0.01 if n % 2 else 0)
+            threads.add(threading.current_thread().name)
+            seen.append(n)
+
+        async def scenario():
+            async with AsyncDB(wal=False) as adb:
+                for n in range(10):
+                    adb.write(record, n)  # not awaited: the close drains them
+
+        asyncio.run(scenario())
+        assert seen == list(range(10))
+        assert len(threads) == 1 and threads.pop().startswith("db-writer")
+
+    def test_reads_run_concurrently(self):
+        async def scenario():
+            async with AsyncDB(readers=4, wal=False) as adb:
+                start = time.perf_counter()
+                await asyncio.gather(*(adb.read(time.sleep, 0.2) for _ in range(4)))
+                return time.perf_counter() - start
+
+        assert asyncio.run(scenario()) < 0.6
+
+    def test_loop_keeps_running_during_a_slow_write(self):
+        ticks = []
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.02)
+
+        async def scenario():
+            async with AsyncDB(wal=False) as adb:
+                await asyncio.gather(adb.write(time.sleep, 0.15), ticker())
+
+        asyncio.run(scenario())
+        assert len(ticks) == 5 and ticks[-1] - ticks[0] < 0.14
+
+    def test_errors_propagate_or_are_logged(self, caplog):
+        def fail():
+            raise sqlite3.OperationalError("disk I/O error")
+
+        async def scenario():
+            async with AsyncDB(wal=False) as adb:
+                with pytest.raises(sqlite3.OperationalError):
+                    await adb.write(fail)
+                adb.write(fail)  # nobody awaits this one
+
+        asyncio.run(scenario())
+        assert "DB call fail failed: disk I/O error" in caplog.text
+
+    def test_calls_carry_context(self):
+        var = contextvars.ContextVar("var", default=None)
+
+        async def scenario():
+            var.set("classify")
+            async with AsyncDB(wal=False) as adb:
+                return await adb.write(var.get)
+
+        assert asyncio.run(scenario()) == "classify"
+
+    def test_unknown_function_and_unstarted_facade(self):
+        adb = AsyncDB()
+        with pytest.raises(AttributeError):
+            adb.drop_everything
+        with pytest.raises(RuntimeError):
+            adb.get_pending()
@@ -0,0 +1,122 @@
+"""Tests for vision cassette record/replay."""
+import pytest
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+from vision import MCPVisionClient, Cassette, CassetteMiss
+
+FAKE_SERVER = Path(__file__).parent.parent / "tools" / "vision" / "fake_server.py"
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"plate_{i}.jpg"
+        path.write_bytes(b"\xff\xd8\xff" + bytes([i]) * 64)
+        paths.append(path)
+    return paths
+
+
+def record(cassette_path, images, prompt="classify"):
+    cassette = Cassette(cassette_path, mode="record")
+    client = MCPVisionClient(api_key="test-key", cassette=cassette,
+                             command=[sys.executable, str(FAKE_SERVER)])
+
+    async def scenario():
+        async with client:
+            return [await client.analyze_image(str(p), prompt) for p in images]
+
+    return asyncio.run(scenario())
+
+
+def replay(cassette_path, images, prompt="classify"):
+    cassette = Cassette(cassette_path, mode="replay")
+    # The command would fail if it were ever spawned
+    client = MCPVisionClient(cassette=cassette, command=["/nonexistent/mcp-server"])
+
+    async def call(path):
+        try:
+            return await client.analyze_image(str(path), prompt)
+        except CassetteMiss as e:
+            return e
+
+    async def scenario():
+        async with client:
+            return [await call(p) for p in images]
+
+    return asyncio.run(scenario()), cassette
+
+
+class TestCassette:
+    def test_record_appends_one_line_per_call(self, tmp_path, images):
+        cassette_path = tmp_path / "vision.cassette.jsonl"
+        record(cassette_path, images)
+
+        lines = cassette_path.read_text().splitlines()
+        assert len(lines) == 3
+        entry = json.loads(lines[0])
+        assert set(entry) >= {"image_sha256", "prompt_sha256", "request", "response"}
+        assert entry["request"]["arguments"]["prompt"] == "classify"
+
+    def test_replay_serves_recorded_responses_without_server(self, tmp_path, images):
+        cassette_path = tmp_path / "vision.cassette.jsonl"
+        recorded = record(cassette_path, images)
+
+        replayed, cassette = replay(cassette_path, images)
+        assert [r.content for r in replayed] == [r.content for r in recorded]
+        assert cassette.hits == 3 and cassette.misses == 0
+
+    def test_replay_is_keyed_by_content_not_path(self, tmp_path, images):
+        """Moving a file (as organize_gallery does) must not break replay."""
+        cassette_path = tmp_path / "vision.cassette.jsonl"
+        record(cassette_path, images[:1])
+
+        moved = tmp_path / "classified" / "renamed.jpg"
+        moved.parent.mkdir()
+        images[0].rename(moved)
+
+        replayed, _ = replay(cassette_path, [moved])
+        assert replayed[0].success
+
+    def test_replay_miss_on_different_prompt(self, tmp_path, images):
+        cassette_path = tmp_path / "vision.cassette.jsonl"
+        record(cassette_path, images[:1], prompt="phase 1")
+
+        replayed, cassette = replay(cassette_path, images[:1], prompt="phase 2")
+        assert isinstance(replayed[0], CassetteMiss)
+        assert cassette.misses == 1
+
+    def test_scratch_files_are_rehashed_stored_plates_memoized(self, tmp_path, monkeypatch):
+        import os
+        import tempfile
+        (tmp_path / "scratch").mkdir()
+        monkeypatch.setattr(tempfile, "tempdir", str(tmp_path / "scratch"))
+        cassette = Cassette(tmp_path / "vision.cassette.jsonl")
+
+        scratch = tmp_path / "scratch" / "low_res.jpg"
+        scratch.write_bytes(b"a" * 64)
+        stat = scratch.stat()
+        first = cassette.key(scratch, "p")
+        # Same path, size and mtime: only the content tells them apart
+        scratch.write_bytes(b"b" * 64)
+        os.utime(scratch, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert cassette.key(scratch, "p") != first
+
+        plate = tmp_path / "plate.jpg"
+        plate.write_bytes(b"c" * 64)
+        cassette.key(plate, "p")
+        monkeypatch.setattr("vision.cassette.hash_file", lambda path: pytest.fail("plate hashed twice"))
+        cassette.key(plate, "p")
+
+    def test_torn_last_line_is_ignored(self, tmp_path, images):
+        cassette_path = tmp_path / "vision.cassette.jsonl"
+        record(cassette_path, images[:2])
+        with open(cassette_path, "a") as f:
+            f.write('{"image_sha256": "trunc')
+
+        assert len(Cassette(cassette_path, mode="replay")) == 2
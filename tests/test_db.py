@@ -243,3 +243,48 @@ class TestSyncFrontend:
         assert "</script>" not in content
         assert "<\\/script>" in content
 
+
+
+class TestImageRecord:
+    @pytest.fixture
+    def analyzed(self, temp_db, tmp_path):
+        manifest = tmp_path / "data" / "test_manifest.json"
+        manifest.write_text(json.dumps([{"id": "ship_1", "local_path": "wiki/1.jpg", "source": "Wikimedia Commons"}]))
+        db.import_manifest(manifest)
+        db.save_analysis("ship_1", {"navy": "USN", "ship_type": "battleship", "bounds": {"x": 1, "y": 2}})
+        return temp_db
+
+    def test_projection_selects_only_requested_columns(self, analyzed):
+        (record,) = db.get_ready_to_organize(columns=db.ORGANIZE_COLUMNS)
+        assert list(record.keys()) == list(db.ORGANIZE_COLUMNS)
+        assert record['navy'] == "USN" and record.ship_type == "battleship"
+        assert record.get('view_type', 'Unknown') is None  # present but NULL, like a dict
+        assert record.get('raw_response', 'missing') == 'missing'
+        with pytest.raises(KeyError):
+            record['raw_response']
+
+    def test_unknown_columns_are_skipped(self, analyzed):
+        (record,) = db.get_ready_to_organize(columns=('id', 'cluster_id'))
+        assert dict(record) == {'id': 'ship_1'}
+
+    def test_json_fields_decode_lazily(self, analyzed):
+        (record,) = db.select_images(columns=('id', 'bounds', 'text_content'))
+        assert record._decoded is None
+        assert record['bounds'] == {"x": 1, "y": 2}
+        assert record['bounds'] is record['bounds']
+        assert record['text_content'] is None
+        assert record == {'id': 'ship_1', 'bounds': {"x": 1, "y": 2}, 'text_content': None}
+
+    def test_rows_share_one_column_index(self, temp_db, tmp_path):
+        manifest = tmp_path / "data" / "test_manifest.json"
+        manifest.write_text(json.dumps([{"id": f"img_{i}", "local_path": f"{i}.jpg"} for i in range(3)]))
+        db.import_manifest(manifest)
+        records = db.get_pending(columns=('id', 'local_path'))
+        assert len({id(r._index) for r in records}) == 1
+        assert records[2]._values == ('img_2', '2.jpg')
+
+    def test_export_decodes_json_fields(self, analyzed, tmp_path):
+        out = tmp_path / "export.json"
+        db.export_manifest(out)
+        (entry,) = json.loads(out.read_text())
+        assert entry['bounds'] == {"x": 1, "y": 2}
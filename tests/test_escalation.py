@@ -0,0 +1,194 @@
+"""Tests for the confidence-driven escalation ladder."""
+import pytest
+import asyncio
+import json
+import sqlite3
+from functools import partial
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+import db
+import escalation
+from escalation import Attempt, EscalationPolicy, FULL_RES, LOW_RES, REPROMPT, ROI
+
+FAKE_SERVER = Path(__file__).parent.parent / "tools" / "vision" / "fake_server.py"
+
+PHASE_1_ANSWER = {"image_type": "single_view", "view_type": "side_profile",
+                  "ship_type": "battleship", "extraction_tier": 2, "confidence": 0.9}
+
+
+class TestPolicy:
+    def test_confident_complete_answer_is_accepted(self):
+        attempt = EscalationPolicy().judge(Attempt(LOW_RES, data=dict(PHASE_1_ANSWER)), phases=(1,))
+        assert attempt.accepted
+        assert attempt.missing == []
+
+    def test_low_confidence_escalates(self):
+        data = {**PHASE_1_ANSWER, "confidence": 0.4}
+        assert not EscalationPolicy(threshold=0.7).judge(Attempt(LOW_RES, data=data), phases=(1,)).accepted
+
+    def test_missing_required_field_escalates(self):
+        data = {**PHASE_1_ANSWER, "view_type": None}
+        attempt = EscalationPolicy().judge(Attempt(LOW_RES, data=data), phases=(1,))
+        assert not attempt.accepted
+        assert attempt.missing == ["view_type"]
+
+    def test_combined_non_ship_does_not_need_specifications(self):
+        data = {**PHASE_1_ANSWER, "ship_type": "unknown", "ship_class": None}
+        assert EscalationPolicy().judge(Attempt(LOW_RES, data=data), phases=(1, 2)).accepted
+        data["ship_type"] = "cruiser"
+        policy = EscalationPolicy(required={1: (), 2: ("ship_class",)})
+        assert policy.judge(Attempt(LOW_RES, data=data), phases=(1, 2)).missing == ["ship_class"]
+
+    def test_missing_specifications_alone_do_not_escalate(self):
+        data = {"ship_class": None, "confidence": 0.9}
+        assert EscalationPolicy().judge(Attempt(ROI, data=data), phases=(2,)).accepted
+
+    def test_ladders(self):
+        assert EscalationPolicy().ladder(1) == (LOW_RES, FULL_RES, REPROMPT)
+        assert EscalationPolicy().ladder(2) == (ROI, FULL_RES, REPROMPT)
+        assert EscalationPolicy(escalate=False).ladder(1) == (FULL_RES,)
+
+    def test_best_prefers_accepted_then_complete(self):
+        weak = Attempt(LOW_RES, data={}, confidence=0.95, missing=["ship_type"])
+        better = Attempt(FULL_RES, data={}, confidence=0.6, missing=[])
+        failed = Attempt(REPROMPT, error="boom")
+        assert EscalationPolicy.best([weak, better, failed]) is better
+        assert EscalationPolicy.best([failed]) is None
+
+    def test_reprompt_names_missing_fields(self):
+        text = escalation.reprompt("PROMPT", Attempt(LOW_RES, confidence=0.3, missing=["ship_class"]), 0.7)
+        assert "ship_class" in text and "low confidence" in text
+        assert text.endswith("PROMPT")
+
+
+class TestDownscale:
+    def test_large_plate_is_shrunk(self, tmp_path):
+        Image = pytest.importorskip("PIL.Image")
+        src = tmp_path / "plate.png"
+        Image.effect_noise((3000, 1200), 40).save(src)
+        out = escalation.downscale(src, tmp_path / "low.jpg")
+        assert out is not None
+        with Image.open(out) as low:
+            assert max(low.size) == escalation.LOW_RES_MAX_SIDE
+
+    def test_small_jpeg_is_sent_as_is(self, tmp_path):
+        Image = pytest.importorskip("PIL.Image")
+        src = tmp_path / "small.jpg"
+        Image.new("RGB", (600, 300), "white").save(src)
+        assert escalation.downscale(src, tmp_path / "low.jpg") is None
+
+
+class TestLadder:
+    @pytest.fixture
+    def temp_db(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(db, "DB_PATH", tmp_path / "test_gallery.db")
+        monkeypatch.setattr(db, "DATA_DIR", tmp_path)
+        monkeypatch.setenv("NAVAL_GALLERY_IMAGE_DIR", str(tmp_path))
+        monkeypatch.delenv("NAVAL_GALLERY_JOURNAL_DIR", raising=False)
+        db.init_db()
+        return tmp_path
+
+    def run_classifier(self, temp_db, canned, image=None, daily_budget=None):
+        Image = pytest.importorskip("PIL.Image")
+        from vision import MCPVisionClient
+        from classify_images import Classifier
+
+        plate = temp_db / "img" / "loc" / "plate.png"
+        plate.parent.mkdir(parents=True)
+        (image or Image.effect_noise((2400, 1000), 40)).save(plate)
+        manifest = temp_db / "manifest.json"
+        manifest.write_text(json.dumps([{"id": "plate", "local_path": "loc/plate.png",
+                                         "source": "Library of Congress"}]))
+        db.import_manifest(manifest)
+        canned_path = temp_db / "canned.json"
+        canned_path.write_text(json.dumps(canned))
+
+        client_factory = partial(MCPVisionClient, api_key="test-key",
+                                 command=[sys.executable, str(FAKE_SERVER), "--canned", str(canned_path)])
+        asyncio.run(Classifier(phase=1, rate_limit=0, client_factory=client_factory,
+                               daily_budget=daily_budget).run())
+
+        conn = sqlite3.connect(db.DB_PATH)
+        tiers = [row[0] for row in conn.execute("SELECT tier FROM analysis_attempts ORDER BY id")]
+        status = conn.execute("SELECT analysis_status, confidence FROM images").fetchone()
+        conn.close()
+        return tiers, status
+
+    def test_confident_answer_stops_at_low_res(self, temp_db):
+        tiers, status = self.run_classifier(temp_db, PHASE_1_ANSWER)
+        assert tiers == [LOW_RES]
+        assert status == ("complete", 0.9)
+
+    def test_unconfident_answer_climbs_the_ladder(self, temp_db):
+        tiers, status = self.run_classifier(temp_db, {**PHASE_1_ANSWER, "confidence": 0.4})
+        assert tiers == [LOW_RES, FULL_RES, REPROMPT]
+        assert status == ("complete", 0.4)
+
+        usage = db.get_tier_usage()
+        assert usage["totals"] == {"images": 1, "calls": 3, "bytes": usage["totals"]["bytes"]}
+        assert {row["tier"]: row["resolved"] for row in usage["tiers"]} == {LOW_RES: 0, FULL_RES: 0, REPROMPT: 1}
+        assert "calls/image: 3.00" in escalation.format_report(usage)
+
+    def test_budget_cuts_the_ladder_short(self, temp_db):
+        tiers, status = self.run_classifier(temp_db, {**PHASE_1_ANSWER, "confidence": 0.4}, daily_budget=2)
+        assert tiers == [LOW_RES, FULL_RES]
+        assert status == ("complete", 0.4)
+        assert db.get_api_usage() == 2
+
+    def test_cassette_miss_leaves_the_image_pending(self, temp_db):
+        Image = pytest.importorskip("PIL.Image")
+        from vision import Cassette, MCPVisionClient
+        from classify_images import Classifier
+
+        plate = temp_db / "img" / "loc" / "plate.png"
+        plate.parent.mkdir(parents=True)
+        Image.effect_noise((800, 400), 40).save(plate)
+        manifest = temp_db / "manifest.json"
+        manifest.write_text(json.dumps([{"id": "plate", "local_path": "loc/plate.png"}]))
+        db.import_manifest(manifest)
+        cassette_path = temp_db / "empty.cassette.jsonl"
+        cassette_path.write_text("")
+        client_factory = partial(MCPVisionClient, cassette=Cassette(cassette_path, mode="replay"),
+                                 command=["/nonexistent/mcp-server"])
+        asyncio.run(Classifier(phase=1, rate_limit=0, client_factory=client_factory).run())
+
+        assert [r["id"] for r in db.get_pending()] == ["plate"]
+        assert db.get_tier_usage()["totals"]["images"] == 0
+
+    def test_dead_server_stops_the_run_and_leaves_images_pending(self, temp_db, monkeypatch):
+        Image = pytest.importorskip("PIL.Image")
+        from vision import CircuitBreaker, MCPServerDied, MCPVisionClient
+        import classify_images
+        from classify_images import Classifier
+
+        monkeypatch.setattr(classify_images, "MAX_CONSECUTIVE_RESTARTS", 4)
+
+        plate = temp_db / "img" / "loc" / "plate.png"
+        plate.parent.mkdir(parents=True)
+        Image.effect_noise((800, 400), 40).save(plate)
+        manifest = temp_db / "manifest.json"
+        manifest.write_text(json.dumps([{"id": "plate", "local_path": "loc/plate.png"}]))
+        db.import_manifest(manifest)
+        client_factory = partial(MCPVisionClient, api_key="test-key", backoff_base=0.001, max_restarts=1,
+                                 breaker=CircuitBreaker(failure_threshold=100),
+                                 command=[sys.executable, str(FAKE_SERVER), "--die-after", "0"])
+
+        with pytest.raises(MCPServerDied, match="4 restarts in a row"):
+            asyncio.run(Classifier(phase=1, rate_limit=0, client_factory=client_factory).run())
+        assert [r["id"] for r in db.get_pending()] == ["plate"]
+
+    def test_margins_are_trimmed_and_bounds_stored(self, temp_db):
+        pytest.importorskip("numpy")
+        from PIL import Image, ImageDraw
+        image = Image.new("L", (2400, 1000), 245)
+        ImageDraw.Draw(image).rectangle([900, 400, 1500, 600], outline=0, width=8)
+        tiers, status = self.run_classifier(temp_db, {**PHASE_1_ANSWER, "confidence": 0.4}, image=image)
+        assert tiers == [LOW_RES, REPROMPT]  # the trimmed plate is small enough to go out whole
+
+        (record,) = db.select_images(columns=("id", "bounds"))
+        bounds = record["bounds"]
+        assert 850 <= bounds["x"] <= 900 and 350 <= bounds["y"] <= 400
+        assert 1500 <= bounds["x"] + bounds["width"] <= 1550
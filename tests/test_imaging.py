@@ -0,0 +1,108 @@
+"""Tests for memory-capped draft decoding."""
+import pytest
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+Image = pytest.importorskip("PIL.Image")
+
+import imaging
+from imaging import ImageTooLarge, load
+
+
+@pytest.fixture(scope="module")
+def plate_jpeg(tmp_path_factory):
+    path = tmp_path_factory.mktemp("plates") / "plate.jpg"
+    Image.effect_noise((4000, 2000), 40).convert("RGB").save(path, quality=90)
+    return path
+
+
+class TestLoad:
+    def test_jpeg_is_drafted_then_resampled(self, plate_jpeg, monkeypatch):
+        from PIL import JpegImagePlugin
+        drafted = []
+        real_draft = JpegImagePlugin.JpegImageFile.draft
+
+        def spy(img, mode, size):
+            result = real_draft(img, mode, size)
+            drafted.append(img.size)
+            return result
+
+        monkeypatch.setattr(JpegImagePlugin.JpegImageFile, "draft", spy)
+        img = load(plate_jpeg, max_side=800, mode="L")
+        assert img.size == (800, 400) and img.mode == "L"
+        assert img.info["source_size"] == (4000, 2000)
+        assert drafted == [(1000, 500)]  # 1/4 DCT scale, still >= target
+
+    def test_full_resolution_within_budget(self, plate_jpeg):
+        img = load(plate_jpeg)
+        assert img.size == (4000, 2000)
+
+    def test_jpeg_over_budget_is_drafted_to_fit(self, plate_jpeg):
+        budget = 4000 * 2000 * 4 // 3
+        img = load(plate_jpeg, budget=budget)
+        assert img.size == (2000, 1000)
+        assert imaging.decoded_bytes(img.size, img.mode) <= budget
+
+    def test_other_formats_over_budget_are_refused(self, tmp_path):
+        path = tmp_path / "scan.png"
+        Image.new("RGB", (2000, 1000), "white").save(path)
+        with pytest.raises(ImageTooLarge):
+            load(path, max_side=500, budget=1_000_000)
+        assert load(path, max_side=500).size == (500, 250)
+
+    def test_palette_images_keep_transparency_semantics(self, tmp_path):
+        path = tmp_path / "chart.png"
+        Image.new("P", (300, 200)).save(path)
+        img = load(path, mode="L")
+        assert img.mode == "L" and img.size == (300, 200)
+
+    def test_never_upscales(self, tmp_path):
+        path = tmp_path / "small.jpg"
+        Image.new("RGB", (120, 80), "white").save(path)
+        assert load(path, max_side=1600).size == (120, 80)
+
+
+class TestHelpers:
+    def test_probe_reads_header(self, plate_jpeg):
+        assert imaging.probe(plate_jpeg) == ((4000, 2000), "RGB", "JPEG")
+
+    def test_fit_size(self):
+        assert imaging.fit_size((9000, 3000), max_side=1800) == (1800, 600)
+        assert imaging.fit_size((1000, 1000), max_pixels=250_000) == (500, 500)
+        assert imaging.fit_size((100, 50), max_side=1600) == (100, 50)
+
+    def test_jpeg_mode(self):
+        assert imaging.jpeg_mode("1") == "L"
+        assert imaging.jpeg_mode("RGBA") == "RGB"
+        assert imaging.jpeg_mode("P") == "RGB"
+
+    def test_pixel_limit_is_raised_only_while_opening(self, tmp_path, monkeypatch):
+        path = tmp_path / "plate.png"
+        Image.new("L", (200, 100)).save(path)
+        monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 5000)  # Pillow refuses > 10000 pixels
+        with pytest.raises(Image.DecompressionBombError):
+            Image.open(path)
+        assert imaging.probe(path)[0] == (200, 100)
+        assert load(path).size == (200, 100)
+        with imaging.open_image(path) as img:
+            assert img.size == (200, 100)
+        assert Image.MAX_IMAGE_PIXELS == 5000
+
+
+def budget_of(index, budget=None):
+    return index, budget
+
+
+class TestMapInPool:
+    def test_memory_is_split_across_workers(self):
+        results = sorted(imaging.map_in_pool(budget_of, [(i,) for i in range(4)], workers=2, memory_mb=8))
+        assert results == [(i, 4 * 1024 * 1024) for i in range(4)]
+
+    def test_no_budget_without_memory_mb(self):
+        assert list(imaging.map_in_pool(budget_of, [(0,)], workers=4)) == [(0, None)]
+
+    def test_ordered(self):
+        assert list(imaging.map_in_pool(pow, [(2, i) for i in range(6)], workers=3, ordered=True)) == \
+            [1, 2, 4, 8, 16, 32]
@@ -0,0 +1,117 @@
+"""Tests for the crash-safe classification run journal."""
+import pytest
+import asyncio
+import json
+import sqlite3
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+import db
+from journal import RunJournal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    j = RunJournal(tmp_path / "journal" / "classify_phase1.jsonl", fsync=False)
+    yield j
+    j.close()
+
+
+class TestReplay:
+    def test_missing_journal_is_clean(self, journal):
+        assert journal.replay().clean
+
+    def test_classifies_last_event_per_image(self, journal):
+        journal.claimed("a"); journal.sent("a"); journal.completed("a", {"navy": "USN"}); journal.committed("a")
+        journal.claimed("b"); journal.sent("b"); journal.completed("b", {"navy": "IJN"})
+        journal.claimed("c"); journal.sent("c")
+        journal.claimed("d"); journal.aborted("d", reason="shutdown deadline")
+
+        state = journal.replay()
+        assert state.committed == 1
+        assert list(state.uncommitted) == ["b"]
+        assert state.uncommitted["b"]["results"] == {"navy": "IJN"}
+        assert state.in_flight == ["c", "d"]
+
+    def test_torn_final_line_is_skipped(self, journal):
+        journal.claimed("a"); journal.sent("a")
+        journal.close()
+        with open(journal.path, "a") as f:
+            f.write('{"ts": "2024-01-01", "event": "compl')
+
+        state = journal.replay()
+        assert state.in_flight == ["a"]
+        assert not state.uncommitted
+
+    def test_reset_removes_file(self, journal):
+        journal.claimed("a")
+        journal.reset()
+        assert not journal.path.exists()
+        assert journal.replay().clean
+
+
+class TestClassifierRecovery:
+    @pytest.fixture
+    def temp_db(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(db, "DB_PATH", tmp_path / "test_gallery.db")
+        monkeypatch.setattr(db, "DATA_DIR", tmp_path)
+        monkeypatch.delenv("NAVAL_GALLERY_JOURNAL_DIR", raising=False)
+        monkeypatch.setenv("NAVAL_GALLERY_IMAGE_DIR", str(tmp_path))
+        db.init_db()
+        manifest = tmp_path / "manifest.json"
+        manifest.write_text(json.dumps([{"id": "img_1", "local_path": "x/img_1.jpg", "url": "u", "source": "s"}]))
+        db.import_manifest(manifest)
+        return tmp_path
+
+    def test_uncommitted_result_is_reapplied_without_api_call(self, temp_db):
+        """A result journaled before a crash reaches the DB on the next start."""
+        from classify_images import Classifier
+
+        journal = RunJournal.for_phase(1, journal_dir=temp_db / "journal")
+        journal.claimed("img_1"); journal.sent("img_1")
+        journal.completed("img_1", {"ship_type": "battleship", "navy": "Royal Navy"})
+        journal.close()
+
+        class NoCallClient:
+            async def __aenter__(self):
+                raise AssertionError("vision client should not be started")
+
+            async def __aexit__(self, *exc):
+                return False
+
+        asyncio.run(Classifier(phase=1, rate_limit=0, client_factory=NoCallClient).run())
+
+        conn = sqlite3.connect(db.DB_PATH)
+        row = conn.execute("SELECT analysis_status, ship_type FROM images WHERE id='img_1'").fetchone()
+        conn.close()
+        assert row == ("complete", "battleship")
+        assert not journal.path.exists()
+
+    def test_appends_happen_off_the_event_loop(self, temp_db):
+        """Every fsync'd append runs on the AsyncDB writer thread, in order."""
+        import threading
+        from classify_images import Classifier
+
+        class RecordingJournal(RunJournal):
+            events = []
+
+            def _append(self, event, img_id, **extra):
+                self.events.append((event, threading.current_thread().name))
+                super()._append(event, img_id, **extra)
+
+        class IdleClient:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+        journal = RecordingJournal(temp_db / "journal" / "classify_phase1.jsonl")
+        # img_1's file is missing: claimed, then committed as a failure
+        asyncio.run(Classifier(phase=1, rate_limit=0, client_factory=IdleClient, journal=journal).run())
+
+        assert [event for event, _ in journal.events] == ["claimed", "completed", "committed"]
+        assert all(name.startswith("db-writer") for _, name in journal.events)
+        assert not journal.path.exists()
@@ -0,0 +1,105 @@
+"""Tests for Phase 2 layout analysis and region-of-interest composites."""
+import io
+
+import pytest
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+from PIL import ImageDraw
+
+from layout import (
+    Region, analyze_layout, build_composite, dilate, label_components, profile_segments,
+    OVERVIEW_MAX_SIDE, PANEL_GAP,
+)
+
+
+@pytest.fixture
+def plate(tmp_path):
+    """A 3000x1500 plate: hull outline, framed title block and a loose annotation table."""
+    img = Image.new("L", (3000, 1500), 255)
+    draw = ImageDraw.Draw(img)
+    draw.polygon([(200, 600), (2600, 600), (2500, 800), (300, 800)], outline=0, width=6)
+    draw.rectangle([2200, 1100, 2900, 1450], outline=0, width=4)
+    for i in range(6):
+        draw.text((2250, 1120 + i * 50), "HMS DREADNOUGHT 1906 SCALE", fill=0, font_size=30)
+    for i in range(5):
+        draw.text((150, 1050 + i * 40), "Belt 11in  Deck 3in  Speed 21kt", fill=0, font_size=26)
+    path = tmp_path / "plate.png"
+    img.save(path)
+    return path
+
+
+class TestPrimitives:
+    def test_label_components_8_connected(self):
+        mask = np.zeros((6, 6), dtype=bool)
+        mask[0, 0] = mask[1, 1] = True   # diagonal neighbours join
+        mask[4, 4:6] = True
+        mask[5, 0] = True
+        stats = label_components(mask)
+        boxes = sorted(tuple(row) for row in stats.tolist())
+        assert boxes == [(0, 0, 2, 2, 2), (0, 5, 1, 6, 1), (4, 4, 6, 5, 2)]
+
+    def test_dilate_box(self):
+        mask = np.zeros((7, 9), dtype=bool)
+        mask[3, 4] = True
+        grown = dilate(mask, rx=2, ry=1)
+        assert grown.sum() == 15
+        assert grown[2:5, 2:7].all()
+
+    def test_profile_segments_split_on_gaps(self):
+        profile = np.array([0, 3, 2, 0, 0, 0, 5, 0, 1, 0])
+        assert profile_segments(profile, min_gap=2) == [(1, 3), (6, 9)]
+
+
+class TestAnalyzeLayout:
+    def test_finds_title_block_and_annotation_table(self, plate):
+        regions = analyze_layout(plate)
+        kinds = [r.kind for r in regions]
+        assert kinds == ["title_block", "annotation"]
+
+        title, table = regions
+        assert 2150 <= title.x <= 2200 and title.x + title.width >= 2900
+        assert table.x < 200 and 1000 < table.y < 1100
+        # The hull is not text
+        assert all(r.y > 800 for r in regions)
+
+    def test_blank_plate_has_no_regions(self, tmp_path):
+        path = tmp_path / "blank.png"
+        Image.new("L", (800, 600), 255).save(path)
+        assert analyze_layout(path) == []
+
+    def test_region_dict_roundtrip(self):
+        region = Region(10, 20, 300, 40, "title_block", 55)
+        assert Region.from_dict(region.to_dict()) == region
+
+
+class TestComposite:
+    def test_overview_above_full_resolution_crops(self, plate, tmp_path):
+        regions = [Region(2180, 1080, 740, 390, "title_block"), Region(130, 1030, 400, 230)]
+        out = tmp_path / "composite.jpg"
+        build_composite(plate, regions, out)
+
+        with Image.open(out) as composite:
+            overview_h = round(1500 * OVERVIEW_MAX_SIDE / 3000)
+            assert composite.width == OVERVIEW_MAX_SIDE
+            assert composite.height > overview_h + 390 + 230
+
+    def test_composite_is_capped(self, plate, tmp_path):
+        regions = [Region(0, 0, 3000, 700), Region(0, 700, 3000, 800)]
+        data = build_composite(plate, regions, max_pixels=2_000_000, max_bytes=150_000)
+        assert len(data) <= 150_000
+        with Image.open(io.BytesIO(data)) as composite:
+            assert composite.width * composite.height <= 2_000_000
+
+    def test_plate_over_the_decode_budget_is_drafted(self, tmp_path):
+        path = tmp_path / "plate.jpg"
+        Image.new("L", (4000, 2000), 255).save(path)
+        regions = [Region(2000, 1000, 1000, 500)]
+        data = build_composite(path, regions, budget=4000 * 2000 // 3)
+        with Image.open(io.BytesIO(data)) as composite:
+            # Overview (1024 x 512) over the crop, decoded at half scale (500 x 250)
+            assert composite.size == (OVERVIEW_MAX_SIDE, 512 + PANEL_GAP + 250)
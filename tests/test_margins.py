@@ -0,0 +1,107 @@
+"""Tests for scan margin trimming."""
+import pytest
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+from PIL import ImageDraw
+
+from layout import erode
+from margins import detect_bounds, find_content_box, is_line_art, trim_image, valid_bounds
+
+
+def scan(size=(3000, 2000), cast=(235, 225, 200)):
+    """A yellowed scan: hull and caption in the middle, a ruler along the bottom edge."""
+    img = Image.new("RGB", size, cast)
+    draw = ImageDraw.Draw(img)
+    draw.polygon([(800, 800), (2200, 800), (2100, 1000), (900, 1000)], outline=(20, 20, 20), width=6)
+    draw.line([(1200, 800), (1200, 650), (1400, 650), (1400, 800)], fill=(20, 20, 20), width=5)
+    draw.text((1000, 1100), "H.M.S. DREADNOUGHT 1906", fill=(20, 20, 20), font_size=60)
+    draw.rectangle([100, size[1] - 60, size[0] - 100, size[1] - 30], fill=(30, 30, 30))
+    return img
+
+
+class TestPrimitives:
+    def test_erode_is_dual_of_dilate(self):
+        mask = np.zeros((7, 9), dtype=bool)
+        mask[1:6, 2:8] = True
+        shrunk = erode(mask, rx=1, ry=1)
+        assert shrunk.sum() == 3 * 4
+        assert shrunk[2:5, 3:7].all()
+
+    def test_erode_keeps_shapes_touching_the_border(self):
+        mask = np.zeros((5, 5), dtype=bool)
+        mask[:, :3] = True
+        assert erode(mask, rx=1, ry=1)[:, :2].all()
+
+    def test_valid_bounds(self):
+        assert valid_bounds({"x": 0, "y": 5, "width": 10, "height": 20})
+        assert not valid_bounds({"x": 0, "y": 0, "w": 100, "h": 50})
+        assert not valid_bounds(None)
+
+
+class TestContentBox:
+    def test_ignores_margins_and_ruler(self):
+        gray = np.asarray(scan().convert("L").resize((1500, 1000)))
+        x0, y0, x1, y1 = find_content_box(gray)
+        assert 390 <= x0 <= 450 and 310 <= y0 <= 330
+        assert 1095 <= x1 <= 1110 and 570 <= y1 <= 600
+
+    def test_blank_plate(self):
+        assert find_content_box(np.full((200, 300), 240, dtype=np.uint8)) is None
+
+    def test_detect_bounds_in_full_resolution(self, tmp_path):
+        path = tmp_path / "scan.jpg"
+        scan().save(path, quality=90)
+        bounds = detect_bounds(path)
+        # Hull and caption (800..2200 x 650..1160) plus padding, no ruler
+        assert 700 <= bounds["x"] <= 800 and 580 <= bounds["y"] <= 650
+        assert 2200 <= bounds["x"] + bounds["width"] <= 2300
+        assert 1160 <= bounds["y"] + bounds["height"] <= 1260
+
+    def test_detect_bounds_blank(self, tmp_path):
+        path = tmp_path / "blank.png"
+        Image.new("L", (400, 300), 250).save(path)
+        assert detect_bounds(path) == {"x": 0, "y": 0, "width": 400, "height": 300}
+
+
+class TestLineArt:
+    def test_ink_on_tinted_paper(self):
+        assert is_line_art(scan())
+
+    def test_coloured_ink_is_not_line_art(self):
+        img = Image.new("RGB", (600, 400), "white")
+        ImageDraw.Draw(img).rectangle([100, 100, 500, 300], outline=(200, 20, 20), width=8)
+        assert not is_line_art(img)
+
+    def test_painting_is_not_line_art(self):
+        assert not is_line_art(Image.linear_gradient("L").resize((400, 300)).convert("RGB"))
+
+
+class TestTrimImage:
+    def test_crops_to_bounds(self, tmp_path):
+        src = tmp_path / "scan.jpg"
+        scan().save(src, quality=95)
+        bounds = {"x": 700, "y": 600, "width": 1600, "height": 600}
+        out = trim_image(src, bounds, tmp_path / "trimmed.jpg")
+        with Image.open(out) as img:
+            assert img.size == (1600, 600)
+            assert img.mode == "RGB"
+
+    def test_greyscale_line_art(self, tmp_path):
+        src = tmp_path / "scan.jpg"
+        scan().save(src, quality=95)
+        out = trim_image(src, {"x": 0, "y": 0, "width": 3000, "height": 2000}, tmp_path / "trimmed.jpg",
+                         grayscale=True)
+        with Image.open(out) as img:
+            assert img.size == (3000, 2000)
+            assert img.mode == "L"
+
+    def test_tight_plate_is_sent_as_is(self, tmp_path):
+        src = tmp_path / "plate.jpg"
+        scan().save(src)
+        assert trim_image(src, {"x": 10, "y": 10, "width": 2980, "height": 1980}, tmp_path / "t.jpg") is None
+        assert not (tmp_path / "t.jpg").exists()
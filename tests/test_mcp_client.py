@@ -0,0 +1,148 @@
+"""Tests for MCPVisionClient against the offline fake MCP server."""
+import pytest
+import asyncio
+import json
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+from vision import MCPVisionClient, MCPServerDied, CircuitBreaker, CircuitOpenError
+from vision.supervisor import StderrDrain
+from vision.protocol import MCPProtocol, CODECS, get_codec
+
+FAKE_SERVER = Path(__file__).parent.parent / "tools" / "vision" / "fake_server.py"
+
+
+def fake_client(*server_args, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    return MCPVisionClient(
+        api_key="test-key",
+        command=[sys.executable, str(FAKE_SERVER), *server_args],
+        **kwargs,
+    )
+
+
+class TestFakeServerRoundTrip:
+    def test_analyze_image_returns_canned_json(self, tmp_path):
+        """tools/call should return the canned classification as text content."""
+        image = tmp_path / "plate.jpg"
+        image.write_bytes(b"\xff\xd8\xff")
+
+        async def scenario():
+            async with fake_client() as client:
+                return await client.analyze_image(str(image), "classify")
+
+        result = asyncio.run(scenario())
+        assert result.success
+        assert json.loads(result.content)["ship_type"] == "battleship"
+
+    def test_jsonrpc_error_is_reported(self, tmp_path):
+        """JSON-RPC errors should surface as unsuccessful VisionResults."""
+        async def scenario():
+            async with fake_client("--error-rate", "1.0") as client:
+                return await client.analyze_image(str(tmp_path / "x.jpg"), "classify")
+
+        result = asyncio.run(scenario())
+        assert not result.success
+        assert "Simulated upstream failure" in result.error
+
+
+class TestSupervision:
+    def test_restarts_after_server_crash(self, tmp_path):
+        """A server that dies mid-run should be respawned transparently."""
+        async def scenario():
+            async with fake_client("--die-after", "2") as client:
+                results = [await client.analyze_image(str(tmp_path / "x.jpg"), "p") for _ in range(4)]
+                return results, client.breaker.state
+
+        results, state = asyncio.run(scenario())
+        assert all(r.success for r in results)
+        assert state == CircuitBreaker.CLOSED
+
+    def test_restart_reinitializes_a_new_server(self, tmp_path, monkeypatch, caplog):
+        """The respawned server gets a fresh handshake; the dead one's stderr is read off the loop."""
+        joined_on = []
+        join = StderrDrain.join
+        monkeypatch.setattr(StderrDrain, "join", lambda self, timeout=None: (
+            joined_on.append(threading.current_thread()), join(self, timeout)))
+
+        async def scenario():
+            async with fake_client("--die-after", "1") as client:
+                handshakes = []
+                initialize = client._initialize
+                async def counted():
+                    handshakes.append(client.process.pid)
+                    await initialize()
+                client._initialize = counted
+
+                first_pid = client.process.pid
+                await client.analyze_image(str(tmp_path / "x.jpg"), "p")
+                result = await client.analyze_image(str(tmp_path / "x.jpg"), "p")
+                return first_pid, handshakes, result, client
+
+        with caplog.at_level("ERROR", logger="vision.client"):
+            first_pid, handshakes, result, client = asyncio.run(scenario())
+        assert result.success
+        assert len(handshakes) == 1 and handshakes[0] != first_pid
+        assert client.restarts == 0
+        assert "exiting after 1 calls" in caplog.text
+        assert joined_on and threading.main_thread() not in joined_on
+
+    def test_failed_restart_counts_as_a_dead_server(self, tmp_path):
+        """A respawn that cannot start is reported as MCPServerDied, not a bad request."""
+        async def scenario():
+            async with fake_client("--die-after", "0", max_restarts=2) as client:
+                client.command = [str(tmp_path / "no-such-server")]
+                await client.analyze_image(str(tmp_path / "x.jpg"), "p")
+
+        with pytest.raises(MCPServerDied, match="restart failed"):
+            asyncio.run(scenario())
+
+    def test_breaker_opens_when_restarts_keep_failing(self, tmp_path):
+        """A server that crashes on every call should trip the circuit breaker."""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+        async def scenario():
+            async with fake_client("--die-after", "0", max_restarts=5, breaker=breaker) as client:
+                await client.analyze_image(str(tmp_path / "x.jpg"), "p")
+
+        with pytest.raises(CircuitOpenError):
+            asyncio.run(scenario())
+        assert breaker.is_open
+
+
+def available_codecs():
+    names = []
+    for name, codec_cls in CODECS.items():
+        try:
+            codec_cls()
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+
+class TestProtocolCodecs:
+    @pytest.mark.parametrize("name", available_codecs())
+    def test_request_roundtrip(self, name):
+        """Every codec should produce one newline-terminated line that parses back."""
+        protocol = MCPProtocol(codec=get_codec(name))
+        request = protocol.create_request("tools/call", {"prompt": "Ünïcode ✓", "n": 1})
+        line = protocol.encode_request(request)
+
+        assert line.endswith(b"\n") and line.count(b"\n") == 1
+        decoded = protocol.decode(line)
+        assert decoded["id"] == request.id
+        assert decoded["params"]["prompt"] == "Ünïcode ✓"
+
+    @pytest.mark.parametrize("name", available_codecs())
+    def test_malformed_line_raises_value_error(self, name):
+        protocol = MCPProtocol(codec=get_codec(name))
+        with pytest.raises(ValueError):
+            protocol.decode(b"{not json")
+
+    def test_unknown_codec_rejected(self):
+        with pytest.raises(ValueError):
+            get_codec("yaml")
@@ -0,0 +1,103 @@
+"""Tests for pipeline metrics and their Prometheus/JSON export."""
+import pytest
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "_enabled", True)
+    monkeypatch.setattr(metrics, "REGISTRY", metrics.Registry())
+    return metrics
+
+
+class TestDisabled:
+    def test_recording_is_a_no_op(self, monkeypatch):
+        monkeypatch.setattr(metrics, "_enabled", False)
+        monkeypatch.setattr(metrics, "REGISTRY", metrics.Registry())
+        metrics.inc("classify_images_total")
+        metrics.observe("vision_upload_bytes", 1000)
+        with metrics.timed("db_write_seconds"):
+            pass
+        metrics.error("vision", ValueError())
+        assert metrics.REGISTRY.counters == {} and metrics.REGISTRY.histograms == {}
+        assert metrics.timed("x") is metrics._NULL_TIMER
+        assert metrics.export("run") is None
+
+
+class TestRecording:
+    def test_counters_by_label(self, registry):
+        registry.inc("classify_images_total", phase=1, status="complete")
+        registry.inc("classify_images_total", 2, phase=1, status="complete")
+        registry.inc("classify_images_total", phase=1, status="failed")
+        assert registry.REGISTRY.counter_total("classify_images_total") == 4
+        assert registry.REGISTRY.counter_total("classify_images_total", status="failed") == 1
+
+    def test_errors_by_type(self, registry):
+        registry.error("vision", TimeoutError())
+        registry.error("download", "http_404")
+        assert registry.REGISTRY.counter_total("errors_total", type="TimeoutError") == 1
+        assert registry.REGISTRY.counter_total("errors_total", stage="download") == 1
+
+    def test_download_counts_bytes_or_status(self, registry):
+        registry.download(SimpleNamespace(status_code=200, content=b"x" * 500), source="wiki")
+        registry.download(SimpleNamespace(status_code=503, content=b""), source="wiki")
+        assert registry.REGISTRY.counter_total("download_bytes_total", source="wiki") == 500
+        assert registry.REGISTRY.counter_total("errors_total", type="http_503") == 1
+
+    def test_instrumented_get_writes_only_successful_bodies(self, registry, tmp_path, monkeypatch):
+        import requests
+        responses = {"ok": SimpleNamespace(status_code=200, content=b"jpeg"),
+                     "gone": SimpleNamespace(status_code=404, content=b"<html>")}
+        monkeypatch.setattr(requests, "get", lambda url, **kwargs: responses[url])
+        assert registry.instrumented_get("ok", "ia", image_id="a", path=tmp_path / "a.jpg", timeout=5).status_code == 200
+        registry.instrumented_get("gone", "ia", image_id="b", path=tmp_path / "b.jpg")
+        assert (tmp_path / "a.jpg").read_bytes() == b"jpeg" and not (tmp_path / "b.jpg").exists()
+        assert registry.REGISTRY.histogram_total("download_seconds")[1] == 2
+        assert registry.REGISTRY.counter_total("download_bytes_total", source="ia") == 4
+        assert registry.REGISTRY.counter_total("errors_total", type="http_404") == 1
+
+    def test_timer_observes_on_exception(self, registry):
+        with pytest.raises(RuntimeError):
+            with registry.timed("vision_request_seconds", method="tools/call"):
+                raise RuntimeError
+        assert registry.REGISTRY.histogram_total("vision_request_seconds")[1] == 1
+
+    def test_quantiles_interpolate_within_buckets(self):
+        hist = metrics.Histogram((1, 2, 4))
+        for value in (0.5, 1.5, 1.5, 3.0):
+            hist.observe(value)
+        assert hist.quantile(0.5) == pytest.approx(1.5)
+        assert hist.quantile(1.0) == pytest.approx(3.0)
+        assert metrics.Histogram((1,)).quantile(0.5) is None
+
+
+class TestExport:
+    def test_prometheus_format(self, registry):
+        registry.inc("errors_total", stage="vision", type='say "hi"')
+        registry.observe("vision_upload_bytes", 100e3)
+        registry.observe("vision_upload_bytes", 3e6)
+        text = registry.to_prometheus()
+        assert '# TYPE naval_gallery_errors_total counter' in text
+        assert 'naval_gallery_errors_total{stage="vision",type="say \\"hi\\""} 1' in text
+        assert 'naval_gallery_vision_upload_bytes_bucket{le="256000"} 1' in text
+        assert 'naval_gallery_vision_upload_bytes_bucket{le="4e+06"} 2' in text
+        assert 'naval_gallery_vision_upload_bytes_bucket{le="+Inf"} 2' in text
+        assert 'naval_gallery_vision_upload_bytes_count 2' in text
+
+    def test_export_writes_textfile_and_summary(self, registry, tmp_path):
+        registry.inc("download_bytes_total", 4e6, source="ia")
+        registry.observe("download_seconds", 2.0, source="ia")
+        prom, summary = registry.export("harvest_ia", tmp_path)
+        assert prom == tmp_path / "harvest_ia.prom"
+        assert "naval_gallery_download_bytes_total" in prom.read_text()
+        data = json.loads(summary.read_text())
+        assert data["rates"]["download_mb_per_s"] == 2.0
+        assert data["histograms"]["download_seconds"]["source=ia"]["count"] == 1
+        assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,181 @@
+"""Tests for the storage optimizer."""
+import pytest
+import json
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+import db
+import optimize_storage
+from optimize_storage import BILEVEL, GRAYSCALE, COLOUR, optimize_file
+
+
+def line_drawing(size=(1200, 800)):
+    "Black hull lines on white, as an RGB image."
+    img = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(img)
+    for i in range(0, size[1], 40):
+        draw.line((50, i, size[0] - 50, (i * 3) % size[1]), fill="black", width=3)
+    draw.rectangle((100, 100, 600, 400), outline="black", width=5)
+    return img
+
+
+def wash(size=(1200, 800)):
+    "A smooth grey gradient with noise: grayscale but not bilevel."
+    gradient = np.tile(np.linspace(40, 220, size[0], dtype=np.float32), (size[1], 1))
+    noise = np.random.default_rng(0).normal(0, 6, gradient.shape)
+    return Image.fromarray(np.clip(gradient + noise, 0, 255).astype(np.uint8)).convert("RGB")
+
+
+def painting(size=(1200, 800)):
+    rng = np.random.default_rng(1)
+    small = rng.integers(0, 255, (size[1] // 40, size[0] // 40, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize(size, Image.Resampling.BICUBIC)
+
+
+class TestClassify:
+    def test_kinds(self):
+        assert optimize_storage.classify(line_drawing()) == BILEVEL
+        assert optimize_storage.classify(wash()) == GRAYSCALE
+        assert optimize_storage.classify(painting()) == COLOUR
+
+    def test_block_ssim(self):
+        a = np.asarray(wash().convert("L"))
+        assert optimize_storage.block_ssim(a, a) == pytest.approx(1.0)
+        noisy = np.clip(a + np.random.default_rng(2).normal(0, 25, a.shape), 0, 255).astype(np.uint8)
+        assert optimize_storage.block_ssim(a, noisy) < 0.9
+
+
+class TestOptimizeFile:
+    def test_line_drawing_keeps_every_pixel(self, tmp_path):
+        path = tmp_path / "plate.jpg"
+        line_drawing().save(path, quality=95)
+        result = optimize_file(path)
+        assert result.ok and result.kind == BILEVEL and not result.lossy
+        assert result.encoding in ("png-8bit", "webp-lossless")
+        assert result.after < result.before * 0.5
+        new = Path(result.new_path)
+        assert new.suffix in (".png", ".webp") and new.stat().st_size == result.after
+        with Image.open(path) as original, Image.open(new) as img:
+            assert np.array_equal(np.asarray(img.convert("L")), np.asarray(original.convert("L")))
+        # The caller removes the original once the database points at the new file
+        assert path.exists()
+
+    def test_pure_black_and_white_may_be_1bit(self, tmp_path):
+        path = tmp_path / "plate.png"
+        line_drawing().convert("L").point(lambda v: 255 if v > 127 else 0).convert("RGB").save(path)
+        result = optimize_file(path)
+        assert result.ok and not result.lossy
+        assert result.encoding in ("png-1bit", "webp-lossless")
+
+    def test_thresholding_only_when_lossy_and_faithful(self, tmp_path):
+        path = tmp_path / "plate.jpg"
+        line_drawing().save(path, quality=95)
+        lossless = optimize_file(path, dry_run=True)
+        result = optimize_file(path, dry_run=True, lossy=True)
+        assert result.lossy and result.ssim >= optimize_storage.DEFAULT_TARGET_SSIM
+        assert result.after < lossless.after
+        strict = optimize_file(path, dry_run=True, lossy=True, target_ssim=1.01)
+        assert not strict.lossy and strict.after == lossless.after
+
+    def test_colour_is_left_alone_unless_lossy(self, tmp_path):
+        path = tmp_path / "painting.jpg"
+        painting().save(path, quality=100)
+        result = optimize_file(path)
+        assert result.ok and result.kind == COLOUR and result.new_path is None and result.saved == 0
+
+    def test_colour_meets_ssim_target(self, tmp_path):
+        path = tmp_path / "painting.jpg"
+        painting().save(path, quality=100)
+        result = optimize_file(path, target_ssim=0.98, lossy=True)
+        assert result.ok and result.kind == COLOUR and result.lossy and result.ssim >= 0.98
+        assert result.new_path == str(path) and result.after == path.stat().st_size < result.before
+
+    def test_no_replacement_without_real_saving(self, tmp_path):
+        source = tmp_path / "plate.jpg"
+        line_drawing().save(source, quality=95)
+        path = Path(optimize_file(source).new_path)
+        before = path.read_bytes()
+        result = optimize_file(path)
+        assert result.ok and result.new_path is None and result.saved == 0
+        assert path.read_bytes() == before
+
+    def test_leftover_reencode_is_overwritten(self, tmp_path):
+        source = tmp_path / "plate.jpg"
+        line_drawing().save(source, quality=95)
+        # Written atomically, but the database was never switched over
+        leftover = Path(optimize_file(source).new_path)
+        result = optimize_file(source)
+        assert result.ok and result.new_path == str(leftover)
+        # A sibling a record points at, or another image, is never overwritten
+        assert "already exists" in optimize_file(source, in_use=(str(leftover),)).error
+        Image.new("L", (10, 10)).save(leftover)
+        assert "already exists" in optimize_file(source).error
+
+    def test_dry_run_writes_nothing(self, tmp_path):
+        path = tmp_path / "plate.jpg"
+        line_drawing().save(path, quality=95)
+        result = optimize_file(path, dry_run=True)
+        assert result.new_path and not Path(result.new_path).exists()
+
+
+class TestRun:
+    def test_switches_local_path_and_reports_per_source(self, tmp_path, monkeypatch):
+        data_dir = tmp_path / "data"
+        data_dir.mkdir()
+        monkeypatch.setattr(db, "DB_PATH", tmp_path / "test_gallery.db")
+        monkeypatch.setattr(db, "DATA_DIR", data_dir)
+        monkeypatch.setenv("NAVAL_GALLERY_IMAGE_DIR", str(tmp_path))
+        db.init_db()
+        image_dir = tmp_path / "img"
+        (image_dir / "ia").mkdir(parents=True)
+        (image_dir / "loc").mkdir()
+        line_drawing().save(image_dir / "ia" / "a.jpg", quality=95)
+        painting().save(image_dir / "loc" / "b.jpg", quality=100)
+        manifest = data_dir / "manifest.json"
+        manifest.write_text(json.dumps([
+            {"id": "a", "local_path": "ia/a.jpg", "source": "ia"},
+            {"id": "b", "local_path": "loc/b.jpg", "source": "loc"},
+        ]))
+        db.import_manifest(manifest)
+
+        report = optimize_storage.run(workers=1)
+        assert report["ia"]["replaced"] == 1 and report["ia"]["after"] < report["ia"]["before"]
+        assert report["loc"]["files"] == 1
+
+        paths = {r["id"]: r["local_path"] for r in db.select_images(columns=("id", "local_path"))}
+        assert paths["a"] != "ia/a.jpg" and (image_dir / paths["a"]).exists()
+        assert not (image_dir / "ia" / "a.jpg").exists()
+        # The colour master is only re-encoded with lossy=True
+        assert paths["b"] == "loc/b.jpg" and report["loc"]["replaced"] == 0
+        assert optimize_storage.run(workers=1, source="loc", lossy=True)["loc"]["replaced"] == 1
+        assert "total" in optimize_storage.format_report(report)
+
+    def test_interrupted_run_is_picked_up_again(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(db, "DB_PATH", tmp_path / "test_gallery.db")
+        monkeypatch.setattr(db, "DATA_DIR", tmp_path)
+        monkeypatch.setenv("NAVAL_GALLERY_IMAGE_DIR", str(tmp_path))
+        db.init_db()
+        (tmp_path / "img" / "ia").mkdir(parents=True)
+        line_drawing().save(tmp_path / "img" / "ia" / "a.jpg", quality=95)
+        manifest = tmp_path / "manifest.json"
+        manifest.write_text(json.dumps([{"id": "a", "local_path": "ia/a.jpg", "source": "ia"}]))
+        db.import_manifest(manifest)
+
+        def interrupted(old_path, new_path):
+            raise KeyboardInterrupt
+        with monkeypatch.context() as m:
+            m.setattr(db, "replace_local_path", interrupted)
+            with pytest.raises(KeyboardInterrupt):
+                optimize_storage.run(workers=1)
+        assert len(list((tmp_path / "img" / "ia").iterdir())) == 2
+
+        report = optimize_storage.run(workers=1)
+        assert report["ia"]["replaced"] == 1 and report["ia"]["failed"] == 0
+        (record,) = db.select_images(columns=("local_path",))
+        assert [p.name for p in (tmp_path / "img" / "ia").iterdir()] == [Path(record["local_path"]).name]
@@ -217,3 +217,58 @@ class TestPipelineDataFlow:
         for entry in data:
             assert entry['local_path'].endswith('.svg') or entry['local_path'].endswith('.png')
             assert 'Test Plan' in entry['title']
+
+
+class TestCombinedMode:
+    """Single-pass Phase 1 + 2 for likely ships, two-phase flow for the rest."""
+
+    def test_likely_ships_skip_phase2_queue(self, temp_db, tmp_path, monkeypatch):
+        import asyncio
+        from functools import partial
+        from vision import MCPVisionClient
+        from classify_images import Classifier
+
+        fake_server = Path(__file__).parent.parent / "tools" / "vision" / "fake_server.py"
+        image_root = tmp_path / "storage"
+        monkeypatch.setenv("NAVAL_GALLERY_IMAGE_DIR", str(image_root))
+        monkeypatch.delenv("NAVAL_GALLERY_JOURNAL_DIR", raising=False)
+
+        manifest_data = [
+            {"id": "dp_1", "local_path": "dreadnought/dp_1.jpg", "source": "Dreadnought Project"},
+            {"id": "oni_1", "local_path": "oni/oni_1.jpg", "source": "FM30-301956"},
+        ]
+        for entry in manifest_data:
+            path = image_root / "img" / entry["local_path"]
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"\xff\xd8\xff")
+        manifest = tmp_path / "data" / "manifest.json"
+        manifest.write_text(json.dumps(manifest_data))
+        db.import_manifest(manifest)
+
+        client_factory = partial(MCPVisionClient, api_key="test-key",
+                                 command=[sys.executable, str(fake_server)])
+        classifier = Classifier(phase=1, rate_limit=0, client_factory=client_factory, combined=True)
+        asyncio.run(classifier.run())
+
+        conn = sqlite3.connect(db.DB_PATH)
+        phases = dict(conn.execute("SELECT id, analysis_phase FROM images").fetchall())
+        conn.close()
+        assert phases == {"dp_1": 2, "oni_1": 1}
+        assert [row["id"] for row in db.get_phase2_pending()] == ["oni_1"]
+
+    def test_is_ship_type_matches_phase2_filter(self):
+        assert db.is_ship_type("battleship")
+        for value in (None, "", "unknown", "Unknown", "N/A - map", "Not a ship", "Indeterminate"):
+            assert not db.is_ship_type(value)
+
+
+class TestBenchmarkCorpus:
+    def test_synthetic_images_decode(self, tmp_path):
+        Image = pytest.importorskip("PIL.Image")
+        import benchmark_pipeline
+
+        manifest = benchmark_pipeline.build_corpus(tmp_path, 6, image_kb=8, seed=1)
+        for entry in manifest:
+            with Image.open(tmp_path / "img" / entry["local_path"]) as img:
+                img.load()
+                assert img.format == "JPEG"
@@ -0,0 +1,116 @@
+"""Tests for header-only image probing."""
+import json
+import os
+
+import pytest
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+Image = pytest.importorskip("PIL.Image")
+
+import db
+import probe_images
+import resize_images
+from probe_images import probe_file
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test_gallery.db")
+    monkeypatch.setattr(db, "DATA_DIR", tmp_path)
+    monkeypatch.setenv("NAVAL_GALLERY_IMAGE_DIR", str(tmp_path))
+    db.init_db()
+    image_dir = tmp_path / "img"
+    (image_dir / "loc").mkdir(parents=True)
+    Image.new("RGB", (1200, 800), "white").save(image_dir / "loc" / "a.jpg", dpi=(300, 300))
+    Image.new("L", (640, 480), 128).save(image_dir / "loc" / "b.png")
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps([
+        {"id": "a", "local_path": "loc/a.jpg", "source": "loc"},
+        {"id": "b", "local_path": "loc/b.png", "source": "loc"},
+        {"id": "gone", "local_path": "loc/gone.jpg", "source": "loc"},
+    ]))
+    db.import_manifest(manifest)
+    return image_dir
+
+
+def probed(image_id):
+    (record,) = db.select_images("id = ?", (image_id,), columns=db.PROBE_COLUMNS)
+    return record.to_dict()
+
+
+class TestProbeFile:
+    def test_reads_header_facts(self, tmp_path):
+        path = tmp_path / "plate.jpg"
+        Image.new("RGB", (900, 300), "white").save(path, dpi=(150, 150))
+        info = probe_file(path)
+        assert info["width"] == 900 and info["height"] == 300
+        assert info["format"] == "JPEG" and info["mode"] == "RGB"
+        assert info["dpi"] == 150.0
+        assert info["byte_size"] == path.stat().st_size
+        assert info["mtime"] == path.stat().st_mtime
+
+    def test_does_not_decode_pixels(self, tmp_path, monkeypatch):
+        path = tmp_path / "plate.png"
+        Image.new("L", (50, 40)).save(path)
+        monkeypatch.setattr(Image.Image, "load", lambda self: pytest.fail("pixels decoded"))
+        assert probe_file(path)["dpi"] is None
+
+
+class TestRun:
+    def test_probes_new_images(self, temp_db):
+        assert probe_images.run(workers=2) == {"probed": 2, "unchanged": 0, "missing": 1, "failed": 0}
+        a = probed("a")
+        assert (a["width"], a["height"], a["format"], a["mode"], a["dpi"]) == (1200, 800, "JPEG", "RGB", 300.0)
+        assert probed("b")["mode"] == "L"
+        # Already probed: nothing to do
+        assert probe_images.run()["probed"] == 0
+
+    def test_recheck_reopens_only_changed_files(self, temp_db):
+        probe_images.run()
+        path = temp_db / "loc" / "b.png"
+        Image.new("RGB", (320, 200), "red").save(path)
+        os.utime(path, (1, 1))
+        counts = probe_images.run(recheck=True)
+        assert counts["probed"] == 1 and counts["unchanged"] == 1
+        assert probed("b")["width"] == 320 and probed("b")["mtime"] == 1
+
+    def test_unreadable_files_are_reported_once(self, temp_db):
+        path = temp_db / "loc" / "b.png"
+        path.write_bytes(b"not an image")
+        assert probe_images.run()["failed"] == 1
+        assert probed("b")["format"] == probe_images.UNREADABLE
+        assert probe_images.run()["failed"] == 0
+        assert probe_images.run(recheck=True)["unchanged"] == 2
+        # Fixed on disk: --all picks it up
+        Image.new("L", (64, 48)).save(path, "PNG")
+        os.utime(path, (2, 2))
+        assert probe_images.run(recheck=True)["probed"] == 1
+        assert probed("b")["format"] == "PNG"
+
+    def test_views_keep_their_own_size(self, temp_db):
+        db.save_views([("a", [{"x": 0, "y": 0, "width": 600, "height": 400}])])
+        probe_images.run()
+        view = probed("a_v1")
+        assert (view["width"], view["height"]) == (600, 400)
+        assert probed("a")["width"] == 1200
+
+    def test_manifest_entries_may_carry_header_facts(self, temp_db, tmp_path):
+        manifest = tmp_path / "probed.json"
+        manifest.write_text(json.dumps([{"id": "c", "local_path": "loc/c.jpg", "width": 4000, "height": 3000,
+                                         "format": "JPEG", "byte_size": 5_000_000}]))
+        db.import_manifest(manifest)
+        assert probed("c")["width"] == 4000
+        assert probe_images.run()["missing"] == 1  # "gone"; "c" was probed by its harvester
+
+
+class TestPreflight:
+    def test_selects_pending_images_over_the_target(self, temp_db, monkeypatch):
+        monkeypatch.setattr(resize_images, "DB_PATH", db.DB_PATH)
+        probe_images.run()
+        size_a = probed("a")["byte_size"]
+        assert [r["id"] for r in resize_images.get_oversized_pending(size_a - 1)] == ["a"]
+        db.save_analysis("a", {"navy": "USN"})
+        assert resize_images.get_oversized_pending(size_a - 1) == []
@@ -0,0 +1,80 @@
+"""Tests for the shared --profile harness."""
+import pytest
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+import profiling
+from profiling import Profiler
+
+
+def busy_work():
+    return sum(i * i for i in range(20000))
+
+
+class TestArguments:
+    def test_not_profiling_is_a_no_op_context(self):
+        args = profiling.argparse.Namespace(profile=None)
+        with profiling.from_args(args, "tool") as profiler:
+            assert profiler is None
+        assert profiling.forward(args) == []
+
+    def test_forward_repeats_flags_for_children(self):
+        parser = profiling.argparse.ArgumentParser()
+        profiling.add_arguments(parser)
+        args = parser.parse_args(["--profile", "mem", "--profile-interval", "5"])
+        assert profiling.forward(args) == ["--profile", "mem", "--profile-top", "30", "--profile-interval", "5.0"]
+
+    def test_run_cli_runs_under_profiler(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("NAVAL_GALLERY_PROFILE_DIR", str(tmp_path))
+        assert profiling.run_cli(busy_work, "harvester", argv=["--profile", "cpu"]) == busy_work()
+        assert len(list(tmp_path.glob("harvester_cpu_*.prof"))) == 1
+
+    def test_unknown_mode_rejected(self):
+        with pytest.raises(ValueError):
+            Profiler("gpu", "tool")
+
+
+class TestModes:
+    def test_cpu_writes_stats_and_summary(self, tmp_path):
+        with Profiler("cpu", "classify", top=5, directory=tmp_path) as profiler:
+            busy_work()
+        prof, summary = profiler.outputs
+        assert prof.suffix == ".prof" and prof.name.startswith("classify_cpu_")
+        text = summary.read_text()
+        assert "busy_work" in text
+        assert "by cumulative time" in text and "by own time" in text
+
+    def test_mem_diffs_snapshots(self, tmp_path):
+        kept = []
+        with Profiler("mem", "organize", top=5, interval=0.05, directory=tmp_path) as profiler:
+            for _ in range(4):
+                kept.append(bytearray(2_000_000))
+                time.sleep(0.06)
+        text = profiler.outputs[0].read_text()
+        assert "growth since previous snapshot" in text
+        assert "growth since start" in text
+        assert "test_profiling.py" in text
+
+    def test_async_records_loop_lag(self, tmp_path):
+        async def blocker():
+            await asyncio.sleep(0.05)
+            time.sleep(0.3)  # blocks the loop
+            await asyncio.sleep(0.05)
+
+        with Profiler("async", "pinterest", interval=0.01, directory=tmp_path) as profiler:
+            asyncio.run(blocker())
+        report = json.loads(profiler.outputs[0].read_text())
+        assert report["samples"] > 0
+        assert report["max_s"] >= 0.2
+        assert report["stalls"]
+        assert "new_event_loop" not in vars(asyncio.get_event_loop_policy())
+
+    def test_async_without_loop_notes_it(self, tmp_path):
+        with Profiler("async", "resize", directory=tmp_path) as profiler:
+            busy_work()
+        assert json.loads(profiler.outputs[0].read_text())["samples"] == 0
@@ -0,0 +1,130 @@
+"""Tests for the in-memory parallel resize engine."""
+import pytest
+import io
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+Image = pytest.importorskip("PIL.Image")
+
+import db
+import resize_images
+from resize_images import fit_jpeg, resize_file, resize_files
+
+
+@pytest.fixture(scope="module")
+def noisy():
+    return Image.effect_noise((1600, 1000), 60).convert("RGB")
+
+
+class TestFitJpeg:
+    def test_quality_search_keeps_full_size(self, noisy):
+        full = len(resize_images.encode_jpeg(noisy, 95))
+        data, quality, scale, encodes = fit_jpeg(noisy, int(full * 0.6))
+        assert len(data) <= full * 0.6
+        assert scale == 1.0 and quality < 95
+        assert encodes <= 4
+        # The next quality step up would not have fitted
+        assert len(resize_images.encode_jpeg(noisy, quality + resize_images.QUALITY_STEP)) > full * 0.6
+
+    def test_scale_search_when_quality_is_not_enough(self, noisy):
+        data, quality, scale, encodes = fit_jpeg(noisy, 60_000)
+        assert len(data) <= 60_000
+        assert quality == resize_images.SCALE_QUALITY and scale < 1.0
+        assert encodes <= 10
+        with Image.open(io.BytesIO(data)) as out:
+            assert out.width == round(1600 * scale)
+
+
+class TestResizeFile:
+    def test_rewrites_in_place_atomically(self, noisy, tmp_path):
+        path = tmp_path / "plate.png"
+        noisy.save(path)
+        result = resize_file(path, 200_000)
+        assert result.ok and result.error is None
+        assert result.before > 200_000 >= result.after == path.stat().st_size
+        assert [p.name for p in tmp_path.iterdir()] == ["plate.png"]
+        with Image.open(path) as img:
+            assert img.format == "JPEG"
+
+    def test_scaled_file_reports_its_new_size(self, noisy, tmp_path):
+        path = tmp_path / "plate.png"
+        noisy.save(path)
+        result = resize_file(path, 60_000)
+        assert result.scale < 1.0 and result.source_size == (1600, 1000)
+        with Image.open(path) as img:
+            assert result.size == img.size
+
+    def test_small_file_untouched(self, tmp_path):
+        path = tmp_path / "small.jpg"
+        Image.new("RGB", (100, 100), "white").save(path)
+        before = path.read_bytes()
+        result = resize_file(path, 1_000_000)
+        assert result.ok and result.encodes == 0
+        assert path.read_bytes() == before
+
+    def test_unreadable_file_reports_error(self, tmp_path):
+        path = tmp_path / "broken.jpg"
+        path.write_bytes(b"not an image" * 1000)
+        result = resize_file(path, 100)
+        assert not result.ok and "UnidentifiedImageError" in result.error
+        assert path.read_bytes() == b"not an image" * 1000
+
+    def test_parallel_workers(self, noisy, tmp_path):
+        paths = []
+        for i in range(3):
+            path = tmp_path / f"plate_{i}.png"
+            noisy.save(path)
+            paths.append(str(path))
+        results = list(resize_files(paths, 150_000, workers=2))
+        assert sorted(r.path for r in results) == paths
+        assert all(r.ok and r.after <= 150_000 for r in results)
+
+    def test_decode_budget_drafts_huge_jpeg(self, tmp_path):
+        path = tmp_path / "hovgaard.jpg"
+        Image.effect_noise((4000, 2000), 60).convert("RGB").save(path, quality=95)
+        result = resize_file(path, 400_000, budget=8_000_000)
+        assert result.ok and result.after <= 400_000
+        assert result.scale <= 0.5
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test_gallery.db")
+    monkeypatch.setattr(db, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(resize_images, "DB_PATH", db.DB_PATH)
+    db.init_db()
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text('[{"id": "plate", "local_path": "ia/plate.jpg", "source": "ia"}]')
+    db.import_manifest(manifest)
+    db.save_views([("plate", [{"x": 0, "y": 0, "width": 2000, "height": 900},
+                              {"x": 0, "y": 1000, "width": 2000, "height": 1000}])])
+    return db.DB_PATH
+
+
+class TestShrunkPlates:
+    def test_boxes_follow_the_new_pixels(self, temp_db):
+        db.save_bounds("plate", {"x": 100, "y": 50, "width": 1800, "height": 1900})
+        db.save_roi_boxes("plate", [{"x": 1500, "y": 1800, "width": 400, "height": 200, "kind": "title_block"}])
+        db.save_roi_boxes("plate_v2", [{"x": 1001, "y": 11, "width": 999, "height": 989, "kind": "table"}])
+        assert db.rescale_boxes("ia/plate.jpg", (2000, 2000), (1000, 1000)) == 3
+
+        def stored(image_id):
+            (record,) = db.select_images("id = ?", (image_id,))
+            return record.to_dict()
+
+        plate = stored("plate")
+        assert plate["bounds"] == {"x": 50, "y": 25, "width": 900, "height": 950}
+        assert plate["roi_boxes"] == [{"x": 750, "y": 900, "width": 200, "height": 100, "kind": "title_block"}]
+        view = stored("plate_v2")
+        assert view["bounds"] == {"x": 0, "y": 500, "width": 1000, "height": 500}
+        assert (view["width"], view["height"]) == (1000, 500)
+        # Rounded outwards, but kept inside the view's crop
+        assert view["roi_boxes"] == [{"x": 500, "y": 5, "width": 500, "height": 495, "kind": "table"}]
+        assert stored("plate_v1")["roi_boxes"] is None
+
+    def test_failed_views_are_not_resized_on_their_own(self, temp_db):
+        for image_id in ("plate", "plate_v1"):
+            db.save_analysis(image_id, {}, error="Image too large")
+        assert [r["id"] for r in resize_images.get_oversized_failures()] == ["plate"]
@@ -0,0 +1,101 @@
+"""Tests for LLM response extraction, repair and schema coercion."""
+import pytest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+from vision.response_parser import (
+    extract_json_object, repair_json, parse_response, ResponseParseError,
+)
+
+
+class TestExtraction:
+    def test_ignores_surrounding_prose(self):
+        text = 'Sure! Here is the result: {"ship_type": "cruiser"} Let me know if you need more.'
+        assert extract_json_object(text) == '{"ship_type": "cruiser"}'
+
+    def test_braces_inside_strings_do_not_end_object(self):
+        text = '{"reasoning": "turret {A} and } marks", "navy": "USN"}'
+        assert extract_json_object(text) == text
+
+    def test_returns_first_outermost_object(self):
+        text = '{"a": {"b": 1}} and then {"c": 2}'
+        assert extract_json_object(text) == '{"a": {"b": 1}}'
+
+    def test_no_object(self):
+        assert extract_json_object("I cannot analyze this image.") is None
+
+
+class TestRepair:
+    @pytest.mark.parametrize("broken,expected", [
+        ('{"a": 1,}', '{"a": 1}'),
+        ('{"a": [1, 2,],}', '{"a": [1, 2]}'),
+        ("{'a': 'b'}", '{"a": "b"}'),
+        ('{"a": True, "b": None}', '{"a": true, "b": null}'),
+        ('{"a": "cut off', '{"a": "cut off"}'),
+        ('{"a": [1, {"b": 2', '{"a": [1, {"b": 2}]}'),
+        ('{"a":', '{"a": null}'),
+    ])
+    def test_common_defects(self, broken, expected):
+        assert repair_json(broken) == expected
+
+
+class TestParseResponse:
+    def test_fenced_json_with_prose(self):
+        text = "Analysis below.\n```json\n{\"ship_type\": \"battleship\", \"confidence\": 0.9}\n```\n"
+        result = parse_response(text, phase=1)
+        assert result.data == {"ship_type": "battleship", "confidence": 0.9}
+        assert not result.repaired
+
+    def test_enum_normalization(self):
+        text = '{"view_type": "Side Profile", "era": "WW2", "ship_type": "Light Cruiser", "image_type": "Single-View"}'
+        data = parse_response(text, phase=1).data
+        assert data["view_type"] == "side_profile"
+        assert data["era"] == "wwii"
+        assert data["ship_type"] == "cruiser"
+        assert data["image_type"] == "single_view"
+
+    def test_unexpected_enum_kept_with_warning(self):
+        result = parse_response('{"ship_type": "monitor"}', phase=1)
+        assert result.data["ship_type"] == "monitor"
+        assert any("ship_type" in w for w in result.warnings)
+
+    @pytest.mark.parametrize("raw,expected", [
+        (0.8, 0.8), ("0.75", 0.75), ("85%", 0.85), (90, 0.9), ("high", 0.9), (1.7, 1.0),
+    ])
+    def test_confidence_coerced_to_float(self, raw, expected):
+        import json
+        data = parse_response(json.dumps({"confidence": raw}), phase=1).data
+        assert isinstance(data["confidence"], float)
+        assert data["confidence"] == pytest.approx(expected)
+
+    def test_phase1_scalar_coercions(self):
+        text = ("{'extraction_tier': 'Tier 2', 'suitable_for_extraction': 'yes', "
+                "'quality_issues': 'watermark, low_contrast', 'is_historical': 'False'}")
+        data = parse_response(text, phase=1).data
+        assert data["extraction_tier"] == 2
+        assert data["suitable_for_extraction"] is True
+        assert data["quality_issues"] == ["watermark", "low_contrast"]
+        assert data["is_historical"] is False
+
+    def test_phase2_null_like_strings(self):
+        text = '{"ship_name": "HMS Hood", "hull_number": "N/A", "shipyard": "not visible", "speed": 31}'
+        data = parse_response(text, phase=2).data
+        assert data["ship_name"] == "HMS Hood"
+        assert data["hull_number"] is None
+        assert data["shipyard"] is None
+        assert data["speed"] == "31"
+
+    def test_truncated_response_is_recovered(self):
+        text = '{"ship_type": "destroyer", "navy": "IJN", "reasoning": "Fubuki-class torpedo tub'
+        result = parse_response(text, phase=1)
+        assert result.repaired
+        assert result.data["ship_type"] == "destroyer"
+        assert result.data["navy"] == "IJN"
+
+    def test_unrecoverable_raises(self):
+        with pytest.raises(ResponseParseError):
+            parse_response("The image appears to be a photograph of a harbour.", phase=1)
+        with pytest.raises(ResponseParseError):
+            parse_response("", phase=1)
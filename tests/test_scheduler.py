@@ -0,0 +1,101 @@
+"""Tests for the classification priority scheduler and daily budget."""
+import pytest
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+import db
+from scheduler import PriorityScheduler, score, source_group, parse_quotas, likely_ship
+
+
+def item(img_id, source="", local_path="", **extra):
+    return {"id": img_id, "source": source, "local_path": local_path, **extra}
+
+
+class TestScoring:
+    def test_archive_items_grouped_by_staging_folder(self):
+        assert source_group(item("a", "FM30-301956", "oni/FM30-301956_3.jpg")) == "ONI Manuals"
+        assert source_group(item("b", "DTIC_AD1004552", "img/ia/DTIC_AD1004552_1.jpg")) == "Internet Archive"
+        assert source_group(item("c", "Dreadnought Project", "img/dreadnought/x.jpg")) == "Dreadnought Project"
+
+    def test_dreadnought_plan_outranks_oni_page(self):
+        plan = item("plan", "Dreadnought Project", width=6000, height=2500)
+        oni = item("oni", "FM30-301956", "oni/FM30-301956_3.jpg", width=800, height=1100)
+        assert score(plan) > score(oni)
+
+    def test_missing_signals_are_neutral(self):
+        bare = item("x", "Dreadnought Project")
+        assert 0.0 < score(bare) < 1.0
+        assert score(item("x", "Dreadnought Project", width=6000, height=4000)) > score(bare)
+
+
+class TestScheduler:
+    def test_pops_in_score_order(self):
+        items = [
+            item("oni", "FM30-301956", "oni/a.jpg"),
+            item("dp", "Dreadnought Project"),
+            item("loc", "Library of Congress"),
+        ]
+        assert [i["id"] for i in PriorityScheduler(items)] == ["dp", "loc", "oni"]
+
+    def test_budget_caps_dispatch(self):
+        items = [item(f"dp{i}", "Dreadnought Project") for i in range(5)]
+        scheduler = PriorityScheduler(items, budget=2)
+        assert len(scheduler) == 2
+        assert len(list(scheduler)) == 2
+        assert not scheduler
+
+    def test_quota_lets_other_sources_through(self):
+        items = [item(f"dp{i}", "Dreadnought Project") for i in range(6)]
+        items += [item(f"oni{i}", "X", "oni/x.jpg") for i in range(2)]
+        scheduler = PriorityScheduler(items, quotas={"Dreadnought Project": 0.5}, budget=4)
+        order = [i["id"] for i in scheduler]
+        assert order == ["dp0", "dp1", "oni0", "oni1"]
+
+    def test_quota_is_work_conserving(self):
+        items = [item(f"dp{i}", "Dreadnought Project") for i in range(3)]
+        scheduler = PriorityScheduler(items, quotas={"Dreadnought Project": 1})
+        assert len(list(scheduler)) == 3
+
+    def test_slack_keeps_score_order_without_requeueing(self):
+        items = [item(f"p{i}", "Pinterest", width=1000 + i, height=1000) for i in range(4000)]
+        items += [item(f"dp{i}", "Dreadnought Project") for i in range(10)]
+        scheduler = PriorityScheduler(items, quotas={"Pinterest": 0.1})
+        order = [i["id"] for i in scheduler]
+        assert order[:10] == [f"dp{i}" for i in range(10)]
+        assert order[10:20] == [f"p{i}" for i in range(3999, 3989, -1)]
+        assert len(order) == 4010 and not scheduler._deferred
+
+    def test_pinned_items_come_first(self):
+        items = [item("dp", "Dreadnought Project"), item("oni", "X", "oni/x.jpg")]
+        scheduler = PriorityScheduler(items, pinned=["oni"])
+        assert scheduler.peek()["id"] == "oni"
+        assert scheduler.peek()["id"] == "oni"  # peek does not dispatch
+        assert [i["id"] for i in scheduler] == ["oni", "dp"]
+
+    def test_parse_quotas(self):
+        assert parse_quotas(["ONI Manuals=0.1", "Pinterest=50"]) == {"ONI Manuals": 0.1, "Pinterest": 50.0}
+        with pytest.raises(ValueError):
+            parse_quotas(["Pinterest"])
+
+
+class TestApiUsage:
+    def test_usage_accumulates_per_day(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(db, "DB_PATH", tmp_path / "test_gallery.db")
+        monkeypatch.setattr(db, "DATA_DIR", tmp_path)
+        db.init_db()
+
+        assert db.get_api_usage("2024-05-01") == 0
+        db.record_api_calls(3, day="2024-05-01")
+        db.record_api_calls(day="2024-05-01")
+        db.record_api_calls(day="2024-05-02")
+        assert db.get_api_usage("2024-05-01") == 4
+        assert db.get_api_usage("2024-05-02") == 1
+
+
+class TestLikelyShip:
+    def test_curated_sources_are_likely_ships(self):
+        assert likely_ship(item("a", "Dreadnought Project"))
+        assert likely_ship(item("b", "Wikimedia Commons"))
+        assert not likely_ship(item("c", "FM30-301956", "oni/c.jpg"))
@@ -0,0 +1,134 @@
+"""Tests for splitting multi-view plates into per-view records."""
+import json
+import sqlite3
+
+import pytest
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+from PIL import ImageDraw
+
+import db
+import split_views
+from split_views import detect_views, find_views
+
+
+def hull(draw, x0, y0, x1, y1):
+    draw.polygon([(x0, y0), (x1, y0), (x1 - 60, y1), (x0 + 60, y1)], outline=0, width=6)
+
+
+def stacked_plate(size=(3000, 2000)):
+    """Profile over plan, a caption under each."""
+    img = Image.new("L", size, 245)
+    draw = ImageDraw.Draw(img)
+    hull(draw, 300, 300, 2700, 700)
+    draw.text((1300, 760), "PROFILE", fill=0, font_size=50)
+    hull(draw, 300, 1100, 2700, 1600)
+    draw.text((1300, 1660), "PLAN", fill=0, font_size=50)
+    return img
+
+
+def grid_plate(size=(2400, 2000)):
+    """Four sections in a 2x2 grid."""
+    img = Image.new("L", size, 245)
+    draw = ImageDraw.Draw(img)
+    for x0 in (200, 1300):
+        for y0 in (200, 1100):
+            draw.ellipse([x0, y0, x0 + 900, y0 + 700], outline=0, width=8)
+    return img
+
+
+class TestFindViews:
+    def test_stacked_views_keep_their_captions(self):
+        views = find_views(np.asarray(stacked_plate().resize((1500, 1000))))
+        assert len(views) == 2
+        (x0, y0, x1, y1), (_, py0, _, py1) = views
+        assert 140 <= x0 <= 160 and 1340 <= x1 <= 1360
+        assert 140 <= y0 <= 160 and 400 <= y1 <= 420   # profile plus caption
+        assert 540 <= py0 <= 560 and py1 >= 850
+
+    def test_grid_reading_order(self):
+        views = find_views(np.asarray(grid_plate().resize((1200, 1000))))
+        assert len(views) == 4
+        assert [(x0 < 600, y0 < 500) for x0, y0, _, _ in views] == [
+            (True, True), (False, True), (True, False), (False, False)]
+
+    def test_single_view(self):
+        img = Image.new("L", (1200, 600), 245)
+        hull(ImageDraw.Draw(img), 100, 200, 1100, 400)
+        assert find_views(np.asarray(img)) == []
+
+    def test_detect_views_in_full_resolution(self, tmp_path):
+        path = tmp_path / "plate.jpg"
+        stacked_plate().save(path, quality=90)
+        profile, plan = detect_views(path)
+        assert 270 <= profile["x"] <= 300 and profile["x"] + profile["width"] >= 2700
+        assert 270 <= profile["y"] <= 300 and profile["y"] + profile["height"] < 1100
+        assert plan["y"] > 800 and plan["y"] + plan["height"] >= 1700
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test_gallery.db")
+    monkeypatch.setattr(db, "DATA_DIR", tmp_path)
+    monkeypatch.setenv("NAVAL_GALLERY_IMAGE_DIR", str(tmp_path))
+    db.init_db()
+    image_dir = tmp_path / "img"
+    (image_dir / "ia").mkdir(parents=True)
+    stacked_plate().save(image_dir / "ia" / "multi.jpg", quality=90)
+    grid_plate().save(image_dir / "ia" / "single.jpg", quality=90)
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps([
+        {"id": "multi", "local_path": "ia/multi.jpg", "source": "ia", "title": "Dreadnought"},
+        {"id": "single", "local_path": "ia/single.jpg", "source": "ia"},
+    ]))
+    db.import_manifest(manifest)
+    db.save_analysis("multi", {"image_type": "multi_view_stacked", "navy": "RN", "ship_type": "battleship"})
+    db.save_analysis("single", {"image_type": "single_view", "navy": "RN"})
+    return image_dir
+
+
+class TestRun:
+    def test_views_become_pending_child_records(self, temp_db):
+        counts = split_views.run(workers=1)
+        assert counts == {"plates": 1, "split": 1, "single": 0, "failed": 0, "views": 2}
+
+        views = db.select_images("parent_id = 'multi'", order_by="id")
+        assert [v["id"] for v in views] == ["multi_v1", "multi_v2"]
+        for view in views:
+            assert view["local_path"] == "ia/multi.jpg"
+            assert view["title"] == "Dreadnought"
+            assert view["analysis_status"] == "pending"
+            assert set(view["bounds"]) == {"x", "y", "width", "height"}
+        assert views[0]["bounds"]["y"] < views[1]["bounds"]["y"]
+
+    def test_split_plates_are_skipped_unless_forced(self, temp_db):
+        split_views.run(workers=1)
+        assert split_views.run(workers=1)["plates"] == 0
+        assert split_views.run(workers=1, force=True)["views"] == 2
+        assert len(db.select_images("parent_id IS NOT NULL")) == 2
+
+    def test_views_follow_the_organized_plate(self, temp_db):
+        split_views.run(workers=1)
+        db.save_analysis("multi_v1", {"view_type": "side_profile"})
+        assert [r["id"] for r in db.get_ready_to_organize()] == ["multi", "single"]
+
+        db.update_organization("multi", "classified/RN/battleship/multi.jpg")
+        conn = sqlite3.connect(db.DB_PATH)
+        paths = dict(conn.execute("SELECT id, local_path FROM images WHERE id LIKE 'multi%'"))
+        conn.close()
+        assert set(paths.values()) == {"classified/RN/battleship/multi.jpg"}
+
+    def test_frontend_lists_views_on_the_plate(self, temp_db):
+        split_views.run(workers=1)
+        db.save_analysis("multi_v1", {"view_type": "side_profile"})
+        db.sync_frontend()
+        text = (db.DATA_DIR / "images.js").read_text()
+        data = json.loads(text[len("const images = "):-1])
+        assert [e["id"] for e in data] == ["multi", "single"]
+        views = data[0]["views"]
+        assert [(v["id"], v["view_type"]) for v in views] == [("multi_v1", "side_profile"), ("multi_v2", None)]
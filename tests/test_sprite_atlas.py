@@ -0,0 +1,89 @@
+"""Tests for sprite atlas export."""
+import pytest
+import json
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+Image = pytest.importorskip("PIL.Image")
+
+import db
+import sprite_atlas
+import thumbnails
+
+
+@pytest.fixture
+def gallery(tmp_path, monkeypatch):
+    "Five analyzed plates of distinct colours, with thumbnails."
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test_gallery.db")
+    monkeypatch.setattr(db, "DATA_DIR", data_dir)
+    monkeypatch.setenv("NAVAL_GALLERY_IMAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(sprite_atlas, "COLUMNS", 2)
+    db.init_db()
+
+    image_dir = tmp_path / "img"
+    image_dir.mkdir()
+    colours = ["red", "lime", "blue", "yellow", "white"]
+    for i, colour in enumerate(colours):
+        Image.new("RGB", (800, 500), colour).save(image_dir / f"p{i}.png")
+    manifest = data_dir / "manifest.json"
+    manifest.write_text(json.dumps([{"id": f"p{i}", "local_path": f"p{i}.png"} for i in range(len(colours))]))
+    db.import_manifest(manifest)
+    for i in range(len(colours)):
+        db.save_analysis(f"p{i}", {"ship_type": "battleship"})
+    thumbnails.run("jpeg", workers=1)
+    return image_dir, colours
+
+
+def load_images(data_dir):
+    text = (data_dir / "images.js").read_text()
+    return json.loads(text.replace("const images = ", "").rstrip(";"))
+
+
+class TestAtlas:
+    def test_cells_in_grid_order(self, gallery, monkeypatch):
+        image_dir, colours = gallery
+        monkeypatch.setattr(sprite_atlas, "PER_SHEET", 4)
+        db.sync_frontend(atlas=True, atlas_format="jpeg", atlas_workers=1)
+        entries = load_images(db.DATA_DIR)
+
+        sheets = [e["atlas"]["sheet"] for e in entries]
+        assert len(set(sheets[:4])) == 1 and sheets[4] != sheets[0]
+        for entry, colour in zip(entries, colours):
+            cell = entry["atlas"]
+            assert cell["sheet"].startswith("img/")
+            assert (cell["w"], cell["h"]) == (sprite_atlas.CELL_WIDTH, sprite_atlas.CELL_HEIGHT)
+            with Image.open(image_dir / cell["sheet"][len("img/"):]) as sheet:
+                assert sheet.size == (cell["sheet_w"], cell["sheet_h"])
+                centre = (cell["x"] + cell["w"] // 2, cell["y"] + cell["h"] // 2)
+                got = sheet.convert("RGB").getpixel(centre)
+                want = Image.new("RGB", (1, 1), colour).getpixel((0, 0))
+                assert all(abs(a - b) <= 8 for a, b in zip(got, want))
+        # The last, partial sheet holds a single cell
+        assert (entries[4]["atlas"]["sheet_w"], entries[4]["atlas"]["sheet_h"]) == (
+            sprite_atlas.CELL_WIDTH, sprite_atlas.CELL_HEIGHT)
+
+    def test_unchanged_sheets_are_reused_and_stale_ones_pruned(self, gallery, monkeypatch):
+        image_dir, _ = gallery
+        monkeypatch.setattr(sprite_atlas, "PER_SHEET", 4)
+        db.sync_frontend(atlas=True, atlas_format="jpeg", atlas_workers=1)
+        first = {e["id"]: e["atlas"]["sheet"] for e in load_images(db.DATA_DIR)}
+        mtimes = {p.name: p.stat().st_mtime_ns for p in (image_dir / sprite_atlas.ATLAS_DIR).iterdir()}
+
+        Image.new("RGB", (800, 500), "black").save(image_dir / "p4.png")
+        thumbnails.run("jpeg", workers=1)
+        db.sync_frontend(atlas=True, atlas_format="jpeg", atlas_workers=1)
+        second = {e["id"]: e["atlas"]["sheet"] for e in load_images(db.DATA_DIR)}
+
+        assert second["p0"] == first["p0"] and second["p4"] != first["p4"]
+        sheets = {p.name: p.stat().st_mtime_ns for p in (image_dir / sprite_atlas.ATLAS_DIR).iterdir()}
+        assert Path(first["p4"]).name not in sheets
+        assert sheets[Path(first["p0"]).name] == mtimes[Path(first["p0"]).name]
+
+    def test_off_by_default(self, gallery, monkeypatch):
+        monkeypatch.delenv("NAVAL_GALLERY_ATLAS", raising=False)
+        db.sync_frontend()
+        assert all("atlas" not in e for e in load_images(db.DATA_DIR))
@@ -0,0 +1,87 @@
+"""Tests for MCP server supervision (circuit breaker, backoff, stderr draining)."""
+import pytest
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+from vision.supervisor import CircuitBreaker, CircuitOpenError, StderrDrain, backoff_delay
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold(self):
+        """Consecutive failures at the threshold should open the circuit."""
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=FakeClock())
+        for _ in range(2):
+            breaker.record_failure()
+        breaker.check()  # still closed
+
+        breaker.record_failure()
+        assert breaker.is_open
+        with pytest.raises(CircuitOpenError) as exc:
+            breaker.check()
+        assert exc.value.retry_after == pytest.approx(10)
+
+    def test_success_resets_failure_count(self):
+        """A success between failures should reset the counter."""
+        breaker = CircuitBreaker(failure_threshold=2, clock=FakeClock())
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert not breaker.is_open
+
+    def test_half_open_trial_after_timeout(self):
+        """After the reset timeout one trial call is allowed; failure re-opens."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5, clock=clock)
+        breaker.record_failure()
+        assert breaker.is_open
+
+        clock.now = 6
+        breaker.check()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+
+        breaker.record_failure()
+        assert breaker.is_open
+        assert breaker.retry_after() == pytest.approx(5)
+
+    def test_half_open_success_closes(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5, clock=clock)
+        breaker.record_failure()
+        clock.now = 6
+        breaker.check()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+
+class TestBackoff:
+    def test_grows_exponentially_and_caps(self):
+        delays = [backoff_delay(n, base=1.0, cap=8.0, jitter=0) for n in range(1, 7)]
+        assert delays == [1.0, 2.0, 4.0, 8.0, 8.0, 8.0]
+
+
+class TestStderrDrain:
+    def test_chatty_process_does_not_stall(self):
+        """A process writing more than a pipe buffer to stderr should still exit."""
+        script = "import sys\nfor i in range(20000): sys.stderr.write('noise line %d\\n' % i)\nprint('done')"
+        proc = subprocess.Popen([sys.executable, "-c", script],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        drain = StderrDrain(proc.stderr, keep=5).start()
+
+        out = proc.stdout.read()
+        assert proc.wait(timeout=10) == 0
+        drain.join(timeout=5)
+
+        assert out.strip() == b"done"
+        assert drain.tail().splitlines()[-1] == "noise line 19999"
+        assert len(drain.tail().splitlines()) == 5
@@ -0,0 +1,109 @@
+"""Tests for the thumbnail and preview generator."""
+import pytest
+import io
+import json
+import sqlite3
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+Image = pytest.importorskip("PIL.Image")
+
+import db
+import thumbnails
+import thumbpack
+
+
+@pytest.fixture
+def gallery(tmp_path, monkeypatch):
+    "Temporary database and image directory holding two plates."
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test_gallery.db")
+    monkeypatch.setattr(db, "DATA_DIR", data_dir)
+    monkeypatch.setenv("NAVAL_GALLERY_IMAGE_DIR", str(tmp_path))
+    db.init_db()
+
+    image_dir = tmp_path / "img"
+    (image_dir / "wiki").mkdir(parents=True)
+    Image.effect_noise((2400, 1200), 40).convert("RGB").save(image_dir / "wiki" / "big.jpg", quality=95)
+    Image.new("L", (300, 200), 200).save(image_dir / "wiki" / "small.png")
+    manifest = data_dir / "manifest.json"
+    manifest.write_text(json.dumps([
+        {"id": "big", "local_path": "wiki/big.jpg"},
+        {"id": "small", "local_path": "wiki/small.png"},
+        {"id": "gone", "local_path": "wiki/gone.jpg"},
+    ]))
+    db.import_manifest(manifest)
+    return image_dir
+
+
+class TestMakeDerivatives:
+    def test_fixed_widths_never_upscaled(self, gallery):
+        result = thumbnails.make_derivatives("big", gallery / "wiki" / "big.jpg", gallery, fmt="webp")
+        assert result.ok and not result.skipped
+        with Image.open(gallery / result.outputs["thumb"]) as thumb:
+            assert thumb.format == "WEBP"
+            assert thumb.size == (thumbnails.THUMB_WIDTH, thumbnails.THUMB_WIDTH // 2)
+        with Image.open(gallery / result.outputs["preview"]) as preview:
+            assert preview.width == thumbnails.PREVIEW_WIDTH
+
+        small = thumbnails.make_derivatives("small", gallery / "wiki" / "small.png", gallery, fmt="jpeg")
+        with Image.open(gallery / small.outputs["preview"]) as preview:
+            assert preview.format == "JPEG" and preview.size == (300, 200)
+
+    def test_unchanged_content_is_skipped(self, gallery):
+        source = gallery / "wiki" / "big.jpg"
+        first = thumbnails.make_derivatives("big", source, gallery)
+        moved = gallery / "moved.jpg"
+        source.rename(moved)
+        again = thumbnails.make_derivatives("big", moved, gallery)
+        assert again.ok and again.skipped and again.outputs == first.outputs
+
+        Image.new("RGB", (800, 400), "navy").save(moved)
+        changed = thumbnails.make_derivatives("big", moved, gallery)
+        assert not changed.skipped and changed.content_hash != first.content_hash
+
+    def test_unsupported_format_falls_back_to_jpeg(self, monkeypatch):
+        monkeypatch.delitem(Image.SAVE, "AVIF", raising=False)
+        assert thumbnails.pick_format("avif") == "jpeg"
+
+
+class TestRun:
+    def test_records_paths_and_syncs_frontend_fields(self, gallery):
+        counts = thumbnails.run("webp", workers=1)
+        assert (counts["made"], counts["skipped"], counts["missing"], counts["failed"]) == (2, 0, 1, 0)
+        assert thumbnails.run("webp", workers=1)["skipped"] == 2
+
+        db.save_analysis("big", {"ship_type": "battleship"})
+        db.sync_frontend()
+        text = (db.DATA_DIR / "images.js").read_text()
+        entry = json.loads(text.replace("const images = ", "").rstrip(";"))[0]
+        assert entry["thumb"] == "img/" + entry["thumb_path"]
+        assert entry["full"] == "img/" + entry["preview_path"]
+        assert (gallery / entry["thumb_path"]).exists()
+
+    def test_pack_mode_exports_one_file_for_the_grid(self, gallery, monkeypatch, tmp_path):
+        monkeypatch.setattr(thumbnails, "PACK_DIR", tmp_path / "data" / "thumbs")
+        counts = thumbnails.run("webp", workers=1, pack=True)
+        assert counts["made"] == 2
+        assert not (gallery / thumbnails.DERIVED_DIR / "thumb").exists()
+        web_pack = gallery / thumbnails.WEB_PACK
+
+        records = {r["id"]: r for r in db.select_images()}
+        for image_id in ("big", "small"):
+            path, offset, length = thumbpack.parse_range_ref(records[image_id]["thumb_path"])
+            assert path == thumbnails.WEB_PACK
+            data = web_pack.read_bytes()[offset:offset + length]
+            with Image.open(io.BytesIO(data)) as thumb:
+                assert thumb.format == "WEBP"
+        assert thumbnails.run("webp", workers=1, pack=True)["skipped"] == 2
+
+        # A deleted image's thumb is dropped from the pack on compaction
+        conn = sqlite3.connect(db.DB_PATH)
+        conn.execute("DELETE FROM images WHERE id = 'small'")
+        conn.commit()
+        conn.close()
+        dropped, reclaimed = thumbnails.compact_pack()
+        assert dropped == 1 and reclaimed > 0
@@ -0,0 +1,85 @@
+"""Tests for the packed, memory-mapped thumbnail store."""
+import pytest
+import hashlib
+import os
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+import thumbpack
+from thumbpack import ThumbPack, PackError
+
+
+def digest(n):
+    return hashlib.sha256(str(n).encode()).hexdigest()
+
+
+@pytest.fixture
+def pack(tmp_path):
+    with ThumbPack(tmp_path / "thumbs") as p:
+        yield p
+
+
+class TestThumbPack:
+    def test_bulk_write_then_random_read(self, pack, tmp_path):
+        added = pack.put_many((digest(i), bytes([i]) * (i + 1)) for i in range(50))
+        assert added == 50 and len(pack) == 50
+        assert pack.get(digest(7)) == bytes([7]) * 8
+        assert pack.get(digest(99)) is None
+        # Existing keys are not appended again
+        assert pack.put_many([(digest(7), b"other")]) == 0
+        size = os.path.getsize(pack.pack_path)
+        pack.put(digest(50), b"late")
+        assert pack.get(digest(50)) == b"late" and os.path.getsize(pack.pack_path) == size + 4
+
+        with ThumbPack(tmp_path / "thumbs") as reopened:
+            assert len(reopened) == 51 and reopened.get(digest(49)) == bytes([49]) * 50
+
+    def test_torn_writes_are_ignored_on_open(self, pack, tmp_path):
+        pack.put_many([(digest(1), b"one"), (digest(2), b"two")])
+        pack.close()
+        # A half-written index record, and an index record whose data never landed
+        with open(pack.index_path, "ab") as f:
+            f.write(thumbpack.RECORD.pack(bytes.fromhex(digest(3)), 10_000, 5))
+            f.write(b"\0" * 7)
+        with ThumbPack(tmp_path / "thumbs") as reopened:
+            assert sorted(reopened.keys()) == sorted([digest(1), digest(2)])
+
+    def test_compaction_drops_dead_entries(self, pack, tmp_path):
+        pack.put_many((digest(i), os.urandom(1000)) for i in range(10))
+        kept = {digest(i): pack.get(digest(i)) for i in (2, 5)}
+        dropped, reclaimed = pack.compact(kept)
+        assert dropped == 8 and reclaimed == 8000
+        assert {k: pack.get(k) for k in pack.keys()} == kept
+        assert not list((tmp_path / "thumbs").glob("*.tmp"))
+
+    def test_interrupted_compaction_is_finished_on_open(self, pack, tmp_path):
+        pack.put_many([(digest(1), b"one"), (digest(2), b"two")])
+        pack.compact([digest(2)])
+        compacted_index = pack.index_path.read_bytes()
+        pack.close()
+        # Simulate a crash between renaming the new pack and the new index
+        os.replace(pack.index_path, pack.index_path.with_name("thumbs.idx.tmp"))
+        pack.index_path.write_bytes(thumbpack.HEADER.pack(thumbpack.INDEX_MAGIC, b"oldpack!"))
+        with ThumbPack(tmp_path / "thumbs") as reopened:
+            assert reopened.keys() == [digest(2)] and reopened.get(digest(2)) == b"two"
+        assert pack.index_path.read_bytes() == compacted_index
+
+    def test_mismatched_index_is_an_error(self, pack, tmp_path):
+        pack.close()
+        pack.index_path.write_bytes(thumbpack.HEADER.pack(thumbpack.INDEX_MAGIC, b"someelse"))
+        with pytest.raises(PackError):
+            ThumbPack(tmp_path / "thumbs")
+
+    def test_export_in_requested_order(self, pack, tmp_path):
+        pack.put_many([(digest(1), b"one"), (digest(2), b"two!"), (digest(3), b"three")])
+        out = tmp_path / "web.pack"
+        ranges = pack.export(out, [digest(3), digest(1), digest(9)])
+        assert ranges == {digest(3): (0, 5), digest(1): (5, 3)}
+        assert out.read_bytes() == b"threeone"
+
+        ref = thumbpack.range_ref("_derived/web.pack", *ranges[digest(1)])
+        assert ref == "_derived/web.pack#bytes=5-7"
+        assert thumbpack.parse_range_ref(ref) == ("_derived/web.pack", 5, 3)
+        assert thumbpack.parse_range_ref("_derived/thumb/ab/x.webp") is None
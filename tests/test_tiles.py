@@ -0,0 +1,88 @@
+"""Tests for the Deep Zoom tile pyramid builder."""
+import pytest
+import json
+import math
+from pathlib import Path
+from xml.etree import ElementTree
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+Image = pytest.importorskip("PIL.Image")
+
+import db
+import tiles
+
+
+@pytest.fixture
+def plate(tmp_path):
+    path = tmp_path / "foldout.png"
+    Image.effect_noise((1000, 600), 40).convert("RGB").save(path)
+    return path
+
+
+class TestPyramid:
+    def test_levels_and_tile_geometry_follow_deep_zoom(self, plate, tmp_path):
+        result = tiles.make_pyramid("foldout", plate, tmp_path, fmt="jpeg", min_side=800)
+        assert result.ok and result.levels == 11  # ceil(log2(1000)) + 1
+        dzi = tmp_path / result.dzi_path
+        root = ElementTree.parse(dzi).getroot()
+        assert (root.get("TileSize"), root.get("Overlap"), root.get("Format")) == ("254", "1", "jpg")
+        assert root[0].attrib == {"Width": "1000", "Height": "600"}
+
+        files = dzi.with_name(dzi.stem + "_files")
+        for level in range(result.levels):
+            scale = 2 ** (result.levels - 1 - level)
+            w, h = math.ceil(1000 / scale), math.ceil(600 / scale)
+            names = {p.name for p in (files / str(level)).iterdir()}
+            assert len(names) == math.ceil(w / 254) * math.ceil(h / 254)
+        # Interior tiles carry the overlap on both sides, edge tiles are clipped
+        with Image.open(files / "10" / "1_1.jpg") as tile:
+            assert tile.size == (256, 256)
+        with Image.open(files / "10" / "3_2.jpg") as tile:
+            assert tile.size == (1000 - 3 * 254 + 1, 600 - 2 * 254 + 1)
+        with Image.open(files / "0" / "0_0.jpg") as tile:
+            assert tile.size == (1, 1)
+
+    def test_small_images_are_not_tiled(self, plate, tmp_path):
+        result = tiles.make_pyramid("foldout", plate, tmp_path, min_side=2000)
+        assert result.ok and result.dzi_path is None
+        assert not (tmp_path / tiles.thumbnails.DERIVED_DIR).exists()
+
+    def test_finished_pyramid_is_skipped(self, plate, tmp_path):
+        first = tiles.make_pyramid("foldout", plate, tmp_path, min_side=800)
+        again = tiles.make_pyramid("foldout", plate, tmp_path, min_side=800)
+        assert again.skipped and again.dzi_path == first.dzi_path and again.tiles == 0
+        # Without the descriptor the pyramid counts as interrupted and is rebuilt
+        (tmp_path / first.dzi_path).unlink()
+        rebuilt = tiles.make_pyramid("foldout", plate, tmp_path, min_side=800)
+        assert not rebuilt.skipped and rebuilt.tiles == first.tiles
+
+
+class TestRun:
+    def test_records_tiles_for_frontend(self, tmp_path, monkeypatch, plate):
+        data_dir = tmp_path / "data"
+        data_dir.mkdir()
+        monkeypatch.setattr(db, "DB_PATH", tmp_path / "test_gallery.db")
+        monkeypatch.setattr(db, "DATA_DIR", data_dir)
+        monkeypatch.setenv("NAVAL_GALLERY_IMAGE_DIR", str(tmp_path))
+        db.init_db()
+        image_dir = tmp_path / "img"
+        image_dir.mkdir(exist_ok=True)
+        plate.rename(image_dir / "foldout.png")
+        Image.new("RGB", (300, 200)).save(image_dir / "small.png")
+        manifest = data_dir / "manifest.json"
+        manifest.write_text(json.dumps([{"id": "big", "local_path": "foldout.png"},
+                                        {"id": "small", "local_path": "small.png"}]))
+        db.import_manifest(manifest)
+
+        counts = tiles.run(min_side=800, workers=1)
+        assert (counts["tiled"], counts["small"], counts["failed"]) == (1, 1, 0)
+        db.save_analysis("big", {"ship_type": "battleship"})
+        db.save_analysis("small", {"ship_type": "cruiser"})
+        db.sync_frontend()
+        text = (data_dir / "images.js").read_text()
+        entries = {e["id"]: e for e in json.loads(text.replace("const images = ", "").rstrip(";"))}
+        assert entries["big"]["tiles"] == "img/" + entries["big"]["tiles_path"]
+        assert entries["big"]["tiles"].endswith(".dzi")
+        assert "tiles" not in entries["small"]
@@ -0,0 +1,117 @@
+"""Tests for span tracing and the trace report."""
+import pytest
+import asyncio
+import json
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+import db
+import tracing
+import trace_report
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = tracing.enable(tmp_path / "trace.jsonl")
+    yield path
+    tracing.disable()
+
+
+def read_spans(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+class TestSpans:
+    def test_disabled_is_a_no_op(self):
+        tracing.disable()
+        with tracing.span("download", image_id="x") as span:
+            span.set_attribute("k", 1)
+        assert span is tracing._NULL_SPAN
+        assert tracing.current_span() is tracing._NULL_SPAN
+
+    def test_nested_spans_share_trace_and_link_parent(self, trace_file):
+        with tracing.span("classify", image_id="wiki_1", phase=1):
+            with tracing.span("vision.analyze_image") as inner:
+                inner.set_attribute("upload.bytes", 1234)
+        child, parent = read_spans(trace_file)
+        assert child["parentSpanId"] == parent["spanId"]
+        assert child["traceId"] == parent["traceId"] == tracing.trace_id_for("wiki_1")
+        assert parent["attributes"] == {"phase": 1, "image.id": "wiki_1"}
+        assert child["attributes"]["upload.bytes"] == 1234
+        assert parent["endTimeUnixNano"] >= child["endTimeUnixNano"] >= child["startTimeUnixNano"]
+
+    def test_exception_marks_error_status(self, trace_file):
+        with pytest.raises(ValueError):
+            with tracing.span("download", image_id="x"):
+                raise ValueError("bad gateway")
+        (span,) = read_spans(trace_file)
+        assert span["status"] == {"code": "STATUS_CODE_ERROR", "message": "ValueError: bad gateway"}
+
+    def test_context_propagates_per_task(self, trace_file):
+        @tracing.traced("vision.analyze_image")
+        async def analyze():
+            await asyncio.sleep(0)
+            return tracing.current_span().name
+
+        async def one(image_id):
+            with tracing.span("classify", image_id=image_id):
+                return await analyze()
+
+        async def both():
+            return await asyncio.gather(one("a"), one("b"))
+
+        assert asyncio.run(both()) == ["vision.analyze_image"] * 2
+        spans = read_spans(trace_file)
+        parents = {s["spanId"]: s for s in spans if s["name"] == "classify"}
+        for s in spans:
+            if s["name"] == "vision.analyze_image":
+                assert parents[s["parentSpanId"]]["traceId"] == s["traceId"]
+
+    def test_save_analysis_is_traced_by_image(self, trace_file, tmp_path, monkeypatch):
+        monkeypatch.setattr(db, "DB_PATH", tmp_path / "gallery.db")
+        monkeypatch.setattr(db, "DATA_DIR", tmp_path)
+        db.init_db()
+        db.save_analysis("loc_1", {}, error="boom")
+        (span,) = read_spans(trace_file)
+        assert span["name"] == "db.save_analysis"
+        assert span["traceId"] == tracing.trace_id_for("loc_1")
+
+
+class TestReport:
+    @staticmethod
+    def record(name, trace, span_id, start, end, parent=None, image=None):
+        attributes = {"image.id": image} if image else {}
+        return json.dumps({"traceId": trace, "spanId": span_id, "parentSpanId": parent, "name": name,
+                           "startTimeUnixNano": int(start * 1e9), "endTimeUnixNano": int(end * 1e9),
+                           "attributes": attributes, "status": {"code": "STATUS_CODE_OK"}})
+
+    @pytest.fixture
+    def spans(self, tmp_path):
+        lines = [
+            self.record("download", "t1", "a", 0, 2, image="slow"),
+            self.record("classify", "t1", "b", 10, 40, image="slow"),
+            self.record("vision.analyze_image", "t1", "c", 11, 39, parent="b"),
+            self.record("classify", "t2", "d", 0, 5, image="fast"),
+            self.record("vision.analyze_image", "t2", "e", 0, 4, parent="d"),
+            '{"traceId": "t3", "spanId": "torn',
+        ]
+        path = tmp_path / "trace.jsonl"
+        path.write_text("\n".join(lines) + "\n")
+        return trace_report.load_spans([path])
+
+    def test_breakdown_uses_self_time(self, spans):
+        rows = {r["stage"]: r for r in trace_report.stage_breakdown(spans)}
+        assert rows["vision.analyze_image"]["count"] == 2
+        assert rows["vision.analyze_image"]["self_s"] == pytest.approx(32)
+        assert rows["classify"]["total_s"] == pytest.approx(35)
+        assert rows["classify"]["self_s"] == pytest.approx(3)
+        assert sum(r["share"] for r in rows.values()) == pytest.approx(1)
+
+    def test_slowest_images_sum_root_spans(self, spans):
+        slow, fast = trace_report.slowest_images(spans, top=5)
+        assert slow["image_id"] == "slow" and slow["total_s"] == pytest.approx(32)
+        assert fast["image_id"] == "fast" and fast["total_s"] == pytest.approx(5)
+        assert trace_report.slowest_images(spans, top=1) == [slow]
+        assert "Slowest 1 images" in trace_report.format_report(spans, top=1)
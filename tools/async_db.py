@@ -0,0 +1,168 @@
+"""
+Asynchronous facade over tools/db.py for asyncio code.
+
+The db functions open a short-lived SQLite connection per call and block
+until the commit is on disk, which stalls every coroutine on the event loop
+for the duration. AsyncDB moves those calls off the loop:
+
+    writes   run on one dedicated writer thread (a single-worker executor,
+             i.e. one thread draining a FIFO queue), so they execute in
+             exactly the order they were submitted
+    reads    run on a small reader pool, concurrently with each other and,
+             with the database in WAL mode, with the writer
+
+WAL is opt-in (`AsyncDB(wal=True)` or NAVAL_GALLERY_SQLITE_WAL=1): the
+mode is stored in the database file and its -wal/-shm side files do not
+survive being synced by Drive or other FUSE mounts, so by default the
+database keeps (or goes back to) the rollback journal, and readers wait
+for the writer's commits.
+
+Every call is queued immediately and returns an asyncio Future. Await it
+for the result (exceptions propagate), or leave it in flight and let
+`flush()` / leaving the `async with` block wait for it; failures of writes
+nobody awaited are logged. Calls carry the caller's contextvars, so spans
+opened inside db functions nest under the caller's span.
+
+Usage:
+    async with AsyncDB() as adb:
+        pending = await adb.get_pending()
+        adb.record_api_calls(1)                  # queued, ordered, not awaited
+        await adb.save_analysis(img_id, results)
+"""
+
+import os
+import asyncio
+import logging
+import sqlite3
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+
+import db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# db functions that modify the database: serialized on the writer thread
+WRITE_FUNCTIONS = frozenset({
+    "init_db", "migrate_db", "import_manifest", "save_analysis", "save_roi_boxes", "save_bounds",
+    "record_api_calls", "record_attempt", "update_organization", "save_derivatives",
+    "save_tiles", "replace_local_path", "save_views", "save_probes",
+})
+
+# db functions that only read: run on the reader pool
+READ_FUNCTIONS = frozenset({
+    "get_pending", "get_failed", "get_phase2_pending", "get_api_usage", "get_tier_usage",
+    "get_ready_to_organize", "get_extraction_candidates", "export_manifest",
+})
+
+DEFAULT_READERS = 4
+WAL_ENV = "NAVAL_GALLERY_SQLITE_WAL"
+
+
+class AsyncDB:
+    "Awaitable access to the db module: ordered writer thread plus a reader pool."
+
+    def __init__(self, readers: int = DEFAULT_READERS, wal: Optional[bool] = None):
+        self.readers = readers
+        self.wal = os.environ.get(WAL_ENV) == "1" if wal is None else wal
+        self._writer = None
+        self._reader_pool = None
+        self._loop = None
+        self._pending = set()
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._reader_pool = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="db-reader")
+        await self.write(_set_wal, self.wal)
+        return self
+
+    async def close(self):
+        "Wait for every queued call, then stop the threads."
+        if self._writer is None:
+            return
+        await self.flush()
+        self._writer.shutdown(wait=True)
+        self._reader_pool.shutdown(wait=True)
+        self._writer = self._reader_pool = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+        return False
+
+    # -- submission ----------------------------------------------------------
+
+    def write(self, fn, *args, **kwargs) -> asyncio.Future:
+        "Queue fn(*args, **kwargs) on the writer thread, after every earlier write."
+        return self._submit(self._writer, "write", fn, args, kwargs)
+
+    def read(self, fn, *args, **kwargs) -> asyncio.Future:
+        "Run fn(*args, **kwargs) on the reader pool."
+        return self._submit(self._reader_pool, "read", fn, args, kwargs)
+
+    def _submit(self, executor, kind, fn, args, kwargs):
+        if executor is None:
+            raise RuntimeError("AsyncDB is not started; use `async with AsyncDB()` or await start()")
+        queued = time.perf_counter()
+        call = partial(fn, *args, **kwargs)
+
+        def run():
+            metrics.observe("db_queue_wait_seconds", time.perf_counter() - queued, kind=kind)
+            return call()
+
+        ctx = contextvars.copy_context()
+        future = self._loop.run_in_executor(executor, ctx.run, run)
+        self._pending.add(future)
+        future.add_done_callback(partial(self._done, getattr(fn, "__name__", repr(fn))))
+        return future
+
+    def _done(self, name, future):
+        self._pending.discard(future)
+        if future.cancelled():
+            return
+        exc = future.exception()  # marks the exception as retrieved
+        if exc is not None:
+            logger.error(f"[!] DB call {name} failed: {exc}")
+
+    async def flush(self):
+        "Wait until every call queued so far has finished (errors are not raised here)."
+        while self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    # -- db module functions -------------------------------------------------
+
+    def __getattr__(self, name):
+        if name in WRITE_FUNCTIONS:
+            return partial(self._call, self.write, name)
+        if name in READ_FUNCTIONS:
+            return partial(self._call, self.read, name)
+        raise AttributeError(name)
+
+    @staticmethod
+    def _call(submit, name, *args, **kwargs):
+        # Resolved at call time so a patched db.DB_PATH or function is honoured
+        return submit(getattr(db, name), *args, **kwargs)
+
+
+def _set_wal(enabled: bool):
+    "Switch the database to WAL, or back to the rollback journal if it was left in WAL."
+    if not enabled and not os.path.exists(db.DB_PATH):
+        return  # a new database starts with the rollback journal
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        current = conn.execute("PRAGMA journal_mode").fetchone()[0].lower()
+        if enabled and current != "wal":
+            conn.execute("PRAGMA journal_mode=WAL")
+        elif not enabled and current == "wal":
+            conn.execute("PRAGMA journal_mode=DELETE")
+    except sqlite3.DatabaseError as e:
+        # Filesystems without shared memory support keep the rollback journal
+        logger.warning(f"[!] Could not change the journal mode: {e}")
+    finally:
+        conn.close()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+End-to-end pipeline benchmark.
+
+Runs import -> classify -> organize -> sync_frontend over a synthetic corpus
+of N images in a throwaway directory, with the vision calls served by the
+offline fake MCP server (tools/vision/fake_server.py). Nothing touches the
+real database, the Drive folder or the Z.AI API.
+
+Usage:
+    uv run python tools/benchmark_pipeline.py --images 500 --latency lognormal:0.05,0.5
+    uv run python tools/benchmark_pipeline.py --images 200 --error-rate 0.05 --json data/bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import io
+import random
+import shlex
+import asyncio
+import argparse
+import resource
+import tempfile
+import logging
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+# Add to path for config import
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import db
+from vision import MCPVisionClient
+from classify_images import Classifier
+from organize_gallery import organize_images
+
+FAKE_SERVER = Path(__file__).parent / "vision" / "fake_server.py"
+
+# Source folder -> manifest source label, roughly the real corpus mix
+SYNTHETIC_SOURCES = [
+    ("dreadnought", "Dreadnought Project"),
+    ("wiki", "Wikimedia Commons"),
+    ("ia", "structuraldesign00hovgrich"),
+    ("oni", "oni-200-naval-vessels-of-the-united-states"),
+    ("loc", "Library of Congress"),
+]
+
+
+class TimedVisionClient(MCPVisionClient):
+    "MCPVisionClient that records wall-clock latency of every analyze_image call."
+
+    latencies = []
+
+    async def analyze_image(self, image_path, prompt, timeout=120.0):
+        start = time.perf_counter()
+        try:
+            return await super().analyze_image(image_path, prompt, timeout=timeout)
+        finally:
+            TimedVisionClient.latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, pct):
+    "Nearest-rank percentile; returns 0.0 for an empty list."
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def peak_rss_mb():
+    "Peak resident set size of this process and of reaped children (fake server), in MB."
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KB on Linux
+    self_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor
+    children_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisor
+    return self_mb, children_mb
+
+
+def synthetic_plate(rng, image_kb):
+    "JPEG bytes of a line drawing on noisy paper, close to `image_kb` KB."
+    def encode(side):
+        w, h = side * 3 // 2, side
+        paper = bytes(rng.randrange(200, 256) for _ in range(w * h))
+        img = Image.frombytes("L", (w, h), paper)
+        draw = ImageDraw.Draw(img)
+        draw.polygon([(w // 10, h // 3), (w * 9 // 10, h // 3), (w * 8 // 10, h * 2 // 3), (w * 2 // 10, h * 2 // 3)],
+                     outline=0, width=max(1, side // 200))
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=85)
+        return buf.getvalue()
+
+    # Noise compresses at a steady rate per pixel: one trial encode sets the side
+    trial = encode(256)
+    side = max(64, int(256 * (image_kb * 1024 / len(trial)) ** 0.5))
+    return encode(side)
+
+
+def build_corpus(root, count, image_kb, seed):
+    "Write `count` synthetic image files under root/img/<source>/ and return a manifest."
+    rng = random.Random(seed)
+    image_dir = root / "img"
+    manifest = []
+    # One decodable plate per source, reused, keeps corpus generation cheap for large N
+    plates = [synthetic_plate(rng, image_kb) for _ in SYNTHETIC_SOURCES]
+    for i in range(count):
+        folder, source = SYNTHETIC_SOURCES[i % len(SYNTHETIC_SOURCES)]
+        (image_dir / folder).mkdir(parents=True, exist_ok=True)
+        filename = f"bench_{i:06d}.jpg"
+        (image_dir / folder / filename).write_bytes(plates[i % len(plates)])
+        manifest.append({
+            "id": f"bench_{i:06d}",
+            "local_path": f"{folder}/{filename}",
+            "url": f"https://example.invalid/{folder}/{filename}",
+            "source": source,
+            "title": f"Synthetic plate {i}",
+        })
+    return manifest
+
+
+def run_benchmark(images, latency, error_rate, image_kb, seed, workdir):
+    root = Path(workdir)
+    data_dir = root / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    os.environ["NAVAL_GALLERY_IMAGE_DIR"] = str(root)
+    os.environ.setdefault("Z_AI_API_KEY", "offline-benchmark")
+    os.environ["NAVAL_GALLERY_MCP_COMMAND"] = shlex.join([
+        sys.executable, str(FAKE_SERVER),
+        "--latency", latency,
+        "--error-rate", str(error_rate),
+        "--seed", str(seed),
+    ])
+    db.DATA_DIR = data_dir
+    db.DB_PATH = data_dir / "gallery.db"
+
+    stages = {}
+
+    t0 = time.perf_counter()
+    manifest = build_corpus(root, images, image_kb, seed)
+    manifest_path = data_dir / "bench_manifest.json"
+    manifest_path.write_text(json.dumps(manifest))
+    stages["corpus"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    db.init_db()
+    db.import_manifest(manifest_path)
+    stages["import"] = time.perf_counter() - t0
+
+    TimedVisionClient.latencies = []
+    classifier = Classifier(phase=1, rate_limit=0, client_factory=TimedVisionClient)
+    t0 = time.perf_counter()
+    asyncio.run(classifier.run())
+    stages["classify"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    organize_images()
+    stages["organize"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    db.sync_frontend()
+    stages["sync_frontend"] = time.perf_counter() - t0
+
+    latencies = TimedVisionClient.latencies
+    pipeline_time = sum(v for k, v in stages.items() if k != "corpus")
+    self_rss, child_rss = peak_rss_mb()
+    return {
+        "images": images,
+        "latency_spec": latency,
+        "error_rate": error_rate,
+        "stages_s": {k: round(v, 4) for k, v in stages.items()},
+        "throughput_ips": {
+            k: round(images / v, 2) if v > 0 else None
+            for k, v in stages.items() if k != "corpus"
+        },
+        "end_to_end_ips": round(images / pipeline_time, 2) if pipeline_time else None,
+        "vision_calls": len(latencies),
+        "vision_latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2) if latencies else 0.0,
+        },
+        "peak_rss_mb": {"pipeline": round(self_rss, 1), "fake_server": round(child_rss, 1)},
+    }
+
+
+def print_report(report):
+    print("\n=== PIPELINE BENCHMARK ===")
+    print(f"Images: {report['images']}  |  latency: {report['latency_spec']}  |  error rate: {report['error_rate']}")
+    print("-" * 50)
+    print(f"{'stage':<15}{'seconds':>12}{'images/s':>14}")
+    for stage, seconds in report["stages_s"].items():
+        ips = report["throughput_ips"].get(stage)
+        print(f"{stage:<15}{seconds:>12.3f}{(ips if ips is not None else 0):>14.1f}")
+    print("-" * 50)
+    print(f"End-to-end throughput: {report['end_to_end_ips']} images/s")
+    lat = report["vision_latency_ms"]
+    print(f"Vision latency: p50 {lat['p50']} ms | p95 {lat['p95']} ms | max {lat['max']} ms "
+          f"({report['vision_calls']} calls)")
+    rss = report["peak_rss_mb"]
+    print(f"Peak RSS: pipeline {rss['pipeline']} MB | fake server {rss['fake_server']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Naval Gallery end-to-end pipeline benchmark")
+    parser.add_argument("--images", type=int, default=200, help="Synthetic corpus size")
+    parser.add_argument("--latency", type=str, default="fixed:0", help="Fake server latency spec")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fake server JSON-RPC error rate")
+    parser.add_argument("--image-kb", type=int, default=64, help="Size of each synthetic image file")
+    parser.add_argument("--seed", type=int, default=1234, help="Random seed")
+    parser.add_argument("--workdir", type=str, default=None, help="Keep artifacts in this directory")
+    parser.add_argument("--json", type=str, default=None, help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    # Per-image INFO logs would dominate the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.workdir:
+        report = run_benchmark(args.images, args.latency, args.error_rate, args.image_kb, args.seed, args.workdir)
+    else:
+        with tempfile.TemporaryDirectory(prefix="naval-bench-") as workdir:
+            report = run_benchmark(args.images, args.latency, args.error_rate, args.image_kb, args.seed, workdir)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[*] Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
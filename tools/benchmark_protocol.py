@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for MCP protocol encode/decode overhead per message.
+
+Compares the original request/response path (debug f-string serialization,
+second serialization for the wire, double parse of every response line)
+against the codec-based path with each available JSON backend.
+
+Usage:
+    uv run python tools/benchmark_protocol.py --iterations 20000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+
+# Add to path for vision import
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from vision.protocol import MCPProtocol, MCPRequest, MCPResponse, CODECS
+from classify_images import PHASE_1_PROMPT
+
+
+def sample_messages():
+    "A realistic tools/call request and the matching response line."
+    params = {
+        "name": "analyze_image",
+        "arguments": {
+            "image_source": "/home/user/GoogleDrive/img/dreadnought/HMS_Dreadnought_1906_profile.jpg",
+            "prompt": PHASE_1_PROMPT,
+        },
+    }
+    classification = {
+        "image_type": "single_view", "view_type": "side_profile", "view_style": "line_drawing_bw",
+        "orientation": "bow_left", "ship_type": "battleship", "ship_class": "Dreadnought",
+        "ship_name": "HMS Dreadnought", "navy": "Royal Navy", "era": "dreadnought",
+        "is_historical": True, "designer": None, "silhouette_clarity": "clean",
+        "annotation_density": "light", "resolution_quality": "high", "extraction_tier": 2,
+        "suitable_for_extraction": True, "quality_issues": [],
+        "reasoning": "Single tripod mast, five twin 12-inch turrets, " * 4,
+        "confidence": 0.9, "notes": None,
+    }
+    response = {
+        "jsonrpc": "2.0", "id": 1,
+        "result": {"content": [{"type": "text", "text": json.dumps(classification)}], "isError": False},
+    }
+    return params, (json.dumps(response) + "\n").encode()
+
+
+def legacy_roundtrip(params, response_line, protocol_logger):
+    "The pre-codec path: to_json for the log line, to_json for the wire, parse twice."
+    request = MCPRequest(method="tools/call", params=params, id=1)
+    protocol_logger.debug(f">>> {request.to_json()}")
+    wire = (request.to_json() + "\n").encode()
+    raw = response_line.decode(errors="ignore").strip()
+    parsed = json.loads(raw)
+    if parsed.get("id") == request.id:
+        return wire, MCPResponse.from_json(raw)
+
+
+def codec_roundtrip(protocol, params, response_line):
+    "The current path: one encode, one decode, lazy logging."
+    request = protocol.create_request("tools/call", params)
+    wire = protocol.encode_request(request)
+    parsed = protocol.decode(response_line)
+    return wire, MCPResponse.from_dict(parsed)
+
+
+def measure(fn, iterations):
+    # Warm up allocators and any lazy imports
+    for _ in range(min(200, iterations)):
+        fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCP protocol codec micro-benchmark")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    # Debug off, as in production runs
+    logging.getLogger("mcp.protocol").setLevel(logging.INFO)
+    params, response_line = sample_messages()
+
+    results = []
+    baseline = measure(lambda: legacy_roundtrip(params, response_line, logging.getLogger("mcp.protocol")),
+                       args.iterations)
+    results.append(("legacy (json, eager log)", baseline))
+
+    for name, codec_cls in CODECS.items():
+        try:
+            codec = codec_cls()
+        except ImportError:
+            results.append((f"codec: {name}", None))
+            continue
+        protocol = MCPProtocol(codec=codec)
+        results.append((f"codec: {name}",
+                        measure(lambda: codec_roundtrip(protocol, params, response_line), args.iterations)))
+
+    print(f"\nPer-message request+response overhead ({args.iterations} iterations, "
+          f"request {len(json.dumps(params))} B, response {len(response_line)} B)")
+    print("-" * 58)
+    print(f"{'path':<30}{'us/message':>14}{'speedup':>12}")
+    for label, micros in results:
+        if micros is None:
+            print(f"{label:<30}{'not installed':>14}")
+            continue
+        print(f"{label:<30}{micros:>14.2f}{baseline / micros:>11.2f}x")
+
+
+if __name__ == "__main__":
+    main()
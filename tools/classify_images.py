@@ -9,16 +9,34 @@ Aligned with ProjectBroadsideStudio Stage 1 schema for future integration.
 import os
 import sys
 import asyncio
-import json
 import argparse
 import signal
+import shutil
+import tempfile
+import time
+from functools import partial
 from pathlib import Path
 
 # Add parent to path for config import
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from config import get_absolute_path, validate_config
-from vision import MCPVisionClient
+from vision import MCPVisionClient, MCPServerDied, CircuitOpenError, Cassette, CassetteMiss
+from vision.response_parser import parse_response, ResponseParseError, SCHEMAS, PHASE_1_SCHEMA
 import db
+import escalation
+import metrics
+import tracing
+import profiling
+import probe_images
+from async_db import AsyncDB
+from journal import RunJournal
+from scheduler import PriorityScheduler, parse_quotas, likely_ship
+
+try:
+    import layout  # needs numpy: pip install .[layout]
+    import margins
+except ImportError:
+    layout = margins = None
 
 # Setup logging
 import logging
@@ -129,50 +147,382 @@ Extract only what is VISIBLE or clearly labeled. Use null for unavailable fields
 Return ONLY valid JSON, no markdown code blocks.
 """
 
+# Single pass for images that are almost certainly ship plates: Phase 1
+# classification and Phase 2 specifications from one upload
+COMBINED_PROMPT = PHASE_1_PROMPT.split("## OUTPUT FORMAT")[0] + """
+## TASK 4: Technical Specifications (only if this is a ship)
+Extract ALL visible technical information:
+- Identification: hull number, shipyard
+- Physical: Length (LOA/LPP), beam, draft, displacement (standard/full/light)
+- Performance: Propulsion type, horsepower, shafts, max speed (knots)
+- Protection: Belt armor, deck, turrets, conning tower (in mm or inches)
+- Armament: Main battery, secondary, AA, torpedoes, aircraft
+- History: Launch date, commission date
+- Crew: Complement (officers + enlisted)
+Extract only what is VISIBLE or clearly labeled. Use null for unavailable fields.
+If the image does not show a ship, set every TASK 4 field to null.
+
+## OUTPUT FORMAT (JSON only, no markdown)
+{
+  "image_type": "single_view",
+  "view_type": "side_profile",
+  "view_style": "filled_color",
+  "orientation": "bow_left",
+  "ship_type": "battleship",
+  "ship_class": "Iowa-class",
+  "ship_name": "USS Iowa",
+  "navy": "USN",
+  "era": "wwii",
+  "is_historical": true,
+  "designer": null,
+  "silhouette_clarity": "clean",
+  "annotation_density": "light",
+  "resolution_quality": "high",
+  "extraction_tier": 1,
+  "suitable_for_extraction": true,
+  "quality_issues": [],
+  "hull_number": "BB-61",
+  "shipyard": "...",
+  "dimensions": "LOA 270m, Beam 33m, Draft 11m",
+  "displacement": "45,000 tons standard",
+  "propulsion": "4 steam turbines, 212,000 SHP, 4 shafts",
+  "speed": "33 knots",
+  "armor": "Belt: 307mm, Deck: 153mm",
+  "armament": "9x 16in/50, 20x 5in/38",
+  "complement": "2,700",
+  "launch_date": "1942-08-27",
+  "commission_date": "1943-02-22",
+  "reasoning": "Identified by distinctive triple 16-inch turrets and modern superstructure...",
+  "confidence": 0.9,
+  "notes": "..."
+}
+
+Be precise. If uncertain about any field, provide your best guess with lower confidence.
+Return ONLY valid JSON, no markdown code blocks.
+"""
+
+
+# Server restarts in a row (no successful call in between) before the run gives up
+MAX_CONSECUTIVE_RESTARTS = 10
+
+
+class DrainAborted(Exception):
+    "Raised when an in-flight call is cancelled because the shutdown deadline passed."
+    pass
+
 
 class Classifier:
-    def __init__(self, phase=1):
+    def __init__(self, phase=1, rate_limit=0.5, client_factory=MCPVisionClient, drain_timeout=30.0, journal=None,
+                 daily_budget=None, quotas=None, combined=False, roi=True, policy=None,
+                 trim=True, grayscale=False, wal=None):
         self.phase = phase
+        self.rate_limit = rate_limit
+        self.client_factory = client_factory
+        self.drain_timeout = drain_timeout
+        self.journal = journal
+        self.daily_budget = daily_budget
+        self.quotas = quotas or {}
+        self.combined = combined and phase == 1
+        self.roi = roi and layout is not None
+        self.trim = trim and margins is not None
+        self.grayscale = grayscale
+        self.wal = wal
+        self.policy = policy or escalation.EscalationPolicy()
+        self._scratch = None
+        self._calls_left = None  # vision calls left in the daily budget (None: unlimited)
+        self.db = None
         self.prompt = PHASE_1_PROMPT if phase == 1 else PHASE_2_PROMPT
         self.running = True
+        self._force_stop = False
+        self._drain_deadline = None
         
         # Handle Ctrl+C gracefully
         signal.signal(signal.SIGINT, self.stop)
         signal.signal(signal.SIGTERM, self.stop)
 
     def stop(self, signum, frame):
-        logger.info("[!] Stopping classification...")
+        if not self.running:
+            logger.info("[!] Second stop signal: aborting in-flight call now")
+            self._force_stop = True
+            return
+        logger.info(f"[!] Stopping classification (draining in-flight call for up to {self.drain_timeout:.0f}s)...")
         self.running = False
-
-
+        self._drain_deadline = time.monotonic() + self.drain_timeout
+
+    async def _recover(self):
+        """
+        Replay the run journal from an interrupted run.
+
+        Results that reached the journal but not the database are re-applied
+        (no second API call); images that were in flight are returned so they
+        can go to the front of the queue.
+        """
+        state = await self._journal("replay")
+        if state.clean:
+            return []
+
+        logger.info(f"[*] Resuming interrupted run: {len(state.uncommitted)} results to re-apply, "
+                    f"{len(state.in_flight)} images were in flight.")
+        for img_id, record in state.uncommitted.items():
+            await self.db.save_analysis(img_id, record.get('results') or {}, error=record.get('error'))
+            self._journal("committed", img_id)
+        return state.in_flight
+
+    def _plan(self, item):
+        "Pick (prompt, schema, phase reached) for an image."
+        if self.phase == 2:
+            return PHASE_2_PROMPT, SCHEMAS[2], 2
+        if self.combined and likely_ship(item):
+            return COMBINED_PROMPT, SCHEMAS["combined"], 2
+        return PHASE_1_PROMPT, SCHEMAS[1], 1
+
+    async def _prepare_image(self, item, img_path, reached):
+        """
+        For prompts that read specifications, replace the plate with a small
+        overview plus full-resolution crops of its title block and annotation
+        tables. Crop boxes are stored in roi_boxes and reused on later runs.
+
+        Returns (path to send, note to prepend to the prompt).
+        """
+        if reached != 2 or not self.roi:
+            return img_path, ""
+        loop = asyncio.get_running_loop()
+        try:
+            if item.get('roi_boxes') is not None:
+                regions = [layout.Region.from_dict(box) for box in item['roi_boxes']]
+            else:
+                regions = await loop.run_in_executor(None, layout.analyze_layout, img_path)
+                self.db.save_roi_boxes(item['id'], [r.to_dict() for r in regions])
+            if not regions:
+                return img_path, ""
+
+            composite = self._scratch_path("roi_composite.jpg")
+            await loop.run_in_executor(None, layout.build_composite, img_path, regions, composite)
+            logger.info(f"    -> Sending overview + {len(regions)} region crops")
+            return composite, layout.COMPOSITE_NOTE
+        except Exception as e:
+            logger.warning(f"    -> Layout analysis failed, sending full plate: {e}")
+            return img_path, ""
+
+    async def _trim(self, item, img_path):
+        """
+        Crop scan margins (and optionally convert line art to greyscale) for
+        the whole-plate tiers. The content box is stored in bounds and
+        reused on later runs. A view split from a multi-view plate is always
+        cut to its bounds, trimming or not.
+
+        Returns the path to upload in place of the plate.
+        """
+        view = item.get('parent_id') is not None
+        if margins is None or not (self.trim or view):
+            return img_path
+        loop = asyncio.get_running_loop()
+        try:
+            bounds = item.get('bounds')
+            if not margins.valid_bounds(bounds):
+                if view:
+                    raise ValueError(f"view of {item['parent_id']} has no bounds")
+                bounds = await loop.run_in_executor(None, margins.detect_bounds, img_path)
+                self.db.save_bounds(item['id'], bounds)
+            trimmed = await loop.run_in_executor(None, partial(margins.trim_image, img_path, bounds,
+                                                               self._scratch_path("trimmed.jpg"),
+                                                               grayscale=self.grayscale,
+                                                               min_trim=0 if view else margins.MIN_TRIM))
+        except Exception as e:
+            logger.warning(f"    -> Margin trimming failed, sending full plate: {e}")
+            return img_path
+        if trimmed is None:
+            return img_path
+        logger.info(f"    -> Trimmed to {bounds['width']}x{bounds['height']} content box")
+        return trimmed
+
+    async def _escalate(self, client, item, img_path, prompt, schema, reached, billable):
+        """
+        Walk the escalation ladder for one image until an answer is accepted.
+
+        Each call is recorded in analysis_attempts. API errors end the ladder
+        (a bigger image will not fix them); unparseable answers escalate.
+        The ladder also ends when the daily call budget runs out; the best
+        answer so far is kept.
+        """
+        img_id = item['id']
+        phases = (2,) if self.phase == 2 else ((1, 2) if reached == 2 else (1,))
+        loop = asyncio.get_running_loop()
+        attempts = []
+        sent = set()
+        last_path, last_note = img_path, ""
+        # Whole-plate tiers send the trimmed plate; ROI boxes stay in source coordinates,
+        # except for views, which are analyzed on their crop
+        upload = await self._trim(item, img_path)
+        roi_source = upload if item.get('parent_id') is not None else img_path
+
+        for tier in self.policy.ladder(reached):
+            if tier == escalation.LOW_RES:
+                try:
+                    low = await loop.run_in_executor(None, escalation.downscale, upload,
+                                                     self._scratch_path("low_res.jpg"))
+                except Exception as e:
+                    # Not decodable locally; the vision server may still read it
+                    logger.debug(f"    -> No low-res copy for {img_id}: {e}")
+                    low = None
+                path, note = (low or upload), ""
+            elif tier == escalation.ROI:
+                path, note = await self._prepare_image(item, roi_source, reached)
+                if path == roi_source:
+                    continue  # no text regions: full_res covers it
+            elif tier == escalation.FULL_RES:
+                path, note = upload, ""
+            else:
+                path = last_path
+                note = escalation.reprompt(last_note, attempts[-1], self.policy.threshold)
+            if tier != escalation.REPROMPT and path == upload and upload in sent:
+                continue  # plate was already small enough to go out as-is
+            if billable and self._calls_left is not None and self._calls_left <= 0:
+                logger.info(f"    -> Daily API budget used up, skipping {tier} and above")
+                break
+
+            attempt = escalation.Attempt(tier=tier, bytes_sent=os.path.getsize(path))
+            try:
+                result = await self._await_with_drain(client.analyze_image(str(path), note + prompt))
+            except CassetteMiss:
+                if not attempts:
+                    raise
+                logger.info(f"    -> {tier} not in the cassette, keeping the answer from {attempts[-1].tier}")
+                break
+            if billable:
+                self.db.record_api_calls(1)
+                if self._calls_left is not None:
+                    self._calls_left -= 1
+            metrics.inc("vision_calls_total", tier=tier)
+            sent.add(path)
+            last_path, last_note = path, note
+
+            if not result.success:
+                logger.error(f"    -> Vision API error ({tier}): {result.error}")
+                attempt.error = result.error
+            else:
+                # Recover and validate the JSON object from the LLM response
+                try:
+                    parsed = parse_response(result.content, schema=schema)
+                except ResponseParseError as e:
+                    metrics.error("parse", e)
+                    logger.error(f"    -> JSON parse error ({tier}): {e}")
+                    logger.debug(f"    -> Raw content: {result.content[:500]}")
+                    attempt.error = f"JSON Parse Error: {e}"
+                else:
+                    attempt.data = parsed.data
+                    attempt.raw_response = result.raw_response
+                    attempt.warnings = parsed.warnings
+                    self.policy.judge(attempt, phases)
+
+            attempts.append(attempt)
+            self.db.record_attempt(img_id, max(phases), tier, attempt.bytes_sent, confidence=attempt.confidence,
+                                   missing=attempt.missing, accepted=attempt.accepted, error=attempt.error)
+            if attempt.accepted or not result.success:
+                break
+            if attempt.data is not None:
+                logger.info(f"    -> Escalating after {tier}: confidence {attempt.confidence}, "
+                            f"missing {attempt.missing or 'nothing'}")
+
+        return attempts
+
+    def _scratch_path(self, name):
+        "Per-run temporary file for derived images (low-res copies, ROI composites)."
+        if self._scratch is None:
+            self._scratch = Path(tempfile.mkdtemp(prefix="naval_classify_"))
+        return self._scratch / name
+
+    def _journal(self, event, *args, **kwargs):
+        """
+        Queue a journal call on the AsyncDB writer thread: its fsync stays
+        off the event loop, and it lands in order with the DB writes.
+        """
+        return self.db.write(getattr(self.journal, event), *args, **kwargs)
+
+    async def _commit(self, img_id, results, error=None):
+        "Journal the outcome, write it to the DB, then journal the commit."
+        await self._journal("completed", img_id, results, error=error)
+        with metrics.timed("db_write_seconds", op="save_analysis"):
+            await self.db.save_analysis(img_id, results, error=error)
+        self._journal("committed", img_id)
+        metrics.inc("classify_images_total", phase=self.phase, status="failed" if error else "complete")
+
+    async def _await_with_drain(self, coro):
+        """
+        Await a vision call. After a stop request the call may keep running
+        until the drain deadline; after that (or on a second signal) it is
+        cancelled and DrainAborted is raised.
+        """
+        task = asyncio.ensure_future(coro)
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=0.25)
+            if done:
+                return task.result()
+            deadline_passed = self._drain_deadline is not None and time.monotonic() >= self._drain_deadline
+            if self._force_stop or deadline_passed:
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+                raise DrainAborted()
 
     async def run(self, limit=None, retry_failed=False):
+        "Classify pending images; DB calls and journal appends go through an AsyncDB so the event loop never blocks on disk."
+        async with AsyncDB(wal=self.wal) as self.db:
+            await self._run(limit=limit, retry_failed=retry_failed)
+
+    async def _run(self, limit=None, retry_failed=False):
         # Validate config first
         validate_config()
+
+        if self.journal is None:
+            self.journal = RunJournal.for_phase(self.phase, journal_dir=db.DATA_DIR / "journal")
+        in_flight = await self._recover()
         
-        # Get pending work
+        # Get pending work (unlimited: the scheduler picks the best `limit` images)
         if self.phase == 1:
             if retry_failed:
-                pending = db.get_failed(limit=limit)
+                pending = await self.db.get_failed(columns=db.CLASSIFY_COLUMNS)
             else:
-                pending = db.get_pending(limit=limit)
+                pending = await self.db.get_pending(columns=db.CLASSIFY_COLUMNS)
         else:
-            pending = db.get_phase2_pending(limit=limit)
+            pending = await self.db.get_phase2_pending(columns=db.CLASSIFY_COLUMNS)
             
         if not pending:
             logger.info("[*] No pending images found.")
+            await self._journal("reset")
             return
 
-        logger.info(f"[*] Starting Phase {self.phase} classification for {len(pending)} images.")
-
+        cap = limit
+        if self.daily_budget is not None:
+            remaining = self.daily_budget - await self.db.get_api_usage()
+            if remaining <= 0:
+                logger.info(f"[*] Daily API budget of {self.daily_budget} calls already used.")
+                await self._journal("close")
+                return
+            # Every image takes at least one call; escalation may spend more, so
+            # _escalate checks what is left before each tier
+            cap = remaining if cap is None else min(cap, remaining)
+            self._calls_left = remaining
+
+        # Highest-value images first; images interrupted mid-call go before everything
+        queue = PriorityScheduler(pending, quotas=self.quotas, budget=cap, pinned=in_flight)
+        logger.info(f"[*] Starting Phase {self.phase} classification for {len(queue)} of {len(pending)} pending images.")
+
+        server_down = None
         # Start Vision Client
-        async with MCPVisionClient() as client:
-            for item in pending:
-                if not self.running:
+        async with self.client_factory() as client:
+            cassette = getattr(client, "cassette", None)
+            billable = cassette is None or not cassette.replaying
+            while queue and self.running:
+                if billable and self._calls_left is not None and self._calls_left <= 0:
+                    logger.info(f"[*] Daily API budget of {self.daily_budget} calls used up.")
                     break
-                
+                item = queue.peek()
                 img_id = item['id']
                 local_path = item['local_path']
+                self._journal("claimed", img_id)
                 
                 # Resolve to absolute path
                 img_path = get_absolute_path(local_path)
@@ -180,71 +530,166 @@ class Classifier:
                 # Check if file exists
                 if not img_path.exists():
                     logger.warning(f"[-] Image not found: {img_path}")
-                    db.save_analysis(img_id, {}, error=f"File not found: {img_path}")
+                    await self._commit(img_id, {}, error=f"File not found: {img_path}")
+                    queue.pop()
                     continue
 
                 logger.info(f"[+] Analyzing: {img_id}")
                 
+                prompt, schema, reached = self._plan(item)
                 try:
-                    result = await client.analyze_image(str(img_path), self.prompt)
-                    
-                    if result.success:
-                        # Extract JSON from LLM response
-                        try:
-                            # Strip any markdown backticks if present
-                            clean_content = result.content.strip()
-                            if clean_content.startswith("```"):
-                                # Extract content between backticks
-                                lines = clean_content.split("\n")
-                                json_lines = []
-                                in_block = False
-                                for line in lines:
-                                    if line.startswith("```"):
-                                        in_block = not in_block
-                                        continue
-                                    if in_block or not line.startswith("```"):
-                                        json_lines.append(line)
-                                clean_content = "\n".join(json_lines)
-                            
-                            classification = json.loads(clean_content)
-                            classification['raw_response'] = result.raw_response
-                            
-                            # Save to DB
-                            db.save_analysis(img_id, classification)
-                            
-                            # Log summary
-                            ship_type = classification.get('ship_type', 'unknown')
-                            navy = classification.get('navy', 'unknown')
-                            tier = classification.get('extraction_tier', '?')
-                            logger.info(f"    -> {ship_type} | {navy} | Tier {tier}")
-                            
-                        except json.JSONDecodeError as e:
-                            logger.error(f"    -> JSON parse error: {e}")
-                            logger.debug(f"    -> Raw content: {result.content[:500]}")
-                            db.save_analysis(img_id, {}, error=f"JSON Parse Error: {e}")
+                    await self._journal("sent", img_id)
+                    with tracing.span("classify", image_id=img_id, phase=self.phase, source=item.get('source')) as span:
+                        attempts = await self._escalate(client, item, img_path, prompt, schema, reached, billable)
+                        span.set_attributes({"vision.calls": len(attempts),
+                                             "vision.tiers": [a.tier for a in attempts]})
+                    best = self.policy.best(attempts)
+
+                    if best is not None:
+                        classification = best.data
+                        if reached == 2 and self.phase == 1 and not db.is_ship_type(classification.get('ship_type')):
+                            # Combined pass on a non-ship: keep only the Phase 1 answer
+                            classification = {k: v for k, v in classification.items() if k in PHASE_1_SCHEMA}
+                            reached = 1
+                        classification['analysis_phase'] = reached
+                        classification['raw_response'] = best.raw_response
+                        for warning in best.warnings:
+                            logger.warning(f"    -> {warning}")
+
+                        # Save to DB
+                        await self._commit(img_id, classification)
+
+                        # Log summary
+                        ship_type = classification.get('ship_type', 'unknown')
+                        navy = classification.get('navy', 'unknown')
+                        tier = classification.get('extraction_tier', '?')
+                        logger.info(f"    -> {ship_type} | {navy} | Tier {tier} (via {best.tier}, {len(attempts)} calls)")
                     else:
-                        logger.error(f"    -> Vision API error: {result.error}")
-                        db.save_analysis(img_id, {}, error=result.error)
+                        await self._commit(img_id, {}, error=attempts[-1].error)
+
+                except DrainAborted:
+                    logger.warning(f"    -> Shutdown deadline reached, {img_id} will be retried on the next run")
+                    self._journal("aborted", img_id, reason="shutdown deadline")
+                    break
                 
+                except CircuitOpenError as e:
+                    # Server is unhealthy: pause the queue and retry this image
+                    if getattr(client, "restarts", 0) >= MAX_CONSECUTIVE_RESTARTS:
+                        self._journal("aborted", img_id, reason="server down")
+                        server_down = e
+                        break
+                    logger.warning(f"[!] Vision server unavailable, pausing queue for {e.retry_after:.0f}s")
+                    await self._pause(e.retry_after)
+                    continue
+
+                except MCPServerDied as e:
+                    # Restarts exhausted; keep the image queued and let the breaker decide
+                    if getattr(client, "restarts", 0) >= MAX_CONSECUTIVE_RESTARTS:
+                        self._journal("aborted", img_id, reason="server down")
+                        server_down = e
+                        break
+                    logger.error(f"    -> MCP server down, will retry {img_id}: {e}")
+                    continue
+
+                except CassetteMiss:
+                    # Not recorded: leave the image pending rather than saving a failure
+                    logger.warning(f"    -> {img_id} is not in the cassette, skipped")
+                    self._journal("aborted", img_id, reason="cassette miss")
+                    queue.pop()
+                    continue
+
                 except Exception as e:
+                    metrics.error("classify", e)
                     logger.exception(f"    -> Unexpected error: {e}")
-                    db.save_analysis(img_id, {}, error=str(e))
+                    await self._commit(img_id, {}, error=str(e))
                 
+                queue.pop()
+
                 # Rate limiting
-                await asyncio.sleep(0.5)
+                if self.rate_limit and self.running:
+                    await asyncio.sleep(self.rate_limit)
+
+        if self._scratch is not None:
+            shutil.rmtree(self._scratch, ignore_errors=True)
+            self._scratch = None
+
+        deferred = len(pending) - queue.dispatched
+        if server_down is not None:
+            await self._journal("close")
+            raise MCPServerDied(f"MCP server failed {MAX_CONSECUTIVE_RESTARTS} restarts in a row, stopped with "
+                                f"{len(queue)} scheduled images still pending: {server_down}")
+        if queue:
+            await self._journal("close")
+            logger.info(f"[*] Stopped with {len(queue)} scheduled images still pending.")
+        else:
+            if deferred:
+                logger.info(f"[*] Run limit reached: {deferred} lower-priority images deferred.")
+            # Everything claimed was committed: nothing left to recover
+            await self._journal("reset")
+
+    async def _pause(self, seconds):
+        "Sleep while paused, waking early if a stop is requested."
+        deadline = asyncio.get_event_loop().time() + seconds
+        while self.running:
+            remaining = deadline - asyncio.get_event_loop().time()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(1.0, remaining))
+
+
+def _env_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def _probe_new_images():
+    "Record header facts (width, height, format, size) for images not probed yet."
+    counts = probe_images.run()
+    if counts["probed"] or counts["failed"]:
+        logger.info(f"[*] Probed {counts['probed']} new images ({counts['failed']} unreadable).")
 
 
 async def main():
     parser = argparse.ArgumentParser(description="Naval Gallery Image Classifier")
     parser.add_argument("--phase", type=int, default=1, choices=[1, 2], help="Analysis phase (1=classify, 2=enrich)")
     parser.add_argument("--limit", type=int, default=None, help="Max images to process")
+    parser.add_argument("--budget", type=int, default=_env_int("NAVAL_GALLERY_DAILY_BUDGET"),
+                        help="Max vision API calls per day (env NAVAL_GALLERY_DAILY_BUDGET)")
+    parser.add_argument("--quota", action="append", default=[], metavar="SOURCE=SHARE",
+                        help="Per-source fairness quota, as a share of the run (0.1) or an image count (50)")
+    parser.add_argument("--combined", action="store_true",
+                        help="Phase 1: classify and enrich likely ships in a single pass")
+    parser.add_argument("--no-roi", action="store_true",
+                        help="Phase 2: send the whole plate instead of overview + annotation crops")
+    parser.add_argument("--no-trim", action="store_true",
+                        help="Send whole scans instead of cropping paper margins and rulers")
+    parser.add_argument("--grayscale-line-art", action="store_true",
+                        help="Send line art (neutral ink on paper) in greyscale")
+    parser.add_argument("--no-escalation", action="store_true",
+                        help="One full-resolution call per image instead of the escalation ladder")
+    parser.add_argument("--min-confidence", type=float, default=escalation.DEFAULT_THRESHOLD,
+                        help="Escalate answers below this confidence (default: %(default)s)")
+    parser.add_argument("--wal", action="store_true",
+                        help="Put the database in WAL mode so reads do not wait for writes; only on a local "
+                             "disk, not a synced folder (env NAVAL_GALLERY_SQLITE_WAL=1)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Record metrics and export them to data/metrics/ (env NAVAL_GALLERY_METRICS=1)")
+    parser.add_argument("--trace", nargs="?", const="", default=None, metavar="FILE",
+                        help="Write spans to FILE (default data/traces/trace.jsonl); see tools/trace_report.py")
+    profiling.add_arguments(parser)
     parser.add_argument("--retry-failed", action="store_true", help="Retry images that failed previously")
     parser.add_argument("--export", type=str, help="Export database to JSON manifest")
     parser.add_argument("--import-manifest", type=str, help="Import JSON manifest into database")
     parser.add_argument("--migrate", action="store_true", help="Run database migration for new columns")
     parser.add_argument("--sync", action="store_true", help="Sync database to frontend (images.js)")
+    parser.add_argument("--record-cassette", type=str, metavar="PATH", help="Record every vision call to a cassette file")
+    parser.add_argument("--replay-cassette", type=str, metavar="PATH", help="Serve vision calls from a cassette (no API calls)")
     
     args = parser.parse_args()
+    if args.metrics:
+        metrics.enable()
+    if args.trace is not None:
+        tracing.enable(args.trace or None)
 
     if args.migrate:
         db.init_db()
@@ -255,6 +700,7 @@ async def main():
         db.init_db()
         db.migrate_db()
         db.import_manifest(args.import_manifest)
+        _probe_new_images()
         return
 
     if args.export:
@@ -268,9 +714,37 @@ async def main():
     # Normal execution
     db.init_db()
     db.migrate_db()  # Ensure new columns exist
-    
-    classifier = Classifier(phase=args.phase)
-    await classifier.run(limit=args.limit, retry_failed=args.retry_failed)
+    _probe_new_images()  # dimensions for the scheduler
+
+    scheduling = dict(daily_budget=args.budget, quotas=parse_quotas(args.quota), combined=args.combined,
+                      roi=not args.no_roi, trim=not args.no_trim, grayscale=args.grayscale_line_art,
+                      wal=args.wal or None,
+                      policy=escalation.EscalationPolicy(threshold=args.min_confidence,
+                                                         escalate=not args.no_escalation))
+    if args.replay_cassette:
+        # Replay is served from memory, so there is no API to rate limit
+        cassette = Cassette(args.replay_cassette, mode="replay")
+        classifier = Classifier(phase=args.phase, rate_limit=0,
+                                client_factory=partial(MCPVisionClient, cassette=cassette), **scheduling)
+    elif args.record_cassette:
+        cassette = Cassette(args.record_cassette, mode="record")
+        classifier = Classifier(phase=args.phase, client_factory=partial(MCPVisionClient, cassette=cassette),
+                                **scheduling)
+    else:
+        cassette = None
+        classifier = Classifier(phase=args.phase, **scheduling)
+    try:
+        with profiling.from_args(args, f"classify_phase{args.phase}"), \
+                metrics.timed("run_seconds", stage=f"classify_phase{args.phase}"):
+            await classifier.run(limit=args.limit, retry_failed=args.retry_failed)
+    except MCPServerDied as e:
+        logger.error(f"[!] {e}")
+        sys.exit(1)
+    exported = metrics.export(f"classify_phase{args.phase}")
+    if exported:
+        logger.info(f"[*] Metrics written to {exported[0]} and {exported[1]}")
+    if cassette is not None and cassette.replaying:
+        logger.info(f"[*] Cassette replay: {cassette.hits} hits, {cassette.misses} misses")
     
     # Auto-sync after classification run
     try:
@@ -1,12 +1,19 @@
 import sqlite3
 import json
+import math
 import os
 from datetime import datetime
 from pathlib import Path
 
+import tracing
+
 DATA_DIR = Path(__file__).parent.parent / "data"
 DB_PATH = DATA_DIR / "gallery.db"
 
+# URL prefix index.html serves the image directory under
+FRONTEND_IMAGE_ROOT = "img/"
+
+
 def init_db():
     "Initialize SQLite database and image table."
     DATA_DIR.mkdir(exist_ok=True)
@@ -27,6 +34,7 @@ def init_db():
         analysis_status TEXT DEFAULT 'pending',
         analyzed_at TIMESTAMP,
         error_message TEXT,
+        analysis_phase INTEGER,         -- highest phase completed (1 = classified, 2 = enriched)
         
         -- Organization state
         organization_status TEXT DEFAULT 'pending', -- pending | organized | error
@@ -39,6 +47,23 @@ def init_db():
         view_style TEXT,                -- line_drawing_bw, line_drawing_color, filled_color, shaded, photograph, painting
         orientation TEXT,               -- bow_left, bow_right, bow_up, bow_down
         bounds JSON,                    -- { x, y, width, height } if cropped
+        roi_boxes JSON,                 -- [{ x, y, width, height, kind, glyphs }] text regions for Phase 2 (views: in their crop)
+        parent_id TEXT,                 -- plate a view was split from (tools/split_views.py); shares its file
+
+        -- Web derivatives (tools/thumbnails.py), relative to the image directory
+        content_hash TEXT,              -- sha256 of the source file the derivatives were made from
+        thumb_path TEXT,
+        preview_path TEXT,
+        tiles_path TEXT,                -- Deep Zoom descriptor (.dzi) for very large plates (tools/tiles.py)
+
+        -- File facts from the image header (tools/probe_images.py); views get their bounds' size
+        width INTEGER,
+        height INTEGER,
+        format TEXT,                    -- Pillow format: JPEG, PNG, TIFF, ...
+        mode TEXT,                      -- Pillow mode: RGB, L, 1, ...
+        dpi REAL,
+        byte_size INTEGER,
+        mtime REAL,                     -- file modification time (epoch seconds) when probed
         
         -- Ship identification
         ship_type TEXT,                 -- battleship, cruiser, destroyer, submarine, carrier, auxiliary
@@ -85,6 +110,31 @@ def init_db():
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_status ON images(analysis_status)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_ship_type ON images(ship_type)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_navy ON images(navy)")
+
+    # One row per vision call on the escalation ladder (tools/escalation.py)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS analysis_attempts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        image_id TEXT NOT NULL,
+        phase INTEGER,                  -- highest phase the prompt covered
+        tier TEXT NOT NULL,             -- low_res | roi | full_res | reprompt
+        bytes_sent INTEGER,
+        confidence REAL,
+        missing_fields JSON,            -- required fields left null
+        accepted BOOLEAN,
+        error TEXT,
+        created_at TIMESTAMP
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attempts_image ON analysis_attempts(image_id)")
+
+    # Vision API calls per day (daily budget accounting)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS api_usage (
+        day TEXT PRIMARY KEY,           -- YYYY-MM-DD (local time)
+        calls INTEGER NOT NULL DEFAULT 0
+    )
+    """)
     
     conn.commit()
     conn.close()
@@ -119,6 +169,20 @@ def migrate_db():
         ("suitable_for_extraction", "BOOLEAN"),
         ("quality_issues", "JSON"),
         ("text_content", "JSON"),
+        ("analysis_phase", "INTEGER"),
+        ("roi_boxes", "JSON"),
+        ("content_hash", "TEXT"),
+        ("thumb_path", "TEXT"),
+        ("preview_path", "TEXT"),
+        ("tiles_path", "TEXT"),
+        ("parent_id", "TEXT"),
+        ("width", "INTEGER"),
+        ("height", "INTEGER"),
+        ("format", "TEXT"),
+        ("mode", "TEXT"),
+        ("dpi", "REAL"),
+        ("byte_size", "INTEGER"),
+        ("mtime", "REAL"),
     ]
     
     added = 0
@@ -137,10 +201,14 @@ def migrate_db():
         print(f"[*] Migration complete. Added {added} new columns.")
     else:
         print("[*] Database schema already up to date.")
-    
+
+    # Views are looked up by parent on every organize and sync
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_parent_id ON images(parent_id)")
+    conn.commit()
     conn.close()
 
 
+@tracing.traced("db.import_manifest")
 def import_manifest(manifest_path):
     "Import entries from JSON manifest into database."
     if not os.path.exists(manifest_path):
@@ -185,30 +253,174 @@ def import_manifest(manifest_path):
                 VALUES (?, ?, ?, ?, ?, ?, ?)
             """, (img_id, local_path, url, source, title, desc, date))
             new_count += 1
+
+        # Harvesters that probed their downloads pass the header facts along
+        probed = [col for col in PROBE_COLUMNS if entry.get(col) is not None]
+        if probed:
+            cursor.execute(f"UPDATE images SET {', '.join(f'{col} = ?' for col in probed)} WHERE id = ?",
+                           [entry[col] for col in probed] + [img_id])
             
     conn.commit()
     conn.close()
     print(f"[*] Manifest import complete. New: {new_count}, Updated: {update_count}")
 
 
-def get_pending(limit=None):
+# Header facts recorded by tools/probe_images.py (manifests may carry them too)
+PROBE_COLUMNS = ('width', 'height', 'format', 'mode', 'dpi', 'byte_size', 'mtime')
+
+# Columns stored as JSON text; ImageRecord decodes them on first access
+JSON_FIELDS = ('raw_response', 'bounds', 'roi_boxes', 'quality_issues', 'text_content')
+_JSON_FIELD_SET = frozenset(JSON_FIELDS)
+
+# Projections for the pipeline stages (columns missing from older databases are skipped)
+CLASSIFY_COLUMNS = ('id', 'local_path', 'source', 'parent_id', 'bounds', 'roi_boxes', 'width', 'height')
+ORGANIZE_COLUMNS = ('id', 'local_path', 'navy', 'ship_type', 'view_type', 'ship_name')
+
+# Records that own their file. Views split from a plate (parent_id set) share
+# the plate's file, header facts and derivatives, so per-file tools skip them.
+PLATE_FILES = "local_path IS NOT NULL AND local_path != '' AND parent_id IS NULL"
+
+
+def _decode_json(value):
+    "Parse a JSON column, leaving legacy non-JSON text as-is."
+    try:
+        return json.loads(value)
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return value
+
+
+class ImageRecord:
+    """
+    Read-only row of the images table.
+
+    Stores the raw row tuple and a column index shared by every row of the
+    query, instead of a dict per row. Behaves like a mapping (`record['id']`,
+    `record.get('navy', 'Unknown')`, `dict(record)`) and allows attribute
+    access. JSON columns are decoded on first access and cached.
+    """
+
+    __slots__ = ('_index', '_values', '_decoded')
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+        self._decoded = None
+
+    def __getitem__(self, key):
+        value = self._values[self._index[key]]
+        if key in _JSON_FIELD_SET and value and isinstance(value, str):
+            if self._decoded is None:
+                self._decoded = {}
+            if key not in self._decoded:
+                self._decoded[key] = _decode_json(value)
+            return self._decoded[key]
+        return value
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def get(self, key, default=None):
+        return self[key] if key in self._index else default
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def keys(self):
+        return self._index.keys()
+
+    def items(self):
+        return [(key, self[key]) for key in self._index]
+
+    def to_dict(self):
+        "Plain dict with JSON columns decoded."
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, ImageRecord):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return f"ImageRecord({self.to_dict()!r})"
+
+
+def _table_columns(conn):
+    return {row[1] for row in conn.execute("PRAGMA table_info(images)")}
+
+
+def select_images(where="1", params=(), columns=None, limit=None, order_by=None):
+    """
+    Query the images table, returning ImageRecords.
+
+    `columns` projects the SELECT onto those columns (unknown ones are
+    dropped, so callers can ask for columns newer databases have); None
+    selects every column.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        if columns is None:
+            projection = "*"
+        else:
+            available = _table_columns(conn)
+            projection = ", ".join(c for c in columns if c in available)
+        query = f"SELECT {projection} FROM images WHERE {where}"
+        params = list(params)
+        if order_by:
+            query += f" ORDER BY {order_by}"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        cursor = conn.execute(query, params)
+        index = {d[0]: i for i, d in enumerate(cursor.description)}
+        return [ImageRecord(index, row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def get_pending(limit=None, columns=None):
     "Get images with 'pending' analysis status."
+    return select_images("analysis_status = 'pending'", columns=columns, limit=limit)
+
+
+def get_failed(limit=None, columns=None):
+    "Get images with 'failed' analysis status."
+    return select_images("analysis_status = 'failed'", columns=columns, limit=limit)
+
+
+def get_api_usage(day=None):
+    "Number of vision API calls made on a day (default: today)."
+    day = day or datetime.now().date().isoformat()
     conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
-    
-    query = "SELECT * FROM images WHERE analysis_status = 'pending'"
-    params = []
-    if limit:
-        query += " LIMIT ?"
-        params.append(limit)
-        
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
+    cursor.execute("SELECT calls FROM api_usage WHERE day = ?", (day,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+
+def record_api_calls(count=1, day=None):
+    "Add vision API calls to a day's usage (default: today)."
+    day = day or datetime.now().date().isoformat()
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO api_usage (day, calls) VALUES (?, ?)
+        ON CONFLICT(day) DO UPDATE SET calls = calls + excluded.calls
+    """, (day, count))
+    conn.commit()
     conn.close()
-    return [dict(row) for row in rows]
 
 
+@tracing.traced("db.save_analysis", image_arg=0)
 def save_analysis(img_id, results, error=None):
     "Save analysis results or error."
     conn = sqlite3.connect(DB_PATH)
@@ -247,7 +459,9 @@ def save_analysis(img_id, results, error=None):
             'propulsion', 'armor', 'speed', 'complement',
             'launch_date', 'commission_date',
             # Metadata
-            'reasoning', 'confidence', 'notes'
+            'reasoning', 'confidence', 'notes',
+            # Pipeline state
+            'analysis_phase'
         ]
         
         for col in valid_columns:
@@ -255,7 +469,7 @@ def save_analysis(img_id, results, error=None):
                 update_fields[col] = results[col]
         
         # Handle JSON fields
-        json_fields = ['bounds', 'quality_issues', 'text_content']
+        json_fields = ['bounds', 'roi_boxes', 'quality_issues', 'text_content']
         for col in json_fields:
             if col in results and results[col] is not None:
                 update_fields[col] = json.dumps(results[col])
@@ -275,26 +489,86 @@ def save_analysis(img_id, results, error=None):
     conn.close()
 
 
-def get_ready_to_organize(limit=None):
-    "Get images that are complete but not yet organized."
+def save_roi_boxes(img_id, boxes):
+    "Store layout-analysis crop boxes ([] means analyzed, nothing found)."
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE images SET roi_boxes = ? WHERE id = ?", (json.dumps(boxes), img_id))
+    conn.commit()
+    conn.close()
+
+
+def save_bounds(img_id, bounds):
+    "Store the content box found by margin trimming ({x, y, width, height}, full resolution)."
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE images SET bounds = ? WHERE id = ?", (json.dumps(bounds), img_id))
+    conn.commit()
+    conn.close()
+
+
+def record_attempt(img_id, phase, tier, bytes_sent, confidence=None, missing=None, accepted=False, error=None):
+    "Record one vision call on the escalation ladder."
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO analysis_attempts
+            (image_id, phase, tier, bytes_sent, confidence, missing_fields, accepted, error, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (img_id, phase, tier, bytes_sent, confidence, json.dumps(missing or []), accepted, error,
+          datetime.now().isoformat()))
+    conn.commit()
+    conn.close()
+
+
+def get_tier_usage(phase=None):
+    """
+    Summarize analysis_attempts per escalation tier.
+
+    'resolved' counts images whose final attempt was on that tier.
+    """
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
-    
-    query = "SELECT * FROM images WHERE analysis_status = 'complete' AND organization_status = 'pending'"
-    params = []
-    if limit:
-        query += " LIMIT ?"
-        params.append(limit)
-        
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
+    where = "WHERE phase = ?" if phase else ""
+    params = [phase] if phase else []
+
+    cursor.execute(f"""
+        SELECT tier, COUNT(*) AS calls, COUNT(DISTINCT image_id) AS images,
+               COALESCE(AVG(bytes_sent), 0) AS avg_bytes
+        FROM analysis_attempts {where}
+        GROUP BY tier
+        ORDER BY MIN(id)
+    """, params)
+    tiers = [dict(row) for row in cursor.fetchall()]
+
+    cursor.execute(f"""
+        SELECT tier, COUNT(*) AS resolved FROM analysis_attempts
+        WHERE id IN (SELECT MAX(id) FROM analysis_attempts {where} GROUP BY image_id, phase)
+        GROUP BY tier
+    """, params)
+    resolved = {row['tier']: row['resolved'] for row in cursor.fetchall()}
+    for row in tiers:
+        row['resolved'] = resolved.get(row['tier'], 0)
+
+    cursor.execute(f"""
+        SELECT COUNT(DISTINCT image_id) AS images, COUNT(*) AS calls, COALESCE(SUM(bytes_sent), 0) AS bytes
+        FROM analysis_attempts {where}
+    """, params)
+    totals = dict(cursor.fetchone())
     conn.close()
-    return [dict(row) for row in rows]
+    return {"tiers": tiers, "totals": totals}
+
+
+def get_ready_to_organize(limit=None, columns=None):
+    "Get images that are complete but not yet organized."
+    # Views are not organized on their own: they move with their parent's file
+    return select_images("analysis_status = 'complete' AND organization_status = 'pending' AND parent_id IS NULL",
+                         columns=columns, limit=limit)
 
 
 def update_organization(img_id, new_path, status='organized'):
-    "Update organization status and physical path."
+    "Update organization status and physical path (views split from the image follow the path)."
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute("""
@@ -303,61 +577,174 @@ def update_organization(img_id, new_path, status='organized'):
             local_path = ?
         WHERE id = ?
     """, (status, new_path, img_id))
+    cursor.execute("UPDATE images SET local_path = ? WHERE parent_id = ?", (new_path, img_id))
     conn.commit()
     conn.close()
 
 
-def export_manifest(output_path):
-    "Export all images to JSON manifest."
+def replace_local_path(old_path, new_path):
+    "Point every record stored at old_path to new_path, in one transaction; returns the rows changed."
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.execute("UPDATE images SET local_path = ? WHERE local_path = ?", (new_path, old_path))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount
+
+
+def _scale_box(box, sx, sy, frame):
+    "{x, y, width, height, ...} scaled by (sx, sy), rounded outwards and kept inside frame (w, h)."
+    x0, y0 = max(0, math.floor(box['x'] * sx)), max(0, math.floor(box['y'] * sy))
+    x1 = min(frame[0], math.ceil((box['x'] + box['width']) * sx))
+    y1 = min(frame[1], math.ceil((box['y'] + box['height']) * sy))
+    return {**box, 'x': x0, 'y': y0, 'width': max(1, x1 - x0), 'height': max(1, y1 - y0)}
+
+
+def rescale_boxes(local_path, old_size, new_size):
+    """
+    Scale the stored pixel geometry of every record at local_path after its
+    file was resized from old_size to new_size (w, h): `bounds` (and a
+    view's width and height) and `roi_boxes`, which views keep relative to
+    their crop. Returns the rows changed.
+    """
+    sx, sy = new_size[0] / old_size[0], new_size[1] / old_size[1]
+    conn = sqlite3.connect(DB_PATH)
+    rows = conn.execute("""
+        SELECT id, parent_id, bounds, roi_boxes FROM images
+        WHERE local_path = ? AND (bounds IS NOT NULL OR roi_boxes IS NOT NULL)
+    """, (local_path,)).fetchall()
+    updates = []
+    for img_id, parent_id, bounds, roi_boxes in rows:
+        bounds = json.loads(bounds) if bounds else None
+        roi_boxes = json.loads(roi_boxes) if roi_boxes else roi_boxes
+        frame = tuple(new_size)
+        if bounds:
+            bounds = _scale_box(bounds, sx, sy, frame)
+            if parent_id is not None:
+                frame = (bounds['width'], bounds['height'])
+        if roi_boxes:
+            roi_boxes = [_scale_box(box, sx, sy, frame) for box in roi_boxes]
+        size = (bounds['width'], bounds['height']) if bounds and parent_id is not None else (None, None)
+        updates.append((json.dumps(bounds) if bounds else None,
+                        json.dumps(roi_boxes) if roi_boxes is not None else None,
+                        size[0], size[1], img_id))
+    conn.executemany("""
+        UPDATE images SET bounds = ?, roi_boxes = ?,
+            width = COALESCE(?, width), height = COALESCE(?, height)
+        WHERE id = ?
+    """, updates)
+    conn.commit()
+    conn.close()
+    return len(updates)
+
+
+def save_derivatives(rows):
+    "Record web derivatives: rows of (img_id, content_hash, thumb_path, preview_path)."
+    conn = sqlite3.connect(DB_PATH)
+    conn.executemany("""
+        UPDATE images SET
+            content_hash = ?,
+            thumb_path = ?,
+            preview_path = ?
+        WHERE id = ?
+    """, [(content_hash, thumb, preview, img_id) for img_id, content_hash, thumb, preview in rows])
+    conn.commit()
+    conn.close()
+
+
+def save_tiles(rows):
+    "Record Deep Zoom pyramids: rows of (img_id, tiles_path), tiles_path None for untiled images."
+    conn = sqlite3.connect(DB_PATH)
+    conn.executemany("UPDATE images SET tiles_path = ? WHERE id = ?",
+                     [(tiles_path, img_id) for img_id, tiles_path in rows])
+    conn.commit()
+    conn.close()
+
+
+def save_probes(rows):
+    "Record header facts: rows of (local_path, {column: value}) with PROBE_COLUMNS keys."
+    conn = sqlite3.connect(DB_PATH)
+    conn.executemany(f"""
+        UPDATE images SET {', '.join(f'{col} = ?' for col in PROBE_COLUMNS)}
+        WHERE local_path = ? AND parent_id IS NULL
+    """, [[info.get(col) for col in PROBE_COLUMNS] + [local_path] for local_path, info in rows])
+    conn.commit()
+    conn.close()
+
+
+def save_views(splits):
+    """
+    Record views split from multi-view plates: splits of (parent_id,
+    [bounds, ...]). A plate's earlier views are replaced; the new ones are
+    `<parent_id>_v<n>`, share the parent's file and metadata and are
+    pending analysis.
+    """
     conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM images")
-    rows = cursor.fetchall()
+    for parent_id, views in splits:
+        cursor.execute("DELETE FROM images WHERE parent_id = ?", (parent_id,))
+        cursor.executemany("""
+            INSERT INTO images (id, parent_id, bounds, width, height,
+                                local_path, url, source, title, desc, date, format, mode, dpi)
+            SELECT ?, id, ?, ?, ?, local_path, url, source, title, desc, date, format, mode, dpi
+            FROM images WHERE id = ?
+        """, [(f"{parent_id}_v{n}", json.dumps(bounds), bounds['width'], bounds['height'], parent_id)
+              for n, bounds in enumerate(views, 1)])
+    conn.commit()
     conn.close()
-    
-    data = [dict(row) for row in rows]
-    
-    # Parse JSON fields for export
-    json_fields = ['raw_response', 'bounds', 'quality_issues', 'text_content']
-    for entry in data:
-        for field in json_fields:
-            if entry.get(field):
-                try:
-                    entry[field] = json.loads(entry[field])
-                except:
-                    pass
+
+
+def export_manifest(output_path):
+    "Export all images to JSON manifest."
+    # Records decode JSON fields for export
+    data = [record.to_dict() for record in select_images()]
 
     with open(output_path, 'w') as f:
         json.dump(data, f, indent=2)
     print(f"[*] Manifest exported to {output_path}")
 
 
-def sync_frontend():
-    "Export all analyzed images to images.js for the frontend."
-    output_path = DATA_DIR / "images.js"
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM images WHERE analysis_status = 'complete'")
+def sync_frontend(atlas=None, atlas_format="webp", atlas_workers=None):
+    """
+    Export all analyzed images to images.js for the frontend.
 
-    rows = cursor.fetchall()
-    conn.close()
-    
-    data = [dict(row) for row in rows]
-    
-    # Parse JSON fields for frontend use
-    json_fields = ['raw_response', 'bounds', 'quality_issues', 'text_content']
-    for entry in data:
-        for field in json_fields:
-            if entry.get(field):
-                try:
-                    entry[field] = json.loads(entry[field])
-                except (json.JSONDecodeError, TypeError, ValueError):
-                    # If the field is not valid JSON or has an unexpected type, leave it as-is
-                    # This gracefully handles legacy data or non-JSON fields
-                    pass
+    With `atlas` (default: NAVAL_GALLERY_ATLAS=1), thumbnails are also packed
+    into sprite sheets in grid order (tools/sprite_atlas.py) and each record
+    gets its cell as `atlas`.
 
+    Views split from a plate are not cards of their own; the plate lists
+    them as `views` ({id, bounds, view_type}).
+    """
+    output_path = DATA_DIR / "images.js"
+    # Records decode JSON fields for frontend use (legacy non-JSON text is left as-is)
+    data = [record.to_dict() for record in select_images("analysis_status = 'complete' AND parent_id IS NULL")]
+    views = {}
+    for view in select_images("parent_id IS NOT NULL", columns=('id', 'parent_id', 'bounds', 'view_type'),
+                              order_by="rowid"):
+        views.setdefault(view['parent_id'], []).append(
+            {'id': view['id'], 'bounds': view['bounds'], 'view_type': view['view_type']})
+    for entry in data:
+        if entry['id'] in views:
+            entry['views'] = views[entry['id']]
+        # index.html prefers these over the full-resolution local_path
+        if entry.get('thumb_path'):
+            entry['thumb'] = FRONTEND_IMAGE_ROOT + entry['thumb_path']
+        if entry.get('preview_path'):
+            entry['full'] = FRONTEND_IMAGE_ROOT + entry['preview_path']
+        if entry.get('tiles_path'):
+            entry['tiles'] = FRONTEND_IMAGE_ROOT + entry['tiles_path']
+
+    if atlas is None:
+        atlas = os.environ.get("NAVAL_GALLERY_ATLAS") == "1"
+    if atlas and data:
+        # Imported here: needs Pillow and the image directory, plain syncs need neither
+        import sprite_atlas
+        from config import get_image_dir
+        members = [(e['id'], e.get('local_path'), e.get('thumb_path'), e.get('content_hash')) for e in data]
+        cells = sprite_atlas.build_atlases(members, get_image_dir(), fmt=atlas_format, workers=atlas_workers)
+        for entry in data:
+            cell = cells.get(entry['id'])
+            if cell:
+                entry['atlas'] = dict(cell, sheet=FRONTEND_IMAGE_ROOT + cell['sheet'])
 
     with open(output_path, 'w') as f:
         # Basic XSS protection: escape </script> tags in JSON
@@ -368,16 +755,23 @@ def sync_frontend():
 
 
 
-def get_phase2_pending(limit=None):
+# ship_type values that mean Phase 1 did not find a ship (mirrored in get_phase2_pending)
+NON_SHIP_PREFIXES = ('n/a', 'not ', 'civil coding', 'indeterminate')
+
+
+def is_ship_type(ship_type):
+    "True if a Phase 1 ship_type names an actual vessel."
+    if not ship_type:
+        return False
+    value = str(ship_type).strip().lower()
+    return value != 'unknown' and not value.startswith(NON_SHIP_PREFIXES)
+
+
+def get_phase2_pending(limit=None, columns=None):
     "Get images ready for Phase 2 enrichment (valid ships, Phase 1 complete)."
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
     # Filter for completed items that are valid ships but missing Phase 2 data
-    query = """
-        SELECT * FROM images 
-        WHERE analysis_status = 'complete' 
+    where = """
+        analysis_status = 'complete'
         AND (
             ship_type NOT LIKE 'N/A%'
             AND ship_type NOT LIKE 'Not %'
@@ -386,39 +780,15 @@ def get_phase2_pending(limit=None):
             AND ship_type NOT LIKE 'Indeterminate%'
         )
         AND ship_class IS NULL -- Phase 2 field
+        AND (analysis_phase IS NULL OR analysis_phase < 2) -- not enriched in a combined pass
     """
-    params = []
-    if limit:
-        query += " LIMIT ?"
-        params.append(limit)
-        
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    return select_images(where, columns=columns, limit=limit)
 
 
-def get_extraction_candidates(tier_max=3, limit=None):
+def get_extraction_candidates(tier_max=3, limit=None, columns=None):
     """Get images suitable for extraction (Tier 1-3 by default)."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    query = """
-        SELECT * FROM images 
-        WHERE suitable_for_extraction = 1
-        AND extraction_tier <= ?
-        ORDER BY extraction_tier ASC
-    """
-    params = [tier_max]
-    if limit:
-        query += " LIMIT ?"
-        params.append(limit)
-        
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    return select_images("suitable_for_extraction = 1 AND extraction_tier <= ?", [tier_max],
+                         columns=columns, limit=limit, order_by="extraction_tier ASC")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Confidence-driven escalation ladder for vision analysis.
+
+Most plates are answered confidently from a small image, so every image
+starts with the cheapest call. It moves up a tier only when the answer is
+not good enough, i.e. `confidence` is below the threshold or a required
+field came back null:
+
+    low_res   downscaled JPEG (1024 px)               cheapest upload (Phase 1 only)
+    roi       overview + annotation crops (Phase 2)    see tools/layout.py
+    full_res  the original plate
+    reprompt  best image again, naming the missing fields
+
+Phase 2 reads specification tables and annotation text, which a 1024 px
+copy cannot resolve, so its ladder starts at roi. Specifications are often
+simply absent from a plate, so a null ship_class does not escalate on its
+own; a low confidence does.
+
+Tiers that would resend the same bytes (a plate already smaller than the
+low-res size, a plate with no text regions) are skipped. Every call is
+recorded in the `analysis_attempts` table; `--report` prints how often each
+tier was used and what it cost.
+
+Usage:
+    python tools/escalation.py --report
+"""
+
+import os
+import sys
+import argparse
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import db
+import imaging
+
+LOW_RES = "low_res"
+ROI = "roi"
+FULL_RES = "full_res"
+REPROMPT = "reprompt"
+
+# Ladder per phase reached by the prompt (2 = prompt reads specifications)
+LADDERS = {
+    1: (LOW_RES, FULL_RES, REPROMPT),
+    2: (ROI, FULL_RES, REPROMPT),
+}
+
+# Without escalation: one call, with annotation crops where they apply
+SINGLE_CALL = {
+    1: (FULL_RES,),
+    2: (ROI, FULL_RES),
+}
+
+REQUIRED_FIELDS = {
+    1: ("image_type", "view_type", "ship_type", "extraction_tier"),
+    2: (),
+}
+
+DEFAULT_THRESHOLD = 0.7
+LOW_RES_MAX_SIDE = 1024
+LOW_RES_QUALITY = 80
+
+REPROMPT_NOTE = """
+A previous look at this image left these fields empty or uncertain: {fields}.
+Examine the image again, paying particular attention to labels, title blocks and
+annotation text, and fill them in if they are visible.
+"""
+
+
+@dataclass
+class Attempt:
+    "One vision call on the ladder."
+    tier: str
+    bytes_sent: int = 0
+    data: Optional[dict] = None
+    confidence: Optional[float] = None
+    missing: List[str] = field(default_factory=list)
+    accepted: bool = False
+    error: Optional[str] = None
+    raw_response: Optional[dict] = None
+    warnings: List[str] = field(default_factory=list)
+
+
+class EscalationPolicy:
+    """
+    Decides which tiers to try and when an answer is good enough.
+
+    threshold: minimum confidence to accept an answer.
+    required:  per-phase fields that must be non-null to accept.
+    escalate:  False gives the old single-call behaviour (every answer is accepted).
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD,
+                 required: Optional[Dict[int, Sequence[str]]] = None, escalate: bool = True):
+        self.threshold = threshold
+        self.required = REQUIRED_FIELDS if required is None else required
+        self.escalate = escalate
+
+    def ladder(self, reached: int) -> Tuple[str, ...]:
+        return (LADDERS if self.escalate else SINGLE_CALL)[reached]
+
+    def missing(self, data: dict, phases: Sequence[int]) -> List[str]:
+        "Required fields left null, for a prompt covering the given phases."
+        required = []
+        for phase in phases:
+            if phase == 2 and 1 in phases and not db.is_ship_type(data.get("ship_type")):
+                continue  # combined pass on a non-ship: specifications are not expected
+            required += [f for f in self.required.get(phase, ()) if f not in required]
+        return [f for f in required if data.get(f) is None]
+
+    def judge(self, attempt: Attempt, phases: Sequence[int]) -> Attempt:
+        "Fill in confidence, missing fields and the accept decision."
+        data = attempt.data or {}
+        attempt.confidence = data.get("confidence")
+        attempt.missing = self.missing(data, phases)
+        if not self.escalate:
+            attempt.accepted = True
+        else:
+            confident = attempt.confidence is not None and attempt.confidence >= self.threshold
+            attempt.accepted = confident and not attempt.missing
+        return attempt
+
+    @staticmethod
+    def best(attempts: List[Attempt]) -> Optional[Attempt]:
+        "Accepted answer if any, otherwise the most complete and confident one."
+        answered = [a for a in attempts if a.data is not None]
+        if not answered:
+            return None
+        return max(answered, key=lambda a: (a.accepted, -len(a.missing), a.confidence or 0.0))
+
+
+def reprompt(prompt: str, attempt: Attempt, threshold: float) -> str:
+    "Prompt for the re-prompt tier, naming what the previous answer lacked."
+    fields = list(attempt.missing)
+    if attempt.confidence is not None and attempt.confidence < threshold:
+        fields.append("ship identification (low confidence)")
+    if not fields:
+        fields.append("the whole answer (previous reply was not valid JSON)")
+    return REPROMPT_NOTE.format(fields=", ".join(fields)) + prompt
+
+
+def downscale(image_path, output_path, max_side: int = LOW_RES_MAX_SIDE,
+              quality: int = LOW_RES_QUALITY) -> Optional[Path]:
+    """
+    Write a low-resolution JPEG of a plate for the first tier.
+
+    Returns None when the result would not be smaller than the original, in
+    which case the original is the cheapest thing to send.
+    """
+    image_path, output_path = Path(image_path), Path(output_path)
+    size, mode, fmt = imaging.probe(image_path)
+    if max(size) <= max_side and fmt == "JPEG":
+        return None
+    img = imaging.load(image_path, max_side=max_side, mode=imaging.jpeg_mode(mode))
+    img.save(output_path, "JPEG", quality=quality)
+    if output_path.stat().st_size >= image_path.stat().st_size:
+        output_path.unlink()
+        return None
+    return output_path
+
+
+# ----------------------------------------------------------------------------
+# Report
+# ----------------------------------------------------------------------------
+
+def format_report(usage: dict) -> str:
+    "Render db.get_tier_usage() as a table."
+    totals = usage["totals"]
+    lines = []
+    if not totals["images"]:
+        return "No analysis attempts recorded."
+    lines.append(f"{'tier':<10}{'calls':>8}{'images':>8}{'% imgs':>8}{'resolved':>10}{'avg KB':>10}")
+    for row in usage["tiers"]:
+        share = 100.0 * row["images"] / totals["images"]
+        lines.append(f"{row['tier']:<10}{row['calls']:>8}{row['images']:>8}{share:>7.1f}%"
+                     f"{row['resolved']:>10}{row['avg_bytes'] / 1024:>10.1f}")
+    lines.append("")
+    lines.append(f"Images: {totals['images']} | calls/image: {totals['calls'] / totals['images']:.2f} | "
+                 f"KB/image: {totals['bytes'] / totals['images'] / 1024:.1f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Escalation ladder tier usage")
+    parser.add_argument("--report", action="store_true", help="Print how often each tier was used")
+    parser.add_argument("--phase", type=int, choices=[1, 2], default=None, help="Only attempts for this phase")
+    args = parser.parse_args()
+
+    if args.report:
+        print(format_report(db.get_tier_usage(phase=args.phase)))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ import re
 # Add parent to path for config import
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import get_staging_dir, get_relative_path, validate_config, DATA_DIR
+import metrics
+import profiling
 
 # Blueprints Crawler
 # Targets NavSource (respectfully) for specific class pages
@@ -64,9 +66,11 @@ def run():
                 
                 if not path.exists():
                     print(f"    [+] Found Plan: {filename}")
-                    ir = requests.get(img_url, headers={'User-Agent': USER_AGENT})
-                    with open(path, 'wb') as f:
-                        f.write(ir.content)
+                    ir = metrics.instrumented_get(img_url, "blueprints", image_id=filename.split('.')[0], path=path,
+                                                  headers={'User-Agent': USER_AGENT})
+                    if ir.status_code != 200:
+                        print(f"    [!] Download failed: {ir.status_code}")
+                        continue
                         
                 manifest.append({
                     "id": filename.split(".")[0],
@@ -82,6 +86,7 @@ def run():
         
     with open(DATA_DIR / "blueprints_manifest.json", "w") as f:
         json.dump(manifest, f, indent=2)
+    metrics.export("harvest_blueprints")
 
 if __name__ == "__main__":
-    run()
+    profiling.run_cli(run, "blueprints_crawler")
@@ -8,6 +8,9 @@ import xml.etree.ElementTree as ET
 # Add parent to path for config import
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import get_staging_dir, get_relative_path, validate_config, DATA_DIR
+import metrics
+import profiling
+import probe_images
 
 # Deep Archivist
 # Enhanced version of the pilot script
@@ -74,14 +77,19 @@ def run():
                 path = STAGING_DIR / filename
                 if not path.exists():
                     print(f"    [+] Downloading {c['id']} ({c['url']})")
-                    img_r = requests.get(c['url'], timeout=15)
-                    if img_r.status_code == 200:
-                        with open(path, 'wb') as f:
-                            f.write(img_r.content)
-                    else:
+                    img_r = metrics.instrumented_get(c['url'], "ia", image_id=c['id'], path=path, timeout=15)
+                    if img_r.status_code != 200:
                         print(f"    [!] Download failed: {img_r.status_code}")
                         continue
                 c['local_path'] = get_relative_path("ia", filename)
+                # Scandata sizes describe the original scan, not the page served; record the real ones
+                try:
+                    c.update(probe_images.probe_file(path))
+                except Exception as e:
+                    # Remove it, or the exists() check above skips the re-download forever
+                    print(f"    [!] Unreadable download {c['id']}: {e}")
+                    path.unlink(missing_ok=True)
+                    continue
                 manifest.append(c)
                 
             count += 1
@@ -91,6 +99,7 @@ def run():
             
     with open(DATA_DIR / "ia_manifest.json", "w") as f:
         json.dump(manifest, f, indent=2)
+    metrics.export("harvest_ia")
 
 if __name__ == "__main__":
-    run()
+    profiling.run_cli(run, "deep_archivist")
@@ -9,6 +9,8 @@ from urllib.parse import urljoin
 # Add parent to path for config import
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import get_staging_dir, get_relative_path, validate_config, DATA_DIR
+import metrics
+import profiling
 
 # Dreadnought Project Scraper
 # Targets http://www.dreadnoughtproject.org for high-quality WWI ship plans
@@ -81,11 +83,9 @@ def run():
             print(f"    [{idx+1}/{len(found_images)}] Downloading {filename}...")
             try:
                 time.sleep(1.5)  # Polite delay
-                ir = requests.get(img_url, headers={'User-Agent': USER_AGENT}, timeout=20)
+                ir = metrics.instrumented_get(img_url, "dreadnought", image_id=f"tdp_{safe_id}", path=path,
+                                              headers={'User-Agent': USER_AGENT}, timeout=20)
                 if ir.status_code == 200:
-                    with open(path, 'wb') as f:
-                        f.write(ir.content)
-                    
                     if path.stat().st_size > 1000:
                         manifest.append({
                             "id": f"tdp_{safe_id}",
@@ -98,6 +98,7 @@ def run():
                 else:
                     print(f"    [!] HTTP {ir.status_code}: {img_url}")
             except Exception as e:
+                metrics.error("download", e)
                 print(f"    [!] Download error: {e}")
                 
     except Exception as e:
@@ -106,6 +107,7 @@ def run():
     print(f"[*] Scrape complete. {len(manifest)} images in manifest.")
     with open(DATA_DIR / "dreadnought_manifest.json", "w") as f:
         json.dump(manifest, f, indent=2)
+    metrics.export("harvest_dreadnought")
 
 if __name__ == "__main__":
-    run()
+    profiling.run_cli(run, "dreadnought_scraper")
@@ -7,6 +7,8 @@ import xml.etree.ElementTree as ET
 # Add parent to path for config import
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import get_staging_dir, get_relative_path, validate_config, DATA_DIR
+import metrics
+import profiling
 
 # ONI Manual Siphon
 # Targets known WWII ONI Recognition Manuals on Internet Archive
@@ -66,12 +68,13 @@ def download(item, staging_dir):
         return item
         
     try:
-        r = requests.get(item['url'], timeout=15)
-        with open(path, 'wb') as f:
-            f.write(r.content)
+        r = metrics.instrumented_get(item['url'], "oni", image_id=item['id'], path=path, timeout=15)
+        if r.status_code != 200:
+            return None
         item['local_path'] = get_relative_path("oni", filename)
         return item
-    except:
+    except Exception as e:
+        metrics.error("download", e)
         return None
 
 def run():
@@ -101,6 +104,7 @@ def run():
             
     with open(DATA_DIR / "oni_manifest.json", "w") as f:
         json.dump(all_manifest, f, indent=2)
+    metrics.export("harvest_oni")
 
 if __name__ == "__main__":
-    run()
+    profiling.run_cli(run, "manual_siphon")
@@ -6,6 +6,8 @@ import sys
 # Add parent to path for config import
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import get_staging_dir, get_relative_path, validate_config, DATA_DIR
+import metrics
+import profiling
 
 # Official Channels
 # Library of Congress API
@@ -63,9 +65,10 @@ def run():
                 
                 if not path.exists():
                     print(f"    [+] Downloading {title[:30]}...")
-                    ir = requests.get(best_url, timeout=15)
-                    with open(path, 'wb') as f:
-                        f.write(ir.content)
+                    ir = metrics.instrumented_get(best_url, "loc", image_id=f"loc_{pk}", path=path, timeout=15)
+                    if ir.status_code != 200:
+                        print(f"    [!] Download failed: {ir.status_code}")
+                        continue
                         
                 manifest.append({
                     "id": f"loc_{pk}",
@@ -83,6 +86,7 @@ def run():
             
     except Exception as e:
         print(f"[!] LoC API Error: {e}")
+    metrics.export("harvest_loc")
 
 if __name__ == "__main__":
-    run()
+    profiling.run_cli(run, "official_channels")
@@ -9,7 +9,6 @@ Requires: playwright (install with `uv add playwright` then `uv run playwright i
 import os
 import sys
 import json
-import requests
 import time
 import asyncio
 from typing import List, Dict, Optional
@@ -19,6 +18,8 @@ from playwright.async_api import async_playwright
 # Add parent to path for config import
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import get_staging_dir, get_relative_path, validate_config, DATA_DIR
+import metrics
+import profiling
 
 @dataclass
 class PinData:
@@ -179,10 +180,9 @@ class PinterestHarvester:
                 
                 # Download image
                 if not filepath.exists():
-                    response = requests.get(image_url, headers=self.headers, timeout=30)
+                    response = metrics.instrumented_get(image_url, "pinterest", image_id=f"pinterest_{pin.id}",
+                                                        path=filepath, headers=self.headers, timeout=30)
                     if response.status_code == 200:
-                        with open(filepath, 'wb') as f:
-                            f.write(response.content)
                         print(f"[+] Downloaded: {filename}")
                     else:
                         print(f"[-] Failed to download: {pin.image_url}")
@@ -204,6 +204,7 @@ class PinterestHarvester:
                 await asyncio.sleep(1)
                 
             except Exception as e:
+                metrics.error("download", e)
                 print(f"[!] Error processing pin {pin.id}: {e}")
                 continue
         
@@ -306,10 +307,11 @@ async def main():
     print("\n=== PINTEREST HARVEST COMPLETE ===")
     for key, value in results.items():
         print(f"{key}: {value}")
+    metrics.export("harvest_pinterest")
 
 def run():
     """Entry point for run_all.py compatibility"""
     asyncio.run(main())
 
 if __name__ == "__main__":
-    run()
+    profiling.run_cli(run, "pinterest_scraper")
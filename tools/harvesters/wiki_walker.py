@@ -7,6 +7,8 @@ import re
 # Add parent to path for config import
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import get_staging_dir, get_relative_path, validate_config, DATA_DIR
+import metrics
+import profiling
 
 # Wikimedia Commons Harvester
 # Targets "Ship_plans" categories
@@ -112,16 +114,16 @@ def download_file(item, staging_dir):
     print(f"[+] Downloading: {item['title']} from {item['url']}")
     headers = {"User-Agent": USER_AGENT}
     try:
-        r = requests.get(item['url'], headers=headers, timeout=20)
+        r = metrics.instrumented_get(item['url'], "wiki", image_id=item['id'], path=path,
+                                     headers=headers, timeout=20)
         if r.status_code == 200:
-            with open(path, 'wb') as f:
-                f.write(r.content)
             item['local_path'] = get_relative_path("wiki", filename)
             return item
         else:
             print(f"[!] Download failed for {item['id']}: Status {r.status_code}")
             return None
     except Exception as e:
+        metrics.error("download", e)
         print(f"[!] Download exception for {item['id']}: {e}")
         return None
 
@@ -156,6 +158,7 @@ def run():
         
     with open(DATA_DIR / "wiki_manifest.json", "w") as f:
         json.dump(manifest, f, indent=2)
+    metrics.export("harvest_wiki")
 
 if __name__ == "__main__":
-    run()
+    profiling.run_cli(run, "wiki_walker")
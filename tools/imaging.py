@@ -0,0 +1,235 @@
+"""
+Memory-capped image decoding for the tools that downscale plates.
+
+Internet Archive plates run 4000-9000 px wide; decoding one at native
+resolution costs hundreds of MB before anything is resized. `load` decodes
+only what the caller needs:
+
+- JPEG: `draft()` makes libjpeg decode at 1/2, 1/4 or 1/8 scale in the DCT
+  domain, so a 9000 px plate destined for 1600 px never exists at full size.
+- Other formats: the full image is decoded, then `reduce()` (box reduction,
+  via `resize(reducing_gap=...)`) brings it near the target cheaply before
+  the final high-quality resample.
+
+Every decode is checked against a byte budget *before* pixels are decoded
+(DECODE_BUDGET_MB, env NAVAL_GALLERY_DECODE_BUDGET_MB). A JPEG over budget
+is drafted down until it fits; anything else over budget raises
+ImageTooLarge, so one 200-megapixel scan cannot exhaust a worker pool.
+
+The batch tools fan files out with `map_in_pool`, which shares one
+--memory-mb across the pool: each worker process gets an equal slice as
+its decode budget.
+
+Pillow refuses to open images over twice Image.MAX_IMAGE_PIXELS (~179 MP
+by default). `load`, `probe` and `open_image` raise that limit to
+MAX_SOURCE_PIXELS for the duration of the open only; the process-wide
+default is left alone.
+
+Usage:
+    from imaging import load
+    img = load(path, max_side=1600, mode="L")   # img.info["source_size"] is the original size
+"""
+
+import os
+import math
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+from PIL import Image
+
+DECODE_BUDGET_MB = float(os.environ.get("NAVAL_GALLERY_DECODE_BUDGET_MB", 512))
+DECODE_BUDGET_BYTES = int(DECODE_BUDGET_MB * 1024 * 1024)
+
+# Pillow warns above MAX_IMAGE_PIXELS and refuses twice that. Plates can
+# legitimately exceed its default (~89 MP); decoded memory is capped by the
+# budget instead.
+MAX_SOURCE_PIXELS = 300_000_000
+
+# Image.MAX_IMAGE_PIXELS is a module global: overlapping opens on several
+# threads share one raise, and the last one out restores the caller's value
+_limit_lock = threading.Lock()
+_limit_users = 0
+_saved_limit = None
+
+# resize() first box-reduces by an integer factor while the image is at
+# least this many times the target, then resamples the rest
+REDUCING_GAP = 3.0
+
+
+class ImageTooLarge(Exception):
+    "Decoding the image would exceed the memory budget."
+    pass
+
+
+def bytes_per_pixel(mode: str) -> int:
+    "Pillow keeps multi-band images (RGB included) at 4 bytes per pixel."
+    if mode.startswith("I;16"):
+        return 2
+    if mode in ("I", "F") or Image.getmodebands(mode) > 1:
+        return 4
+    return 1
+
+
+def decoded_bytes(size: Tuple[int, int], mode: str) -> int:
+    "Memory Pillow needs to hold an image of this size and mode."
+    return size[0] * size[1] * bytes_per_pixel(mode)
+
+
+def fit_size(size: Tuple[int, int], max_side: Optional[int] = None,
+             max_pixels: Optional[int] = None) -> Tuple[int, int]:
+    "Largest size with the same aspect ratio within max_side and max_pixels."
+    w, h = size
+    scale = 1.0
+    if max_side:
+        scale = min(scale, max_side / max(w, h))
+    if max_pixels:
+        scale = min(scale, math.sqrt(max_pixels / (w * h)))
+    if scale >= 1.0:
+        return size
+    return max(1, int(w * scale)), max(1, int(h * scale))
+
+
+@contextmanager
+def _source_pixel_limit():
+    "Raise Pillow's decompression-bomb limit to MAX_SOURCE_PIXELS inside the block."
+    global _limit_users, _saved_limit
+    with _limit_lock:
+        if _limit_users == 0:
+            _saved_limit = Image.MAX_IMAGE_PIXELS
+            if _saved_limit is not None and _saved_limit < MAX_SOURCE_PIXELS:
+                Image.MAX_IMAGE_PIXELS = MAX_SOURCE_PIXELS
+        _limit_users += 1
+    try:
+        yield
+    finally:
+        with _limit_lock:
+            _limit_users -= 1
+            if _limit_users == 0:
+                Image.MAX_IMAGE_PIXELS = _saved_limit
+
+
+def open_image(fp) -> Image.Image:
+    "Image.open (header only; pixels load lazily) allowing plates up to MAX_SOURCE_PIXELS."
+    with _source_pixel_limit():
+        return Image.open(fp)
+
+
+def probe(path) -> Tuple[Tuple[int, int], str, Optional[str]]:
+    "(size, mode, format) from the file header, without decoding pixels."
+    with open_image(path) as img:
+        return img.size, img.mode, img.format
+
+
+def jpeg_mode(mode: str) -> str:
+    "Mode to encode a JPEG from an image in `mode` (grayscale stays grayscale)."
+    return "L" if mode in ("1", "L", "LA", "I", "I;16") else "RGB"
+
+
+def _convert(img: Image.Image, mode: Optional[str]) -> Image.Image:
+    if mode is None or img.mode == mode:
+        return img
+    if img.mode == "P":
+        img = img.convert("RGBA")  # honour transparency before dropping it
+    return img.convert(mode)
+
+
+def _draft_factor(size: Tuple[int, int], target: Tuple[int, int], max_pixels: int) -> int:
+    "Largest DCT reduction (1, 2, 4, 8) that stays >= target, raised further if still over max_pixels."
+    w, h = size
+    factor = next(k for k in (8, 4, 2, 1) if w // k >= target[0] and h // k >= target[1])
+    while factor < 8 and (w // factor) * (h // factor) > max_pixels:
+        factor *= 2
+    return factor
+
+
+def load(path, max_side: Optional[int] = None, mode: Optional[str] = None,
+         budget: Optional[int] = None, resample=Image.Resampling.LANCZOS) -> Image.Image:
+    """
+    Decode `path` no larger than `max_side` (None keeps full resolution when
+    the budget allows), converted to `mode` if given. A JPEG is drafted
+    towards `max_side` while decoding, and further down if it would not fit
+    the budget at full size.
+
+    The original dimensions are in `img.info["source_size"]`, for callers
+    that map boxes back to full resolution. Raises ImageTooLarge when any
+    other format cannot be decoded within `budget` bytes (default
+    DECODE_BUDGET_BYTES).
+    """
+    budget = DECODE_BUDGET_BYTES if budget is None else budget
+    with open_image(path) as img:
+        source_size = img.size
+        out_mode = mode or img.mode
+        converting = out_mode != img.mode
+        per_pixel = bytes_per_pixel(img.mode) + (bytes_per_pixel(out_mode) if converting else 0)
+        max_pixels = budget // per_pixel
+        target = fit_size(source_size, max_side, max_pixels=max_pixels)
+
+        if img.format == "JPEG" and target != source_size:
+            # DCT-domain downscale: img.size becomes the drafted size
+            factor = _draft_factor(source_size, target, max_pixels)
+            img.draft(out_mode if out_mode in ("RGB", "L") else None,
+                      (source_size[0] // factor, source_size[1] // factor))
+            converting = out_mode != img.mode
+            target = (min(target[0], img.width), min(target[1], img.height))
+
+        need = decoded_bytes(img.size, img.mode) + (decoded_bytes(img.size, out_mode) if converting else 0)
+        if need > budget:
+            raise ImageTooLarge(f"{path}: {source_size[0]}x{source_size[1]} {img.mode} needs "
+                                f"{need / 1024 / 1024:.0f} MB to decode (budget {budget / 1024 / 1024:.0f} MB)")
+        img.load()
+        out = _convert(img, mode)
+        if out.size != target:
+            out = out.resize(target, resample, reducing_gap=REDUCING_GAP)
+    out.info["source_size"] = source_size
+    return out
+
+
+def write_atomic(path, data: bytes) -> None:
+    "Write to a temporary sibling, then rename over `path` (a synced folder sees one complete write)."
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def add_pool_arguments(parser: argparse.ArgumentParser, memory: bool = True) -> None:
+    "--workers and (with `memory`) --memory-mb, as passed to map_in_pool."
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    if memory:
+        parser.add_argument("--memory-mb", type=float, default=None,
+                            help="Decoded-pixel memory shared by all workers (default: "
+                                 f"{DECODE_BUDGET_MB:.0f} MB per worker)")
+
+
+def map_in_pool(fn: Callable, items: Iterable[tuple], workers: Optional[int] = None,
+                memory_mb: Optional[float] = None, ordered: bool = False) -> Iterator:
+    """
+    Call fn(*item) for every item in worker processes (workers default to
+    the CPU count, never more than there are items); yields the results as
+    they finish, or in item order with `ordered`. One worker runs the calls
+    in this process.
+
+    With `memory_mb`, decoded pixels are capped across the whole pool: each
+    call also gets `budget=`, an equal share of it in bytes.
+    """
+    items = list(items)
+    workers = min(workers or os.cpu_count() or 1, max(1, len(items)))
+    kwargs = {"budget": int(memory_mb * 1024 * 1024 / workers)} if memory_mb else {}
+    if workers == 1:
+        for item in items:
+            yield fn(*item, **kwargs)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fn, *item, **kwargs) for item in items]
+        yield from (future.result() for future in (futures if ordered else as_completed(futures)))
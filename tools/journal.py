@@ -0,0 +1,143 @@
+"""
+Crash-safe run journal for long classification runs.
+
+Every image taken off the queue goes through these append-only events:
+
+    claimed   -> taken off the queue
+    sent      -> vision request handed to the MCP server
+    completed -> response received (carries the parsed results or error)
+    committed -> results written to SQLite
+    aborted   -> call cancelled during shutdown (image goes back to the queue)
+
+Each event is one JSON line written with O_APPEND and fsync'd, so a
+`kill -9`, an OOM kill or a half-synced Drive copy of gallery.db loses at
+most the line being written. On the next start the journal is replayed:
+completed-but-uncommitted results are re-applied to the database without
+another API call, and in-flight images are put at the front of the queue.
+"""
+
+import os
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_DIR = DATA_DIR / "journal"
+
+CLAIMED = "claimed"
+SENT = "sent"
+COMPLETED = "completed"
+COMMITTED = "committed"
+ABORTED = "aborted"
+
+
+@dataclass
+class JournalState:
+    "What a replayed journal says about an interrupted run."
+    uncommitted: Dict[str, dict] = field(default_factory=dict)  # img_id -> completed event
+    in_flight: List[str] = field(default_factory=list)           # claimed/sent, never completed
+    committed: int = 0
+
+    @property
+    def clean(self) -> bool:
+        return not self.uncommitted and not self.in_flight
+
+
+class RunJournal:
+    def __init__(self, path, fsync: bool = True):
+        self.path = Path(path)
+        self.fsync = fsync
+        self._fd: Optional[int] = None
+
+    @classmethod
+    def for_phase(cls, phase, journal_dir=None) -> "RunJournal":
+        "Default journal location for a classifier phase (overridable with NAVAL_GALLERY_JOURNAL_DIR)."
+        base = os.environ.get("NAVAL_GALLERY_JOURNAL_DIR") or journal_dir or JOURNAL_DIR
+        return cls(Path(base) / f"classify_phase{phase}.jsonl")
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def _open(self) -> int:
+        if self._fd is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        return self._fd
+
+    def _append(self, event: str, img_id: str, **extra) -> None:
+        record = {"ts": datetime.now().isoformat(), "event": event, "id": img_id, **extra}
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        fd = self._open()
+        os.write(fd, line)
+        if self.fsync:
+            os.fsync(fd)
+
+    def claimed(self, img_id: str) -> None:
+        self._append(CLAIMED, img_id)
+
+    def sent(self, img_id: str) -> None:
+        self._append(SENT, img_id)
+
+    def completed(self, img_id: str, results: dict = None, error: str = None) -> None:
+        self._append(COMPLETED, img_id, results=results or {}, error=error)
+
+    def committed(self, img_id: str) -> None:
+        self._append(COMMITTED, img_id)
+
+    def aborted(self, img_id: str, reason: str = "") -> None:
+        self._append(ABORTED, img_id, reason=reason)
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    # ------------------------------------------------------------------
+    # Recovery
+    # ------------------------------------------------------------------
+
+    def replay(self) -> JournalState:
+        "Reconstruct the state of the last run from the journal file."
+        state = JournalState()
+        if not self.path.exists():
+            return state
+
+        last_event: Dict[str, dict] = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn write from the crash itself
+                    logger.warning(f"Skipping torn journal line {line_no} in {self.path}")
+                    continue
+                img_id = record.get("id")
+                if record.get("event") == COMMITTED:
+                    state.committed += 1
+                # An image can be claimed again after an abort; the last event wins
+                last_event.pop(img_id, None)
+                last_event[img_id] = record
+
+        for img_id, record in last_event.items():
+            event = record.get("event")
+            if event == COMPLETED:
+                state.uncommitted[img_id] = record
+            elif event in (CLAIMED, SENT, ABORTED):
+                state.in_flight.append(img_id)
+        return state
+
+    def reset(self) -> None:
+        "Truncate the journal once every claimed image has been committed."
+        self.close()
+        if self.path.exists():
+            self.path.unlink()
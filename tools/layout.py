@@ -0,0 +1,369 @@
+"""
+Local layout analysis for Phase 2 region-of-interest cropping.
+
+Phase 2 asks the model to read dimensions, armament and armor from a
+plate's annotations. Downscaled to fit the vision API, that lettering is
+unreadable; at full resolution the upload is slow or rejected as too large.
+This module finds the text regions locally, with no API call:
+
+1. Binarize the plate (Otsu threshold, inverted for white-on-blue prints).
+2. Label 8-connected ink components and keep the glyph-sized ones.
+3. Smear glyphs into blocks and split/trim the blocks with row and column
+   projection profiles.
+4. Promote thin rectangular frames that enclose many glyphs to title blocks.
+
+The resulting boxes (full-resolution pixel coordinates) are stored in the
+`roi_boxes` column, and `build_composite` renders a small overview of the
+whole plate with full-resolution crops of each region underneath.
+
+Requires NumPy (`pip install .[layout]`).
+"""
+
+import io
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+import imaging
+
+# Plates are analyzed at this size; boxes are scaled back to full resolution
+ANALYSIS_MAX_SIDE = 1600
+
+# Composite sent to the vision model
+OVERVIEW_MAX_SIDE = 1024
+CROP_MAX_SIDE = 2048
+PANEL_GAP = 12
+COMPOSITE_MAX_PIXELS = 12_000_000
+COMPOSITE_MAX_BYTES = int(4.5 * 1024 * 1024)  # the upload limit resize_images.py targets
+MIN_COMPOSITE_QUALITY = 60
+
+MAX_REGIONS = 4
+MIN_GLYPHS = 8  # fewer glyphs than this is a stray label, not a table
+
+COMPOSITE_NOTE = """
+NOTE: This image is a composite. The TOP panel is a downscaled overview of the
+whole plate. The panels BELOW it are full-resolution crops of the plate's title
+block and annotation tables; read specifications from those crops.
+"""
+
+
+@dataclass
+class Region:
+    "A text region in full-resolution pixel coordinates."
+    x: int
+    y: int
+    width: int
+    height: int
+    kind: str = "annotation"  # annotation | title_block
+    glyphs: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Region":
+        return cls(**{k: data[k] for k in ("x", "y", "width", "height") if k in data},
+                   kind=data.get("kind", "annotation"), glyphs=data.get("glyphs", 0))
+
+    @property
+    def box(self) -> Tuple[int, int, int, int]:
+        return self.x, self.y, self.x + self.width, self.y + self.height
+
+
+# ----------------------------------------------------------------------------
+# Image primitives
+# ----------------------------------------------------------------------------
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    "Grey level that best separates ink from paper."
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    cum_mean = np.cumsum(hist * levels)
+    mean_bg = cum_mean / np.maximum(weight_bg, 1)
+    mean_fg = (cum_mean[-1] - cum_mean) / np.maximum(weight_fg, 1)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between))
+
+
+def binarize(gray: np.ndarray) -> np.ndarray:
+    "Boolean ink mask; ink is assumed to be the minority of pixels."
+    ink = gray <= otsu_threshold(gray)
+    if ink.mean() > 0.5:
+        ink = ~ink
+    return ink
+
+
+def label_components(mask: np.ndarray) -> np.ndarray:
+    """
+    8-connected components of a boolean mask.
+
+    Returns an (N, 5) int array of [x0, y0, x1, y1, area] per component,
+    with exclusive x1/y1. Works on horizontal runs with union-find, so the
+    Python loop is over runs rather than pixels.
+    """
+    height, width = mask.shape
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    run_rows, run_starts = np.nonzero(edges == 1)
+    _, run_ends = np.nonzero(edges == -1)
+    n_runs = len(run_rows)
+    if n_runs == 0:
+        return np.zeros((0, 5), dtype=np.int64)
+
+    parent = np.arange(n_runs)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    row_bounds = np.searchsorted(run_rows, np.arange(height + 1))
+    for row in range(1, height):
+        prev_lo, prev_hi = row_bounds[row - 1], row_bounds[row]
+        cur_lo, cur_hi = row_bounds[row], row_bounds[row + 1]
+        if prev_lo == prev_hi or cur_lo == cur_hi:
+            continue
+        i, j = prev_lo, cur_lo
+        while i < prev_hi and j < cur_hi:
+            # 8-connectivity: runs touch if they overlap or meet diagonally
+            if run_starts[i] <= run_ends[j] and run_starts[j] <= run_ends[i]:
+                a, b = find(i), find(j)
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+            if run_ends[i] < run_ends[j]:
+                i += 1
+            else:
+                j += 1
+
+    roots = np.array([find(i) for i in range(n_runs)])
+    _, labels = np.unique(roots, return_inverse=True)
+    count = labels.max() + 1
+    stats = np.empty((count, 5), dtype=np.int64)
+    stats[:, 0] = width
+    stats[:, 1] = height
+    stats[:, 2:] = 0
+    np.minimum.at(stats[:, 0], labels, run_starts)
+    np.minimum.at(stats[:, 1], labels, run_rows)
+    np.maximum.at(stats[:, 2], labels, run_ends)
+    np.maximum.at(stats[:, 3], labels, run_rows + 1)
+    np.add.at(stats[:, 4], labels, run_ends - run_starts)
+    return stats
+
+
+def dilate(mask: np.ndarray, rx: int, ry: int) -> np.ndarray:
+    "Box dilation by a (2*rx+1) x (2*ry+1) window using cumulative sums."
+    out = mask
+    for axis, radius in ((1, rx), (0, ry)):
+        if radius <= 0:
+            continue
+        size = out.shape[axis]
+        counts = np.cumsum(out, axis=axis, dtype=np.int32)
+        counts = np.concatenate([np.zeros_like(np.take(counts, [0], axis=axis)), counts], axis=axis)
+        index = np.arange(size)
+        hi = np.take(counts, np.minimum(index + radius + 1, size), axis=axis)
+        lo = np.take(counts, np.maximum(index - radius, 0), axis=axis)
+        out = (hi - lo) > 0
+    return out
+
+
+def erode(mask: np.ndarray, rx: int, ry: int) -> np.ndarray:
+    "Box erosion, the dual of dilate(); pixels beyond the border count as set."
+    return ~dilate(~mask, rx, ry)
+
+
+def profile_segments(profile: np.ndarray, min_gap: int) -> List[Tuple[int, int]]:
+    "Split a projection profile into [start, end) runs separated by >= min_gap empty bins."
+    filled = np.flatnonzero(profile > 0)
+    if len(filled) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(filled) > min_gap)
+    starts = np.concatenate(([filled[0]], filled[breaks + 1]))
+    ends = np.concatenate((filled[breaks], [filled[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+# ----------------------------------------------------------------------------
+# Layout analysis
+# ----------------------------------------------------------------------------
+
+def _glyph_filter(stats: np.ndarray, image_height: int) -> np.ndarray:
+    widths = stats[:, 2] - stats[:, 0]
+    heights = stats[:, 3] - stats[:, 1]
+    max_h = max(10, int(image_height * 0.04))
+    return ((heights >= 3) & (heights <= max_h) & (widths <= 3 * max_h)
+            & (stats[:, 4] >= 4) & (widths * heights <= max_h * max_h * 3))
+
+
+def find_regions(gray: np.ndarray, max_regions: int = MAX_REGIONS,
+                 min_glyphs: int = MIN_GLYPHS) -> List[Region]:
+    "Find title blocks and annotation tables in a greyscale plate (analysis coordinates)."
+    height, width = gray.shape
+    ink = binarize(gray)
+    stats = label_components(ink)
+    if len(stats) == 0:
+        return []
+
+    is_glyph = _glyph_filter(stats, height)
+    glyphs = stats[is_glyph]
+    if len(glyphs) < min_glyphs:
+        return []
+    glyph_h = int(np.median(glyphs[:, 3] - glyphs[:, 1]))
+    centres_x = (glyphs[:, 0] + glyphs[:, 2]) // 2
+    centres_y = (glyphs[:, 1] + glyphs[:, 3]) // 2
+
+    glyph_mask = np.zeros_like(ink)
+    for x0, y0, x1, y1, _ in glyphs:
+        glyph_mask[y0:y1, x0:x1] = True
+
+    def glyphs_in(x0, y0, x1, y1):
+        return int(np.count_nonzero((centres_x >= x0) & (centres_x < x1)
+                                    & (centres_y >= y0) & (centres_y < y1)))
+
+    regions: List[Region] = []
+
+    # Title blocks: thin rectangular frames that enclose lettering
+    image_area = width * height
+    for x0, y0, x1, y1, area in stats[~is_glyph]:
+        box_area = (x1 - x0) * (y1 - y0)
+        if not (0.005 * image_area <= box_area <= 0.3 * image_area):
+            continue
+        if area / box_area > 0.2:
+            continue  # solid shape, not a frame
+        count = glyphs_in(x0, y0, x1, y1)
+        if count >= min_glyphs * 2:
+            regions.append(Region(int(x0), int(y0), int(x1 - x0), int(y1 - y0), "title_block", count))
+
+    # Annotation blocks: smear glyphs into blocks, then split with projection profiles
+    blocks = label_components(dilate(glyph_mask, rx=2 * glyph_h, ry=glyph_h))
+    for bx0, by0, bx1, by1, _ in blocks:
+        sub = glyph_mask[by0:by1, bx0:bx1]
+        for ry0, ry1 in profile_segments(sub.sum(axis=1), min_gap=2 * glyph_h):
+            band = sub[ry0:ry1]
+            for rx0, rx1 in profile_segments(band.sum(axis=0), min_gap=4 * glyph_h):
+                x0, y0, x1, y1 = bx0 + rx0, by0 + ry0, bx0 + rx1, by0 + ry1
+                count = glyphs_in(x0, y0, x1, y1)
+                if count < min_glyphs:
+                    continue
+                if any(_contains(r.box, (x0, y0, x1, y1)) for r in regions if r.kind == "title_block"):
+                    continue
+                regions.append(Region(int(x0), int(y0), int(x1 - x0), int(y1 - y0), "annotation", count))
+
+    regions = _merge_overlapping(_pad(regions, glyph_h, width, height))
+    regions.sort(key=lambda r: (r.kind != "title_block", -r.glyphs))
+    return regions[:max_regions]
+
+
+def _contains(outer, inner) -> bool:
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and outer[2] >= inner[2] and outer[3] >= inner[3]
+
+
+def _pad(regions: List[Region], pad: int, width: int, height: int) -> List[Region]:
+    padded = []
+    for r in regions:
+        x0, y0 = max(0, r.x - pad), max(0, r.y - pad)
+        x1, y1 = min(width, r.x + r.width + pad), min(height, r.y + r.height + pad)
+        padded.append(Region(x0, y0, x1 - x0, y1 - y0, r.kind, r.glyphs))
+    return padded
+
+
+def _merge_overlapping(regions: List[Region]) -> List[Region]:
+    merged: List[Region] = []
+    for r in sorted(regions, key=lambda r: (r.kind != "title_block", -r.glyphs)):
+        for i, m in enumerate(merged):
+            a, b = m.box, r.box
+            if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                x0, y0 = min(a[0], b[0]), min(a[1], b[1])
+                x1, y1 = max(a[2], b[2]), max(a[3], b[3])
+                merged[i] = Region(x0, y0, x1 - x0, y1 - y0, m.kind, m.glyphs + r.glyphs)
+                break
+        else:
+            merged.append(r)
+    return merged
+
+
+def analyze_layout(image_path, max_regions: int = MAX_REGIONS) -> List[Region]:
+    "Find text regions in a plate, in full-resolution pixel coordinates."
+    gray = imaging.load(image_path, max_side=ANALYSIS_MAX_SIDE, mode="L", resample=Image.Resampling.BILINEAR)
+    full_w, full_h = gray.info["source_size"]
+    scale = gray.width / full_w
+    regions = find_regions(np.asarray(gray), max_regions=max_regions)
+
+    if scale == 1.0:
+        return regions
+    out = []
+    for r in regions:
+        x0, y0 = int(r.x / scale), int(r.y / scale)
+        x1, y1 = min(full_w, int(np.ceil((r.x + r.width) / scale))), min(full_h, int(np.ceil((r.y + r.height) / scale)))
+        out.append(Region(x0, y0, x1 - x0, y1 - y0, r.kind, r.glyphs))
+    return out
+
+
+# ----------------------------------------------------------------------------
+# Composite
+# ----------------------------------------------------------------------------
+
+def _fit(img: Image.Image, max_side: int) -> Image.Image:
+    if max(img.size) <= max_side:
+        return img
+    scale = max_side / max(img.size)
+    return img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                      Image.Resampling.LANCZOS)
+
+
+def _encode_within(canvas: Image.Image, quality: int, max_bytes: int) -> bytes:
+    "JPEG of `canvas` no larger than max_bytes: lower the quality first, then the size."
+    while True:
+        for q in range(quality, MIN_COMPOSITE_QUALITY - 1, -10):
+            buffer = io.BytesIO()
+            canvas.save(buffer, "JPEG", quality=q)
+            if buffer.tell() <= max_bytes:
+                return buffer.getvalue()
+        scale = 0.95 * (max_bytes / buffer.tell()) ** 0.5
+        canvas = canvas.resize((max(1, int(canvas.width * scale)), max(1, int(canvas.height * scale))),
+                               Image.Resampling.LANCZOS)
+
+
+def build_composite(image_path, regions: Sequence[Region], output_path=None,
+                    overview_side: int = OVERVIEW_MAX_SIDE, crop_side: int = CROP_MAX_SIDE,
+                    quality: int = 90, budget: Optional[int] = None,
+                    max_pixels: int = COMPOSITE_MAX_PIXELS, max_bytes: int = COMPOSITE_MAX_BYTES) -> Optional[bytes]:
+    """
+    Render a small overview of the plate with full-resolution crops of each
+    region stacked underneath. Writes a JPEG to output_path if given,
+    otherwise returns the encoded bytes.
+
+    The plate is decoded within `budget` (a huge JPEG is drafted down, so
+    its crops lose resolution rather than memory running out). The canvas
+    is scaled to at most max_pixels and encoded to at most max_bytes.
+    """
+    _, mode, _ = imaging.probe(image_path)
+    img = imaging.load(image_path, mode=imaging.jpeg_mode(mode), budget=budget)
+    scale = img.width / img.info["source_size"][0]
+    panels = [_fit(img, overview_side)]
+    for r in regions:
+        panels.append(_fit(img.crop(tuple(round(v * scale) for v in r.box)), crop_side))
+
+    canvas_w = max(p.width for p in panels)
+    canvas_h = sum(p.height for p in panels) + PANEL_GAP * (len(panels) - 1)
+    canvas = Image.new("RGB", (canvas_w, canvas_h), (128, 128, 128))
+    y = 0
+    for panel in panels:
+        canvas.paste(panel.convert("RGB"), (0, y))
+        y += panel.height + PANEL_GAP
+    fitted = imaging.fit_size(canvas.size, max_pixels=max_pixels)
+    if fitted != canvas.size:
+        canvas = canvas.resize(fitted, Image.Resampling.LANCZOS)
+
+    data = _encode_within(canvas, quality, max_bytes)
+    if output_path is not None:
+        imaging.write_atomic(output_path, data)
+        return None
+    return data
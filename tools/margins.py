@@ -0,0 +1,165 @@
+"""
+Trim scan margins before a plate goes to the vision model.
+
+Internet Archive and ONI scans carry wide paper margins, scanner rulers
+and colour casts around the drawing, and every vision call pays upload
+bytes and model attention for those pixels. This module finds the drawing
+locally, with no API call:
+
+1. Binarize the plate at analysis size (Otsu, as in layout.py).
+2. Close the ink mask so strokes, hatching and lettering merge into blobs.
+3. Discard blobs too small to matter (dust, speckle) and thin strips
+   hugging an edge (rulers, page edges, scanner-bed shadows); the content
+   box is the union of what is left.
+4. Pad the box and scale it back to full resolution.
+
+The box is stored in the `bounds` column as {x, y, width, height} in
+full-resolution pixels, so it is computed once per image and other tools
+can reuse it. `trim_image` writes the cropped upload, optionally in
+greyscale when the plate is line art (neutral ink on paper, whatever the
+colour of the paper).
+
+Requires NumPy (`pip install .[layout]`).
+"""
+
+import math
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+import imaging
+from layout import binarize, dilate, erode, label_components
+
+# Plates are analyzed at this size; the box is scaled back to full resolution
+ANALYSIS_MAX_SIDE = 1024
+
+CLOSE_FRACTION = 0.01    # closing radius, as a share of the longer side
+MIN_BLOB = 0.0002        # blobs under this share of the plate are noise
+EDGE_MARGIN = 0.05       # strips this close to an edge (share of the side) ...
+STRIP_WIDTH = 0.04       # ... this thin (share of the other side) ...
+STRIP_ASPECT = 8         # ... and this elongated are rulers or page edges
+PAD_FRACTION = 0.015     # padding around the content, as a share of the longer side
+MIN_PAD = 8
+
+MIN_TRIM = 0.05          # crop only when it removes at least this share of the pixels
+
+# Line art: two tones (paper and ink) with few pixels in between, and neutral ink
+LINE_ART_SAMPLE_SIDE = 512
+LINE_ART_MIN_CONTRAST = 64
+LINE_ART_MAX_MIDTONES = 0.08
+LINE_ART_MAX_INK_CHROMA = 32
+
+
+def _edge_strips(stats: np.ndarray, width: int, height: int) -> np.ndarray:
+    "Mask of components that are long thin strips along an edge of the plate."
+    x0, y0, x1, y1 = stats[:, 0], stats[:, 1], stats[:, 2], stats[:, 3]
+    w, h = x1 - x0, y1 - y0
+    mx, my = EDGE_MARGIN * width, EDGE_MARGIN * height
+    horizontal = (w >= STRIP_ASPECT * h) & (h <= STRIP_WIDTH * height) & ((y0 <= my) | (y1 >= height - my))
+    vertical = (h >= STRIP_ASPECT * w) & (w <= STRIP_WIDTH * width) & ((x0 <= mx) | (x1 >= width - mx))
+    return horizontal | vertical
+
+
+def find_content_box(gray: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    "(x0, y0, x1, y1) of the drawing in a greyscale plate, exclusive; None if the plate is blank."
+    height, width = gray.shape
+    ink = binarize(gray)
+    radius = max(1, round(max(height, width) * CLOSE_FRACTION))
+    # No opening afterwards: it would erase the hairlines that make up line art
+    blobs = erode(dilate(ink, radius, radius), radius, radius)
+    stats = label_components(blobs)
+    stats = stats[stats[:, 4] >= MIN_BLOB * width * height]
+    if len(stats) == 0:
+        return None
+    content = stats[~_edge_strips(stats, width, height)]
+    if len(content):
+        stats = content  # a plate that is nothing but strips keeps them
+    return (int(stats[:, 0].min()), int(stats[:, 1].min()),
+            int(stats[:, 2].max()), int(stats[:, 3].max()))
+
+
+def detect_bounds(image_path) -> dict:
+    """
+    Content box of a plate as {x, y, width, height} in full-resolution
+    pixels, padded; a blank plate gets the whole image.
+    """
+    gray = imaging.load(image_path, max_side=ANALYSIS_MAX_SIDE, mode="L", resample=Image.Resampling.BILINEAR)
+    full_w, full_h = gray.info["source_size"]
+    box = find_content_box(np.asarray(gray))
+    if box is None:
+        return {"x": 0, "y": 0, "width": full_w, "height": full_h}
+
+    scale = gray.width / full_w
+    pad = max(MIN_PAD, round(max(full_w, full_h) * PAD_FRACTION))
+    x0 = max(0, int(box[0] / scale) - pad)
+    y0 = max(0, int(box[1] / scale) - pad)
+    x1 = min(full_w, math.ceil(box[2] / scale) + pad)
+    y1 = min(full_h, math.ceil(box[3] / scale) + pad)
+    return {"x": x0, "y": y0, "width": x1 - x0, "height": y1 - y0}
+
+
+def valid_bounds(bounds) -> bool:
+    "True for a stored {x, y, width, height} box (older manifests may hold other shapes)."
+    return (isinstance(bounds, dict) and all(isinstance(bounds.get(k), int) for k in ("x", "y", "width", "height"))
+            and bounds["width"] > 0 and bounds["height"] > 0)
+
+
+def is_line_art(img: Image.Image) -> bool:
+    "True if the image is neutral ink on paper, so greyscale loses nothing."
+    sample = img.copy()
+    sample.thumbnail((LINE_ART_SAMPLE_SIDE, LINE_ART_SAMPLE_SIDE))
+    gray = np.asarray(sample.convert("L"))
+    ink = binarize(gray)
+    if not ink.any() or ink.all():
+        return False
+    paper_level, ink_level = np.median(gray[~ink]), np.median(gray[ink])
+    contrast = abs(float(paper_level) - float(ink_level))
+    if contrast < LINE_ART_MIN_CONTRAST:
+        return False
+    band = contrast / 4
+    midtones = (np.abs(gray - paper_level) > band) & (np.abs(gray - ink_level) > band)
+    if midtones.mean() > LINE_ART_MAX_MIDTONES:
+        return False
+    if sample.mode in ("1", "L", "LA", "I", "I;16"):
+        return True
+    rgb = np.asarray(sample.convert("RGB"), dtype=np.int16)
+    chroma = rgb.max(axis=2) - rgb.min(axis=2)
+    return float(np.median(chroma[ink])) <= LINE_ART_MAX_INK_CHROMA
+
+
+def trim_image(image_path, bounds: dict, output_path, grayscale: bool = False,
+               min_trim: float = MIN_TRIM, quality: int = 90,
+               budget: Optional[int] = None) -> Optional[Path]:
+    """
+    Write the plate cropped to `bounds` as a JPEG, in greyscale if
+    `grayscale` is set and the plate is line art.
+
+    Returns None when there is nothing worth doing (the box removes less
+    than `min_trim` of the pixels and no greyscale conversion applies) or
+    the result would not be smaller than the original.
+    """
+    image_path, output_path = Path(image_path), Path(output_path)
+    size, mode, _ = imaging.probe(image_path)
+    box = (max(0, bounds["x"]), max(0, bounds["y"]),
+           min(size[0], bounds["x"] + bounds["width"]), min(size[1], bounds["y"] + bounds["height"]))
+    crop = (box[2] - box[0]) * (box[3] - box[1]) <= (1 - min_trim) * size[0] * size[1]
+    if not (crop or grayscale):
+        return None
+
+    img = imaging.load(image_path, mode=imaging.jpeg_mode(mode), budget=budget)
+    if crop:
+        scale = img.width / size[0]
+        img = img.crop((int(box[0] * scale), int(box[1] * scale),
+                        math.ceil(box[2] * scale), math.ceil(box[3] * scale)))
+    gray = grayscale and img.mode != "L" and is_line_art(img)
+    if not (crop or gray):
+        return None
+    if gray:
+        img = img.convert("L")
+    img.save(output_path, "JPEG", quality=quality)
+    if output_path.stat().st_size >= image_path.stat().st_size:
+        output_path.unlink()
+        return None
+    return output_path
@@ -0,0 +1,327 @@
+"""
+Pipeline metrics: counters and latency histograms for every stage.
+
+Metrics are off by default and every recording call returns immediately,
+so instrumented hot paths cost one global lookup. Turn them on with
+`metrics.enable()` or NAVAL_GALLERY_METRICS=1, then call `metrics.export()`
+at the end of a run to write
+
+    data/metrics/<run>.prom               Prometheus textfile-collector format
+    data/metrics/<run>_<timestamp>.json   summary with p50/p95, totals and rates
+
+Usage:
+    import metrics
+    metrics.inc("vision_errors_total", type="timeout")
+    metrics.observe("vision_upload_bytes", len(payload))
+    with metrics.timed("db_write_seconds", table="images"):
+        ...
+"""
+
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from config import DATA_DIR
+import tracing
+
+METRICS_DIR = DATA_DIR / "metrics"
+PREFIX = "naval_gallery_"
+
+# Latency buckets in seconds (covers SQLite writes up to slow vision calls)
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Size buckets in bytes (thumbnails up to oversized plates)
+BYTES_BUCKETS = (16e3, 64e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6, 32e6)
+
+_enabled = os.environ.get("NAVAL_GALLERY_METRICS", "").lower() in ("1", "true", "yes")
+_lock = threading.Lock()
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    "Cumulative-bucket histogram with sum, count, min and max."
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        "Estimate a quantile by linear interpolation inside its bucket."
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, n in enumerate(self.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.max
+            if n and seen + n >= rank:
+                lower = max(lower, self.min)
+                upper = min(upper, self.max)
+                return lower + (upper - lower) * ((rank - seen) / n)
+            seen += n
+            lower = upper
+        return self.max
+
+
+class Registry:
+    def __init__(self):
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.started = time.time()
+
+    def inc(self, name: str, value: float, labels: dict) -> None:
+        key = _label_key(labels)
+        with _lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: dict) -> None:
+        key = _label_key(labels)
+        with _lock:
+            series = self.histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(BYTES_BUCKETS if name.endswith("_bytes") else SECONDS_BUCKETS)
+            hist.observe(value)
+
+    def counter_total(self, name: str, **match) -> float:
+        want = set(_label_key(match))
+        return sum(v for k, v in self.counters.get(name, {}).items() if want <= set(k))
+
+    def histogram_total(self, name: str) -> Tuple[float, int]:
+        series = self.histograms.get(name, {}).values()
+        return sum(h.sum for h in series), sum(h.count for h in series)
+
+
+REGISTRY = Registry()
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        REGISTRY.observe(self.name, time.perf_counter() - self.start, self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+# ----------------------------------------------------------------------------
+# Recording API (all no-ops while disabled)
+# ----------------------------------------------------------------------------
+
+def enable(on: bool = True) -> None:
+    global _enabled
+    _enabled = on
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    global REGISTRY
+    REGISTRY = Registry()
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    "Add to a counter."
+    if not _enabled:
+        return
+    REGISTRY.inc(name, value, labels)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    "Record one histogram observation (names ending in _bytes get size buckets)."
+    if not _enabled:
+        return
+    REGISTRY.observe(name, value, labels)
+
+
+def timed(name: str, **labels):
+    "Context manager observing elapsed seconds (also on exceptions)."
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def error(stage: str, exc) -> None:
+    "Count an error by stage and exception type (or a short string)."
+    if not _enabled:
+        return
+    kind = exc if isinstance(exc, str) else type(exc).__name__
+    REGISTRY.inc("errors_total", 1, {"stage": stage, "type": kind})
+
+
+def download(response, source: str) -> None:
+    "Count a harvester download: bytes on HTTP 200, an error by status otherwise."
+    if not _enabled:
+        return
+    if response.status_code == 200:
+        REGISTRY.inc("download_bytes_total", len(response.content), {"source": source})
+        REGISTRY.inc("downloads_total", 1, {"source": source})
+    else:
+        REGISTRY.inc("errors_total", 1, {"stage": "download", "type": f"http_{response.status_code}"})
+
+
+def instrumented_get(url: str, source: str, image_id=None, path=None, **kwargs):
+    """
+    requests.get(url, **kwargs) for a harvester download: timed as
+    download_seconds, traced as a `download` span and counted by download().
+    With `path`, an HTTP 200 body is written there in a `file.write` span.
+    Returns the response.
+    """
+    import requests
+
+    with timed("download_seconds", source=source), \
+            tracing.span("download", image_id=image_id, source=source) as span:
+        response = requests.get(url, **kwargs)
+        span.set_attributes({"http.url": url, "http.status_code": response.status_code,
+                             "http.response_content_length": len(response.content)})
+    download(response, source=source)
+    if path is not None and response.status_code == 200:
+        with tracing.span("file.write", image_id=image_id), open(path, "wb") as f:
+            f.write(response.content)
+    return response
+
+
+# ----------------------------------------------------------------------------
+# Export
+# ----------------------------------------------------------------------------
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def to_prometheus(registry: Registry = None) -> str:
+    "Render the registry in Prometheus text exposition format."
+    registry = registry or REGISTRY
+    lines = []
+    with _lock:
+        for name, series in sorted(registry.counters.items()):
+            metric = PREFIX + name
+            lines.append(f"# TYPE {metric} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{metric}{_format_labels(key)} {_number(value)}")
+        for name, series in sorted(registry.histograms.items()):
+            metric = PREFIX + name
+            lines.append(f"# TYPE {metric} histogram")
+            for key, hist in sorted(series.items()):
+                cumulative = 0
+                for bound, n in zip(hist.buckets, hist.counts):
+                    cumulative += n
+                    lines.append(f"{metric}_bucket{_format_labels(key, (('le', f'{bound:g}'),))} {cumulative}")
+                lines.append(f"{metric}_bucket{_format_labels(key, (('le', '+Inf'),))} {hist.count}")
+                lines.append(f"{metric}_sum{_format_labels(key)} {_number(hist.sum)}")
+                lines.append(f"{metric}_count{_format_labels(key)} {hist.count}")
+    return "\n".join(lines) + "\n"
+
+
+def summary(registry: Registry = None) -> dict:
+    "JSON-friendly summary: counter totals, histogram percentiles and derived rates."
+    registry = registry or REGISTRY
+    with _lock:
+        counters = {name: {",".join(f"{k}={v}" for k, v in key) or "total": value
+                           for key, value in series.items()}
+                    for name, series in registry.counters.items()}
+        histograms = {}
+        for name, series in registry.histograms.items():
+            histograms[name] = {
+                ",".join(f"{k}={v}" for k, v in key) or "all": {
+                    "count": h.count, "sum": round(h.sum, 6), "min": h.min, "max": h.max,
+                    "p50": h.quantile(0.5), "p95": h.quantile(0.95),
+                }
+                for key, h in series.items()
+            }
+
+    rates = {}
+    download_bytes = registry.counter_total("download_bytes_total")
+    download_seconds, _ = registry.histogram_total("download_seconds")
+    if download_seconds:
+        rates["download_mb_per_s"] = round(download_bytes / 1e6 / download_seconds, 3)
+    elapsed = time.time() - registry.started
+    for name in ("classify_images_total", "organize_images_total"):
+        total = registry.counter_total(name)
+        if total and elapsed > 0:
+            rates[name.replace("_total", "_per_s")] = round(total / elapsed, 3)
+
+    return {
+        "started": datetime.fromtimestamp(registry.started).isoformat(),
+        "elapsed_s": round(elapsed, 3),
+        "counters": counters,
+        "histograms": histograms,
+        "rates": rates,
+    }
+
+
+def export(run_name: str, directory=None) -> Optional[Tuple[Path, Path]]:
+    """
+    Write <run_name>.prom and <run_name>_<timestamp>.json. Returns their
+    paths, or None when metrics are disabled.
+
+    The .prom file keeps a stable name (the textfile collector reads the
+    latest run) and is replaced atomically so it is never read half-written;
+    the JSON summaries accumulate as a run history.
+    """
+    if not _enabled:
+        return None
+    directory = Path(directory or os.environ.get("NAVAL_GALLERY_METRICS_DIR") or METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    prom_path = directory / f"{run_name}.prom"
+    json_path = directory / f"{run_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+
+    tmp = prom_path.with_suffix(".prom.tmp")
+    tmp.write_text(to_prometheus())
+    tmp.replace(prom_path)
+    json_path.write_text(json.dumps(summary(), indent=2))
+    return prom_path, json_path
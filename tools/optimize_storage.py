@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Re-encode stored plates into smaller files without losing the drawing.
+
+Most plates are black-and-white line drawings saved as large RGB JPEGs.
+Each file is classified from its pixels and re-encoded accordingly:
+
+    bilevel     nearly every pixel is ink or paper: 8-bit grayscale PNG or
+                lossless WebP, or 1-bit PNG if the pixels are already pure
+                black and white
+    grayscale   no real colour: 8-bit grayscale PNG or lossless WebP
+    colour      left alone
+
+By default every candidate holds exactly the decoded pixels: a plate is
+stored as grayscale only if its channels are equal, and nothing is
+thresholded. With --lossy, near-grey plates may drop their colour cast,
+bilevel plates may be thresholded (Otsu) to 1-bit PNG when the result
+meets --target-ssim, and colour plates become JPEG at the lowest quality
+whose block SSIM against the decoded original meets --target-ssim.
+
+The smallest candidate replaces the original only if it saves at least
+MIN_SAVING. Files are processed in parallel worker processes. A new file
+is written atomically next to the original (the extension follows the new
+format), `local_path` is switched for every record using the file in one
+UPDATE, and only then is the old file removed, so the database never
+points at a missing file. A new file left behind by a run interrupted
+before the switch is recognised as such and overwritten on the next run.
+Savings are reported per source.
+
+Masters are never downscaled: a plate too large to decode within the
+memory budget is skipped.
+
+Requires NumPy (`pip install .[layout]`).
+
+Usage:
+    python tools/optimize_storage.py [--lossy] [--target-ssim 0.985] [--workers N] [--dry-run] [--source ia]
+"""
+
+import io
+import os
+import sys
+import argparse
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from config import get_image_dir, validate_config
+import db
+import imaging
+import layout
+import probe_images
+import profiling
+
+BILEVEL = "bilevel"
+GRAYSCALE = "grayscale"
+COLOUR = "colour"
+
+GRAY_TOLERANCE = 12        # max channel spread still counted as grey
+GRAY_FRACTION = 0.995      # share of grey pixels for a grayscale plate
+BILEVEL_MARGIN = 64        # within this of black or white counts as ink or paper
+BILEVEL_FRACTION = 0.97    # share of ink/paper pixels for a bilevel plate (the rest is edge antialiasing)
+SAMPLE_STRIDE = 4          # classify on every 4th pixel in each direction
+
+DEFAULT_TARGET_SSIM = 0.985
+SSIM_BLOCK = 8
+SSIM_STRIP = 256           # rows compared at a time, to bound memory on huge plates
+MIN_QUALITY = 50
+MAX_QUALITY = 95
+MIN_SAVING = 0.05          # replace only if at least 5% smaller
+WEBP_MAX_SIDE = 16383
+
+
+@dataclass
+class OptimizeResult:
+    path: str
+    ok: bool
+    kind: Optional[str] = None
+    before: int = 0
+    after: int = 0
+    new_path: Optional[str] = None   # set when the file should be replaced
+    encoding: Optional[str] = None   # e.g. "png-1bit", "webp-lossless", "jpeg-q80"
+    ssim: Optional[float] = None
+    lossy: bool = False              # the new file does not hold exactly the decoded pixels
+    error: Optional[str] = None
+
+    @property
+    def saved(self) -> int:
+        return self.before - self.after if self.new_path else 0
+
+
+def classify(img: Image.Image) -> str:
+    "bilevel, grayscale or colour, from a subsample of the pixels."
+    arr = np.asarray(img)[::SAMPLE_STRIDE, ::SAMPLE_STRIDE]
+    if arr.ndim == 3:
+        arr = arr[..., :3].astype(np.int16)
+        spread = arr.max(axis=2) - arr.min(axis=2)
+        if (spread <= GRAY_TOLERANCE).mean() < GRAY_FRACTION:
+            return COLOUR
+        gray = arr.mean(axis=2)
+    else:
+        gray = arr
+    extreme = (gray <= BILEVEL_MARGIN) | (gray >= 255 - BILEVEL_MARGIN)
+    return BILEVEL if extreme.mean() >= BILEVEL_FRACTION else GRAYSCALE
+
+
+def block_ssim(a: np.ndarray, b: np.ndarray, block: int = SSIM_BLOCK) -> float:
+    "Mean SSIM over non-overlapping block x block windows of two grayscale arrays."
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    h = a.shape[0] // block * block
+    w = a.shape[1] // block * block
+    if not h or not w:
+        return 1.0 if np.array_equal(a, b) else 0.0
+    total, count = 0.0, 0
+    for top in range(0, h, SSIM_STRIP):
+        bottom = min(h, top + SSIM_STRIP)
+        shape = ((bottom - top) // block, block, w // block, block)
+        x = a[top:bottom, :w].astype(np.float64).reshape(shape)
+        y = b[top:bottom, :w].astype(np.float64).reshape(shape)
+        mx, my = x.mean(axis=(1, 3)), y.mean(axis=(1, 3))
+        vx, vy = x.var(axis=(1, 3)), y.var(axis=(1, 3))
+        cov = (x * y).mean(axis=(1, 3)) - mx * my
+        ssim = ((2 * mx * my + c1) * (2 * cov + c2)) / ((mx ** 2 + my ** 2 + c1) * (vx + vy + c2))
+        total += float(ssim.sum())
+        count += ssim.size
+    return total / count
+
+
+def _encode(img: Image.Image, fmt: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def _lossless_candidates(img: Image.Image, png_mode: str) -> List[Tuple[str, str, bytes]]:
+    "(encoding, extension, data) for PNG in png_mode and, where it fits, lossless WebP."
+    label = {"1": "png-1bit", "L": "png-8bit"}.get(png_mode, "png-rgb")
+    candidates = [(label, ".png", _encode(img.convert(png_mode), "PNG", optimize=True))]
+    if max(img.size) <= WEBP_MAX_SIDE:
+        candidates.append(("webp-lossless", ".webp", _encode(img, "WEBP", lossless=True)))
+    return candidates
+
+
+def fit_quality(img: Image.Image, target_ssim: float) -> Tuple[bytes, int, float]:
+    "Lowest JPEG quality whose block SSIM against `img` meets the target: (data, quality, ssim)."
+    reference = np.asarray(img.convert("L"))
+    lo, hi = MIN_QUALITY, MAX_QUALITY
+    best = None
+    while lo <= hi:
+        quality = (lo + hi) // 2
+        data = _encode(img, "JPEG", quality=quality, optimize=True, progressive=True)
+        with imaging.open_image(io.BytesIO(data)) as decoded:
+            score = block_ssim(reference, np.asarray(decoded.convert("L")))
+        if score >= target_ssim:
+            best = (data, quality, score)
+            hi = quality - 1
+        else:
+            lo = quality + 1
+    if best is None:
+        data = _encode(img, "JPEG", quality=MAX_QUALITY, optimize=True, progressive=True)
+        with imaging.open_image(io.BytesIO(data)) as decoded:
+            best = (data, MAX_QUALITY, block_ssim(reference, np.asarray(decoded.convert("L"))))
+    return best
+
+
+def _is_gray(img: Image.Image) -> bool:
+    "True if converting `img` to L keeps every pixel."
+    if img.mode in ("1", "L"):
+        return True
+    arr = np.asarray(img)
+    return bool((arr[..., 0] == arr[..., 1]).all() and (arr[..., 1] == arr[..., 2]).all())
+
+
+def _is_leftover(sibling: Path, size: Tuple[int, int], in_use: Sequence[str]) -> bool:
+    "True if `sibling` is this tool's re-encode of a `size` plate that never reached the database."
+    if str(sibling) in in_use:
+        return False
+    try:
+        return imaging.probe(sibling)[0] == size
+    except Exception:
+        return False
+
+
+def optimize_file(path, target_ssim: float = DEFAULT_TARGET_SSIM, dry_run: bool = False, lossy: bool = False,
+                  in_use: Sequence[str] = (), budget: Optional[int] = None) -> OptimizeResult:
+    """
+    Re-encode one file (runs in a worker process). When the best candidate
+    saves enough, it is written next to the original and `new_path` is set;
+    the caller switches the database over and removes the original. Unless
+    `lossy` is set, only candidates holding exactly the decoded pixels are
+    considered.
+
+    `in_use` lists the paths of sibling files (same name, other extension)
+    that database records point at. A sibling at the new path that no
+    record uses and that has the original's dimensions is a re-encode left
+    by an interrupted run, and is overwritten.
+    """
+    path = Path(path)
+    result = OptimizeResult(path=str(path), ok=False)
+    try:
+        result.before = path.stat().st_size
+        size, _, _ = imaging.probe(path)
+        img = imaging.load(path, budget=budget)
+        if img.size != size:
+            raise imaging.ImageTooLarge(f"{path}: cannot decode at full size within the memory budget")
+        if img.mode not in ("1", "L", "RGB"):
+            img = img.convert("L" if imaging.jpeg_mode(img.mode) == "L" else "RGB")
+        result.kind = classify(img)
+
+        # (encoding, extension, data, ssim, lossy)
+        candidates = []
+        if result.kind in (BILEVEL, GRAYSCALE):
+            exact = _is_gray(img)
+            # Without `lossy`, a plate with a colour cast stays RGB
+            gray = img.convert("L") if exact or lossy else img
+            dropped_cast = gray.mode == "L" and not exact
+            candidates = [c + (None, dropped_cast) for c in _lossless_candidates(gray, gray.mode)]
+            if result.kind == BILEVEL and gray.mode == "L":
+                values = np.asarray(gray)
+                if not ((values != 0) & (values != 255)).any():
+                    # Already pure black and white: 1-bit holds every pixel
+                    data = _encode(gray.convert("1"), "PNG", optimize=True)
+                    candidates.append(("png-1bit", ".png", data, None, dropped_cast))
+                elif lossy:
+                    threshold = layout.otsu_threshold(values)
+                    bilevel = gray.point(lambda v: 255 if v > threshold else 0)
+                    score = block_ssim(values, np.asarray(bilevel))
+                    if score >= target_ssim:
+                        candidates += [c + (score, True) for c in _lossless_candidates(bilevel, "1")]
+        elif lossy:
+            data, quality, score = fit_quality(img, target_ssim)
+            candidates = [(f"jpeg-q{quality}", ".jpg", data, score, True)]
+
+        result.ok = True
+        if not candidates:
+            result.after = result.before  # colour plates are only re-encoded when lossy
+            return result
+        encoding, suffix, data, result.ssim, result.lossy = min(candidates, key=lambda c: len(c[2]))
+        if len(data) > result.before * (1 - MIN_SAVING):
+            result.after = result.before  # not worth replacing
+            return result
+        if suffix == ".jpg" and path.suffix.lower() in (".jpg", ".jpeg"):
+            suffix = path.suffix  # keep .jpeg / .JPG as they were
+        new_path = path.with_suffix(suffix)
+        if new_path != path and new_path.exists() and not _is_leftover(new_path, size, in_use):
+            raise FileExistsError(f"{new_path} already exists")
+        result.encoding, result.after, result.new_path = encoding, len(data), str(new_path)
+        if not dry_run:
+            imaging.write_atomic(new_path, data)
+    except Exception as e:
+        result.ok = False
+        result.error = f"{type(e).__name__}: {e}"
+    return result
+
+
+def optimize_files(paths, target_ssim: float = DEFAULT_TARGET_SSIM, workers: Optional[int] = None,
+                   memory_mb: Optional[float] = None, dry_run: bool = False, lossy: bool = False,
+                   in_use: Optional[dict] = None):
+    """
+    Optimize files in parallel; yields OptimizeResults as they finish.
+    `in_use` maps a path to its siblings that records point at (see optimize_file).
+    """
+    in_use = in_use or {}
+    return imaging.map_in_pool(optimize_file, [(path, target_ssim, dry_run, lossy, in_use.get(path, ()))
+                                               for path in paths], workers, memory_mb)
+
+
+def run(target_ssim: float = DEFAULT_TARGET_SSIM, workers: Optional[int] = None, source: Optional[str] = None,
+        memory_mb: Optional[float] = None, dry_run: bool = False, lossy: bool = False) -> dict:
+    """
+    Optimize every stored plate (of one source, if given); returns
+    {source: {files, replaced, failed, before, after}}. Originals are
+    replaced by re-encodings that change pixels only when `lossy` is set.
+    """
+    image_dir = get_image_dir()
+    where, params = "local_path IS NOT NULL AND local_path != ''", []
+    if source:
+        where += " AND source = ?"
+        params.append(source)
+    # Several records may share one file; each file is optimized once
+    by_path = {}
+    for record in db.select_images(where, params, columns=("local_path", "source")):
+        path = image_dir / record["local_path"]
+        if path.exists():
+            by_path.setdefault(str(path), (record["local_path"], record["source"] or "unknown"))
+    # Files by name without extension, to tell a sibling in use from a leftover re-encode
+    stems = defaultdict(set)
+    for record in db.select_images("local_path IS NOT NULL AND local_path != ''", columns=("local_path",)):
+        path = image_dir / record["local_path"]
+        stems[path.with_suffix("")].add(str(path))
+    in_use = {path: tuple(stems[Path(path).with_suffix("")] - {path}) for path in by_path}
+
+    report = defaultdict(lambda: {"files": 0, "replaced": 0, "failed": 0, "before": 0, "after": 0})
+    replaced = []
+    for result in optimize_files(list(by_path), target_ssim, workers, memory_mb, dry_run, lossy, in_use):
+        rel, src = by_path[result.path]
+        stats = report[src]
+        stats["files"] += 1
+        if not result.ok:
+            stats["failed"] += 1
+            print(f"[!] {rel}: {result.error}")
+            continue
+        stats["before"] += result.before
+        stats["after"] += result.after
+        if not result.new_path:
+            continue
+        stats["replaced"] += 1
+        ssim = f", SSIM {result.ssim:.4f}" if result.ssim is not None else ", lossless"
+        print(f"[+] {rel}: {result.kind}, {result.encoding}{ssim}: "
+              f"{result.before / 1024 / 1024:.2f}MB -> {result.after / 1024 / 1024:.2f}MB")
+        if dry_run:
+            continue
+        new_rel = Path(rel).with_name(Path(result.new_path).name).as_posix()
+        if new_rel != rel:
+            db.replace_local_path(rel, new_rel)
+            os.unlink(result.path)
+        replaced.append(new_rel)
+    # The new files have a new format, mode and size
+    probe_images.run(local_paths=replaced)
+    return dict(report)
+
+
+def format_report(report: dict) -> str:
+    lines = [f"{'source':<14}{'files':>7}{'replaced':>10}{'failed':>8}{'before MB':>11}{'after MB':>10}"
+             f"{'saved MB':>10}{'saved':>8}"]
+    totals = {"files": 0, "replaced": 0, "failed": 0, "before": 0, "after": 0}
+    for src in sorted(report) + ["total"]:
+        stats = totals if src == "total" else report[src]
+        saved = stats["before"] - stats["after"]
+        share = saved / stats["before"] if stats["before"] else 0.0
+        lines.append(f"{src:<14}{stats['files']:>7}{stats['replaced']:>10}{stats['failed']:>8}"
+                     f"{stats['before'] / 1024 / 1024:>11.1f}{stats['after'] / 1024 / 1024:>10.1f}"
+                     f"{saved / 1024 / 1024:>10.1f}{100 * share:>7.1f}%")
+        if src != "total":
+            for key in totals:
+                totals[key] += stats[key]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Losslessly shrink line drawings and re-encode colour plates")
+    parser.add_argument("--lossy", action="store_true",
+                        help="Also replace originals with re-encodings that change pixels: JPEG for colour "
+                             "plates, 1-bit for near-bilevel ones, grayscale for near-grey ones")
+    parser.add_argument("--target-ssim", type=float, default=DEFAULT_TARGET_SSIM,
+                        help="Minimum block SSIM for lossy re-encodings (default: %(default)s)")
+    parser.add_argument("--source", default=None, help="Only optimize images from this source (e.g. ia, loc)")
+    parser.add_argument("--dry-run", action="store_true", help="Report the savings without changing anything")
+    imaging.add_pool_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    validate_config()
+    with profiling.from_args(args, "optimize_storage"):
+        report = run(args.target_ssim, workers=args.workers, source=args.source,
+                     memory_mb=args.memory_mb, dry_run=args.dry_run, lossy=args.lossy)
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
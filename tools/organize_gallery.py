@@ -10,6 +10,9 @@ from pathlib import Path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from config import get_image_dir, validate_config
 import db
+import metrics
+import tracing
+import profiling
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -54,7 +57,7 @@ def organize_images(limit=None, copy_only=False, dry_run=False):
         dry_run (bool): If True, log intended actions without modifying the disk.
     """
     # 1. Get images ready to organize
-    pending = db.get_ready_to_organize(limit=limit)
+    pending = db.get_ready_to_organize(limit=limit, columns=db.ORGANIZE_COLUMNS)
     if not pending:
         logger.info("[*] No images pending organization.")
         return
@@ -65,85 +68,109 @@ def organize_images(limit=None, copy_only=False, dry_run=False):
     classified_base = image_dir / "classified"
     
     for item in pending:
-        img_id = item['id']
-        old_path_str = item.get('local_path')
-        if not old_path_str:
-            logger.warning(f"[-] No local path for image {img_id}")
-            db.update_organization(img_id, "Unknown", status='error')
-            continue
-            
-        old_path = Path(old_path_str)
+        with tracing.span("organize", image_id=item['id'], copy_only=copy_only, dry_run=dry_run):
+            organize_image(item, image_dir, classified_base, copy_only=copy_only, dry_run=dry_run)
+
+
+def organize_image(item, image_dir, classified_base, copy_only=False, dry_run=False):
+    "Move or copy one classified image into its classified/ folder and record the new path."
+    img_id = item['id']
+    old_path_str = item.get('local_path')
+    if not old_path_str:
+        logger.warning(f"[-] No local path for image {img_id}")
+        db.update_organization(img_id, "Unknown", status='error')
+        return
         
-        # Paths in DB might be relative to image_dir or absolute
-        if old_path.is_absolute():
-            abs_old_path = old_path
+    old_path = Path(old_path_str)
+    
+    # Paths in DB might be relative to image_dir or absolute
+    if old_path.is_absolute():
+        abs_old_path = old_path
+    else:
+        # Handle both 'img/source/file.jpg' and 'source/file.jpg'
+        if str(old_path).startswith("img/"):
+            # If it has img/ prefix, it's relative to the PARENT of image_dir (usually PROJECT_ROOT if local)
+            # But if image_dir is external, 'img/' is likely inside it.
+            # The most robust way is to check both.
+            abs_old_path = image_dir / old_path
+            if not abs_old_path.exists():
+                # Strip 'img/' and try again
+                abs_old_path = image_dir / Path(*old_path.parts[1:])
         else:
-            # Handle both 'img/source/file.jpg' and 'source/file.jpg'
-            if str(old_path).startswith("img/"):
-                # If it has img/ prefix, it's relative to the PARENT of image_dir (usually PROJECT_ROOT if local)
-                # But if image_dir is external, 'img/' is likely inside it.
-                # The most robust way is to check both.
-                abs_old_path = image_dir / old_path
-                if not abs_old_path.exists():
-                    # Strip 'img/' and try again
-                    abs_old_path = image_dir / Path(*old_path.parts[1:])
-            else:
-                abs_old_path = image_dir / old_path
-        
-        if not abs_old_path.exists():
-            logger.warning(f"[-] Original file not found: {abs_old_path}")
-            db.update_organization(img_id, str(old_path), status='error')
-            continue
+            abs_old_path = image_dir / old_path
+    
+    if not abs_old_path.exists():
+        logger.warning(f"[-] Original file not found: {abs_old_path}")
+        metrics.error("organize", "file_not_found")
+        db.update_organization(img_id, str(old_path), status='error')
+        return
 
-        # 2. Construct New Path with robust sanitization
-        navy = sanitize(item.get('navy', 'Unknown'))
-        ship_type = sanitize(item.get('ship_type', 'Unknown'))
-        view_type = sanitize(item.get('view_type', 'Unknown'))
-        ship_name = sanitize(item.get('ship_name', 'Unknown'))
-        
-        # classified/{navy}/{ship_type}/{view_type}/
-        target_dir = classified_base / navy / ship_type / view_type
-        
-        # 3. Construct Filename
-        # {navy}_{ship_name}_{view_type}_{id}.jpg
-        ext = abs_old_path.suffix or ".jpg"
-        new_filename = f"{navy}_{ship_name}_{view_type}_{img_id}{ext}"
-        target_path = target_dir / new_filename
-        
-        # Relative path for DB storage (relative to image_dir)
-        rel_target_path = f"classified/{navy}/{ship_type}/{view_type}/{new_filename}"
+    # 2. Construct New Path with robust sanitization
+    navy = sanitize(item.get('navy', 'Unknown'))
+    ship_type = sanitize(item.get('ship_type', 'Unknown'))
+    view_type = sanitize(item.get('view_type', 'Unknown'))
+    ship_name = sanitize(item.get('ship_name', 'Unknown'))
+    
+    # classified/{navy}/{ship_type}/{view_type}/
+    target_dir = classified_base / navy / ship_type / view_type
+    
+    # 3. Construct Filename
+    # {navy}_{ship_name}_{view_type}_{id}.jpg
+    ext = abs_old_path.suffix or ".jpg"
+    new_filename = f"{navy}_{ship_name}_{view_type}_{img_id}{ext}"
+    target_path = target_dir / new_filename
+    
+    # Relative path for DB storage (relative to image_dir)
+    rel_target_path = f"classified/{navy}/{ship_type}/{view_type}/{new_filename}"
 
-        if dry_run:
-            logger.info(f"[DRY RUN] Would move {abs_old_path} -> {target_path}")
-            continue
+    if dry_run:
+        logger.info(f"[DRY RUN] Would move {abs_old_path} -> {target_path}")
+        return
 
-        # 4. Perform Action
-        try:
-            target_dir.mkdir(parents=True, exist_ok=True)
-            
+    # 4. Perform Action
+    try:
+        target_dir.mkdir(parents=True, exist_ok=True)
+        
+        action = "copy" if copy_only else "move"
+        with metrics.timed("organize_file_seconds", action=action), tracing.span(f"file.{action}"):
             if copy_only:
                 shutil.copy2(abs_old_path, target_path)
                 logger.info(f"[+] Copied: {img_id} to img/{rel_target_path}")
             else:
                 shutil.move(abs_old_path, target_path)
                 logger.info(f"[+] Moved: {img_id} to img/{rel_target_path}")
-            
-            # 5. Update DB
+        
+        # 5. Update DB
+        with metrics.timed("db_write_seconds", op="update_organization"), tracing.span("db.update_organization"):
             db.update_organization(img_id, rel_target_path, status='organized')
-            
-        except Exception as e:
-            logger.error(f"[!] Failed to organize {img_id}: {e}")
-            db.update_organization(img_id, str(old_path), status='error')
+        metrics.inc("organize_images_total", status="organized")
+        
+    except Exception as e:
+        logger.error(f"[!] Failed to organize {img_id}: {e}")
+        metrics.error("organize", e)
+        metrics.inc("organize_images_total", status="error")
+        db.update_organization(img_id, str(old_path), status='error')
 
 def main():
     parser = argparse.ArgumentParser(description="Naval Gallery Image Organizer")
     parser.add_argument("--limit", type=int, default=None, help="Max images to organize")
     parser.add_argument("--copy", action="store_true", help="Copy instead of move")
     parser.add_argument("--dry-run", action="store_true", help="Show what would happen")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Record metrics and export them to data/metrics/ (env NAVAL_GALLERY_METRICS=1)")
+    parser.add_argument("--trace", nargs="?", const="", default=None, metavar="FILE",
+                        help="Write spans to FILE (default data/traces/trace.jsonl); see tools/trace_report.py")
+    profiling.add_arguments(parser)
     
     args = parser.parse_args()
+    if args.metrics:
+        metrics.enable()
+    if args.trace is not None:
+        tracing.enable(args.trace or None)
     
-    organize_images(limit=args.limit, copy_only=args.copy, dry_run=args.dry_run)
+    with profiling.from_args(args, "organize"), metrics.timed("run_seconds", stage="organize"):
+        organize_images(limit=args.limit, copy_only=args.copy, dry_run=args.dry_run)
+    metrics.export("organize")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Record image dimensions and file facts from headers alone.
+
+Pillow's Image.open reads only the file header; pixels are decoded on
+load(), which this never calls. Every stored image is probed that way in a
+thread pool (the work is file I/O on a synced folder, not CPU), and its
+width, height, format, mode, dpi, byte_size and mtime go on the record
+(db.PROBE_COLUMNS), so later stages decide without opening the file:
+
+    resize_images.py --preflight   shrinks files over the upload limit before they fail
+    scheduler.py                   ranks the classification backlog by pixel size
+    index.html                     reserves the modal image's box before it loads
+
+The classifier probes newly imported images before each run. With --all,
+files already probed are checked again, but a file whose size and mtime
+match the stored values costs one stat and is not reopened. A file Pillow
+cannot read is recorded with format "unreadable" (and its size and mtime),
+so it is reported once rather than on every run; --all retries it once
+the file changes.
+
+Usage:
+    python tools/probe_images.py [--workers N] [--all]
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from config import get_image_dir, validate_config
+import db
+import imaging
+import profiling
+
+DEFAULT_THREADS = 16
+UNREADABLE = "unreadable"  # `format` of a file that could not be probed
+
+
+@dataclass
+class ProbeResult:
+    local_path: str
+    ok: bool
+    info: Optional[dict] = None      # PROBE_COLUMNS values; None if unchanged
+    unchanged: bool = False
+    error: Optional[str] = None
+
+
+def probe_file(path) -> dict:
+    "PROBE_COLUMNS values for one file, read from its header."
+    stat = os.stat(path)
+    with imaging.open_image(path) as img:
+        dpi = img.info.get("dpi")
+        return {
+            "width": img.width,
+            "height": img.height,
+            "format": img.format,
+            "mode": img.mode,
+            "dpi": round(float(dpi[0]), 2) if dpi else None,
+            "byte_size": stat.st_size,
+            "mtime": stat.st_mtime,
+        }
+
+
+def _probe(local_path: str, path, known: Optional[Tuple[int, float]]) -> ProbeResult:
+    result = ProbeResult(local_path=local_path, ok=False)
+    try:
+        if known is not None:
+            stat = os.stat(path)
+            if (stat.st_size, stat.st_mtime) == known:
+                result.ok = result.unchanged = True
+                return result
+        result.info = probe_file(path)
+        result.ok = True
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+        try:
+            stat = os.stat(path)
+            result.info = {"format": UNREADABLE, "byte_size": stat.st_size, "mtime": stat.st_mtime}
+        except OSError:
+            pass
+    return result
+
+
+def probe(items: Iterable, workers: Optional[int] = None):
+    """
+    Probe (local_path, path, known) items in a thread pool, where `known`
+    is the stored (byte_size, mtime) or None; yields ProbeResults in order.
+    """
+    with ThreadPoolExecutor(max_workers=workers or DEFAULT_THREADS) as pool:
+        yield from pool.map(lambda item: _probe(*item), items)
+
+
+def run(recheck: bool = False, local_paths: Optional[Iterable[str]] = None,
+        workers: Optional[int] = None) -> Dict[str, int]:
+    """
+    Probe images not probed yet (every image with `recheck`, or just the
+    files at `local_paths`) and store the results; returns counts.
+    """
+    image_dir = get_image_dir()
+    # A view's size is its bounds, recorded when it is split
+    where, params = db.PLATE_FILES, []
+    if local_paths is not None:
+        local_paths = list(local_paths)
+        if not local_paths:
+            return {"probed": 0, "unchanged": 0, "missing": 0, "failed": 0}
+        where += f" AND local_path IN ({', '.join('?' * len(local_paths))})"
+        params = local_paths
+    elif not recheck:
+        # Unreadable files carry a format marker and are not retried
+        where += " AND width IS NULL AND format IS NULL"
+    records = db.select_images(where, params, columns=("local_path", "byte_size", "mtime"))
+
+    counts = {"probed": 0, "unchanged": 0, "missing": 0, "failed": 0}
+    items = {}
+    for record in records:
+        path = image_dir / record["local_path"]
+        if record["local_path"] in items:
+            continue
+        if not path.exists():
+            counts["missing"] += 1
+            continue
+        stored = (record.get("byte_size"), record.get("mtime"))
+        known = stored if recheck and local_paths is None and None not in stored else None
+        items[record["local_path"]] = (record["local_path"], path, known)
+
+    rows = []
+    for result in probe(items.values(), workers=workers):
+        if not result.ok:
+            counts["failed"] += 1
+            print(f"[!] {result.local_path}: {result.error}")
+            if result.info:
+                rows.append((result.local_path, result.info))
+        elif result.unchanged:
+            counts["unchanged"] += 1
+        else:
+            counts["probed"] += 1
+            rows.append((result.local_path, result.info))
+    if rows:
+        db.save_probes(rows)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record image dimensions, format and file size from headers")
+    parser.add_argument("--workers", type=int, default=None,
+                        help=f"Probe threads (default: {DEFAULT_THREADS})")
+    parser.add_argument("--all", action="store_true",
+                        help="Also re-probe images probed before whose file size or mtime changed")
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    validate_config()
+    db.init_db()  # adds the probe columns to older databases
+    with profiling.from_args(args, "probe_images"):
+        counts = run(recheck=args.all, workers=args.workers)
+    print(f"[*] {counts['probed']} probed, {counts['unchanged']} unchanged, "
+          f"{counts['missing']} missing, {counts['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Shared --profile harness for the tools/ command-line scripts.
+
+    --profile cpu     cProfile of the main thread; writes the raw .prof (load it
+                      with pstats or snakeviz) and a top-N text summary sorted by
+                      cumulative and by own time
+    --profile mem     tracemalloc snapshots every --profile-interval seconds, each
+                      diffed against the previous one, plus a final diff against
+                      the start, to spot growth across long runs
+    --profile async   event-loop lag sampling: a callback scheduled every
+                      --profile-interval seconds records how late it ran, i.e.
+                      how long something blocked the loop
+
+Results go to data/profiles/<tool>_<mode>_<timestamp>.* (override the
+directory with NAVAL_GALLERY_PROFILE_DIR).
+
+Scripts with their own argparse parser call `add_arguments(parser)` and wrap
+their work in `from_args(args, name)`; scripts without one end with
+`profiling.run_cli(run, name)`.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import cProfile
+import pstats
+import argparse
+import threading
+import tracemalloc
+import contextlib
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from config import DATA_DIR
+
+PROFILE_DIR = DATA_DIR / "profiles"
+MODES = ("cpu", "mem", "async")
+
+DEFAULT_TOP = 30
+DEFAULT_INTERVALS = {"cpu": None, "mem": 60.0, "async": 0.1}
+MEM_FRAMES = 10
+STALL_THRESHOLD = 0.1  # seconds of loop lag reported individually
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--profile", choices=MODES, default=None,
+                        help="Profile this run (cpu, mem or async); results go to data/profiles/")
+    parser.add_argument("--profile-top", type=int, default=DEFAULT_TOP,
+                        help="Entries per profile summary (default: %(default)s)")
+    parser.add_argument("--profile-interval", type=float, default=None,
+                        help="Seconds between mem snapshots (default 60) or async lag samples (default 0.1)")
+
+
+def forward(args) -> List[str]:
+    "The --profile flags of `args`, for passing on to a child script."
+    if not getattr(args, "profile", None):
+        return []
+    argv = ["--profile", args.profile, "--profile-top", str(args.profile_top)]
+    if args.profile_interval is not None:
+        argv += ["--profile-interval", str(args.profile_interval)]
+    return argv
+
+
+def from_args(args, name: str):
+    "A Profiler for the parsed --profile flags, or a no-op context when not profiling."
+    if not getattr(args, "profile", None):
+        return contextlib.nullcontext()
+    return Profiler(args.profile, name, top=args.profile_top, interval=args.profile_interval)
+
+
+def run_cli(fn, name: str, argv=None, description: str = None):
+    "Entry point for scripts without a parser: parse the --profile flags and run fn()."
+    parser = argparse.ArgumentParser(description=description or name)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    with from_args(args, name):
+        return fn()
+
+
+class _LagSampler:
+    "Self-rescheduling loop callback that records how late each tick fires."
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = []  # (seconds since start, lag seconds)
+        self.started = time.monotonic()
+        self.running = True
+        self._handles = {}
+
+    def attach(self, loop) -> None:
+        self._schedule(loop)
+
+    def _schedule(self, loop) -> None:
+        expected = loop.time() + self.interval
+        self._handles[loop] = loop.call_at(expected, self._tick, loop, expected)
+
+    def _tick(self, loop, expected) -> None:
+        lag = max(0.0, loop.time() - expected)
+        self.samples.append((time.monotonic() - self.started, lag))
+        if self.running and not loop.is_closed():
+            self._schedule(loop)
+
+    def stop(self) -> None:
+        self.running = False
+        for handle in self._handles.values():
+            handle.cancel()
+        self._handles.clear()
+
+    def summary(self) -> dict:
+        lags = sorted(lag for _, lag in self.samples)
+        if not lags:
+            return {"samples": 0, "interval_s": self.interval, "note": "no event loop ran while profiling"}
+
+        def pct(q):
+            return round(lags[min(len(lags) - 1, int(q * len(lags)))], 6)
+
+        stalls = [{"at_s": round(at, 3), "lag_s": round(lag, 6)}
+                  for at, lag in self.samples if lag >= STALL_THRESHOLD]
+        return {
+            "samples": len(lags),
+            "interval_s": self.interval,
+            "mean_s": round(sum(lags) / len(lags), 6),
+            "p50_s": pct(0.5),
+            "p95_s": pct(0.95),
+            "p99_s": pct(0.99),
+            "max_s": round(lags[-1], 6),
+            "blocked_s": round(sum(lags), 6),
+            "stalls": stalls,
+        }
+
+
+class Profiler:
+    """
+    Context manager profiling the enclosed block in one mode and writing the
+    results on exit. `outputs` lists the files written.
+    """
+
+    def __init__(self, mode: str, name: str, top: int = DEFAULT_TOP,
+                 interval: Optional[float] = None, directory=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profile mode {mode!r} (expected one of {', '.join(MODES)})")
+        self.mode = mode
+        self.name = name
+        self.top = top
+        self.interval = interval if interval is not None else DEFAULT_INTERVALS[mode]
+        self.directory = Path(directory or os.environ.get("NAVAL_GALLERY_PROFILE_DIR") or PROFILE_DIR)
+        self.stem = f"{name}_{mode}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        self.outputs: List[Path] = []
+
+    def _path(self, suffix: str) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{self.stem}{suffix}"
+        self.outputs.append(path)
+        return path
+
+    def __enter__(self):
+        getattr(self, f"_start_{self.mode}")()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        getattr(self, f"_stop_{self.mode}")()
+        for path in self.outputs:
+            print(f"[*] Profile written to {path}", file=sys.stderr)
+        return False
+
+    # -- cpu ---------------------------------------------------------------
+
+    def _start_cpu(self):
+        self._cprofile = cProfile.Profile()
+        self._cprofile.enable()
+
+    def _stop_cpu(self):
+        self._cprofile.disable()
+        self._cprofile.dump_stats(self._path(".prof"))
+        with open(self._path(".txt"), "w") as f:
+            stats = pstats.Stats(self._cprofile, stream=f).strip_dirs()
+            f.write(f"# {self.name}: top {self.top} by cumulative time\n")
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+            f.write(f"\n# {self.name}: top {self.top} by own time\n")
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top)
+
+    # -- mem ---------------------------------------------------------------
+
+    def _start_mem(self):
+        self._was_tracing = tracemalloc.is_tracing()
+        if not self._was_tracing:
+            tracemalloc.start(MEM_FRAMES)
+        self._mem_started = time.monotonic()
+        self._mem_report = open(self._path(".txt"), "w")
+        self._baseline = self._previous = self._snapshot()
+        self._mem_stop = threading.Event()
+        self._mem_thread = threading.Thread(target=self._mem_loop, name="profile-mem", daemon=True)
+        self._mem_thread.start()
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+
+    def _write_diff(self, title: str, snapshot, against) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        elapsed = time.monotonic() - self._mem_started
+        f = self._mem_report
+        f.write(f"## {title} at +{elapsed:.0f}s: current {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB\n")
+        for stat in snapshot.compare_to(against, "lineno")[:self.top]:
+            f.write(f"  {stat}\n")
+        f.write("\n")
+        f.flush()
+
+    def _mem_loop(self):
+        while not self._mem_stop.wait(self.interval):
+            snapshot = self._snapshot()
+            self._write_diff("growth since previous snapshot", snapshot, self._previous)
+            self._previous = snapshot
+
+    def _stop_mem(self):
+        self._mem_stop.set()
+        self._mem_thread.join()
+        self._write_diff("growth since start", self._snapshot(), self._baseline)
+        self._mem_report.close()
+        self._baseline = self._previous = None
+        if not self._was_tracing:
+            tracemalloc.stop()
+
+    # -- async -------------------------------------------------------------
+
+    def _start_async(self):
+        self._sampler = _LagSampler(self.interval)
+        try:
+            self._sampler.attach(asyncio.get_running_loop())
+        except RuntimeError:
+            pass  # no loop yet: sample the loops the profiled code creates
+        self._policy = asyncio.get_event_loop_policy()
+        create = self._policy.new_event_loop
+
+        def new_event_loop():
+            loop = create()
+            self._sampler.attach(loop)
+            return loop
+
+        self._policy.new_event_loop = new_event_loop
+
+    def _stop_async(self):
+        self._sampler.stop()
+        del self._policy.new_event_loop
+        with open(self._path(".json"), "w") as f:
+            json.dump({"tool": self.name, **self._sampler.summary()}, f, indent=2)
@@ -1,94 +1,241 @@
 #!/usr/bin/env python3
 """
 Resize images that are too large for the vision model.
-Finds images that failed with 'too large' errors and resizes them.
+Finds images that failed with 'too large' errors and resizes them. With
+--preflight, pending images whose recorded file size (tools/probe_images.py)
+is over the target are resized before they are sent and fail.
+
+Each image is encoded in memory: a binary search over JPEG quality finds the
+best quality that fits the byte target, and only if even the lowest quality
+is too big does a second search over scale shrink the pixels. Files are
+processed in parallel worker processes, and only the final JPEG is written,
+via an atomic replace, so a synced Drive folder sees one write per image.
+When pixels had to go, the crop boxes stored for the plate and for views
+split from it (bounds, roi_boxes) are scaled to the new size. Views share
+their plate's file and are never resized on their own.
+
+Usage:
+    python tools/resize_images.py [--target-mb 4.5] [--workers N] [--memory-mb MB] [--preflight]
 """
 
+import io
 import os
 import sys
+import math
 import sqlite3
+import argparse
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional, Tuple
 from PIL import Image
 
 # Add to path for config import
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from config import get_image_dir, validate_config, DATA_DIR
+import db
+import profiling
+import imaging
+import probe_images
 
 DB_PATH = DATA_DIR / "gallery.db"
 
+DEFAULT_TARGET_MB = 4.5
+MIN_QUALITY = 30
+MAX_QUALITY = 95
+QUALITY_STEP = 5
+SCALE_QUALITY = 85      # quality used once pixels have to go
+MIN_SCALE = 0.05
+SCALE_TOLERANCE = 0.02  # stop the scale search once the bracket is this tight
+
+
+@dataclass
+class ResizeResult:
+    path: str
+    ok: bool
+    before: int = 0
+    after: int = 0
+    quality: Optional[int] = None
+    scale: float = 1.0
+    encodes: int = 0
+    source_size: Optional[Tuple[int, int]] = None
+    size: Optional[Tuple[int, int]] = None   # (w, h) written, if pixels were dropped
+    error: Optional[str] = None
+
+
 def get_oversized_failures():
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
-    
+
     cursor.execute("""
-        SELECT id, local_path FROM images 
-        WHERE analysis_status = 'failed' 
+        SELECT id, local_path FROM images
+        WHERE analysis_status = 'failed'
+        AND parent_id IS NULL
         AND error_message LIKE '%too large%'
     """)
     rows = cursor.fetchall()
     conn.close()
     return [dict(row) for row in rows]
 
-def resize_image(relative_path, target_size_mb=4.5):
+
+def get_oversized_pending(target_bytes: int):
+    "Images not analyzed yet whose probed file size is over target_bytes."
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        SELECT id, local_path FROM images
+        WHERE analysis_status = 'pending'
+        AND parent_id IS NULL
+        AND byte_size > ?
+    """, (target_bytes,))
+    rows = cursor.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+def encode_jpeg(img, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+class _Encoder:
+    "Encodes the image at a quality and scale, counting attempts."
+
+    def __init__(self, img):
+        self.img = img
+        self.encodes = 0
+
+    def encode(self, quality: int, scale: float = 1.0) -> bytes:
+        self.encodes += 1
+        img = self.img
+        if scale < 1.0:
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            img = img.resize(size, Image.Resampling.LANCZOS, reducing_gap=imaging.REDUCING_GAP)
+        return encode_jpeg(img, quality)
+
+
+def fit_jpeg(img, target_bytes: int, min_quality: int = MIN_QUALITY, max_quality: int = MAX_QUALITY,
+             scale_quality: int = SCALE_QUALITY) -> Tuple[bytes, int, float, int]:
+    """
+    Encode `img` as the best JPEG no larger than `target_bytes`.
+
+    Returns (data, quality, scale, encodes). Quality is searched first (in
+    steps of QUALITY_STEP); scale only when min_quality at full size is still
+    too big, starting from an estimate that assumes bytes grow with pixel
+    count.
+    """
+    enc = _Encoder(img)
+
+    # Binary search for the highest quality that fits at full size
+    qualities = list(range(min_quality, max_quality + 1, QUALITY_STEP))
+    lo, hi = 0, len(qualities) - 1
+    best = None
+    smallest = None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        data = enc.encode(qualities[mid])
+        if len(data) <= target_bytes:
+            best = (data, qualities[mid])
+            lo = mid + 1
+        else:
+            smallest = len(data) if smallest is None else min(smallest, len(data))
+            hi = mid - 1
+    if best is not None:
+        return best[0], best[1], 1.0, enc.encodes
+
+    # Too big even at min_quality: shrink pixels at scale_quality. Bytes grow
+    # roughly with pixel count, so each step re-estimates the scale from the
+    # last size (a safeguarded secant search inside the [lo, hi] bracket).
+    lo, hi = MIN_SCALE, 1.0
+    scale = math.sqrt(target_bytes / smallest)
+    while True:
+        data = enc.encode(scale_quality, scale)
+        if len(data) <= target_bytes:
+            best = (data, scale)
+            lo = scale
+        else:
+            hi = scale
+        if hi - lo <= SCALE_TOLERANCE or (best is None and hi <= MIN_SCALE):
+            break
+        guess = scale * math.sqrt(target_bytes / len(data)) * 0.99
+        margin = (hi - lo) * 0.1
+        scale = min(max(guess, lo + margin), hi - margin)
+    if best is None:
+        raise ValueError(f"cannot fit {target_bytes} bytes even at scale {MIN_SCALE}")
+    return best[0], scale_quality, round(best[1], 4), enc.encodes
+
+
+def resize_file(path, target_bytes: int, budget: Optional[int] = None) -> ResizeResult:
+    """
+    Shrink one file in place to at most target_bytes (runs in a worker process).
+
+    Decoding is capped at `budget` bytes (see tools/imaging.py): a JPEG too
+    big to decode whole is drafted down first, and `scale` in the result is
+    relative to the original size.
+    """
+    path = Path(path)
+    result = ResizeResult(path=str(path), ok=False)
+    try:
+        result.before = path.stat().st_size
+        if result.before <= target_bytes:
+            result.ok, result.after = True, result.before
+            return result
+        _, mode, _ = imaging.probe(path)
+        # Convert to RGB if needed (e.g. RGBA to JPG)
+        img = imaging.load(path, mode=imaging.jpeg_mode(mode), budget=budget)
+        data, result.quality, scale, result.encodes = fit_jpeg(img, target_bytes)
+        result.source_size = img.info["source_size"]
+        result.scale = round(scale * img.width / result.source_size[0], 4)
+        if result.scale < 1.0:
+            with imaging.open_image(io.BytesIO(data)) as written:
+                result.size = written.size
+        imaging.write_atomic(path, data)
+        result.ok, result.after = True, len(data)
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    return result
+
+
+def resize_files(paths, target_bytes: int, workers: Optional[int] = None, memory_mb: Optional[float] = None):
+    """
+    Resize files in parallel; yields ResizeResults as they finish.
+    `memory_mb` is shared across workers (imaging.map_in_pool).
+    """
+    return imaging.map_in_pool(resize_file, [(path, target_bytes) for path in paths], workers, memory_mb)
+
+
+def resize_image(relative_path, target_size_mb=DEFAULT_TARGET_MB):
     """Resize image to be under target_size_mb."""
     # Images are stored relative to the image directory
-    img_dir = get_image_dir()
-    img_path = img_dir / relative_path
-        
+    img_path = get_image_dir() / relative_path
     if not img_path.exists():
         print(f"[-] File not found: {img_path}")
         return False
-        
-    start_size = img_path.stat().st_size / (1024 * 1024)
-    if start_size < target_size_mb:
-        print(f"[*] {img_path.name} is already {start_size:.2f}MB (under limit).")
-        return True
-        
-    print(f"[*] Resizing {img_path.name} ({start_size:.2f}MB)...")
-    
-    try:
-        with Image.open(img_path) as img:
-            # Convert to RGB if needed (e.g. RGBA to JPG)
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-                
-            # Initial quality reduction
-            quality = 95
-            scale = 0.9
-            
-            # Iteratively reduce
-            while True:
-                # Save to temp
-                temp_path = img_path.with_suffix('.tmp.jpg')
-                img.save(temp_path, "JPEG", quality=quality)
-                
-                new_size = temp_path.stat().st_size / (1024 * 1024)
-                
-                if new_size < target_size_mb:
-                    print(f"    -> Success: {new_size:.2f}MB (Quality: {quality})")
-                    temp_path.replace(img_path)
-                    return True
-                
-                # Reduce more
-                quality -= 10
-                if quality < 30:
-                    # Resize dimensions if quality too low
-                    width, height = img.size
-                    new_dims = (int(width * scale), int(height * scale))
-                    print(f"    -> Resizing dimensions to {new_dims}...")
-                    img = img.resize(new_dims, Image.Resampling.LANCZOS)
-                    quality = 85 # Reset quality for new dimensions
-                    
-    except Exception as e:
-        print(f"[!] Error resizing {img_path}: {e}")
-        return False
+    result = resize_file(img_path, int(target_size_mb * 1024 * 1024))
+    _report(result)
+    return result.ok
+
+
+def _report(result: ResizeResult):
+    name = Path(result.path).name
+    if not result.ok:
+        print(f"[!] Error resizing {result.path}: {result.error}")
+    elif not result.encodes:
+        print(f"[*] {name} is already {result.before / 1024 / 1024:.2f}MB (under limit).")
+    else:
+        scale = f", scale {result.scale:.2f}" if result.scale < 1.0 else ""
+        print(f"[+] {name}: {result.before / 1024 / 1024:.2f}MB -> {result.after / 1024 / 1024:.2f}MB "
+              f"(quality {result.quality}{scale}, {result.encodes} encodes)")
+
 
 def reset_status(img_id):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute("""
-        UPDATE images SET 
+        UPDATE images SET
             analysis_status = 'pending',
             error_message = NULL
         WHERE id = ?
@@ -96,18 +243,50 @@ def reset_status(img_id):
     conn.commit()
     conn.close()
 
-if __name__ == "__main__":
+def main():
+    parser = argparse.ArgumentParser(description="Resize images that failed as too large for the vision model")
+    parser.add_argument("--target-mb", type=float, default=DEFAULT_TARGET_MB,
+                        help="Maximum file size in MB (default: %(default)s)")
+    imaging.add_pool_arguments(parser)
+    parser.add_argument("--preflight", action="store_true",
+                        help="Resize pending images recorded as over the target before they fail")
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
     # Validate config first
     validate_config()
-    
-    failures = get_oversized_failures()
-    if not failures:
-        print("[*] No oversized failures found.")
-        sys.exit(0)
-        
-    print(f"[*] Found {len(failures)} oversized images.")
-    
-    for item in failures:
-        if resize_image(item['local_path']):
-            reset_status(item['id'])
-            print(f"[+] Reset status for {item['id']}")
+
+    target = int(args.target_mb * 1024 * 1024)
+    with profiling.from_args(args, "resize_images"):
+        items = get_oversized_pending(target) if args.preflight else get_oversized_failures()
+        if not items:
+            print("[*] No oversized pending images found." if args.preflight else "[*] No oversized failures found.")
+            return
+
+        print(f"[*] Found {len(items)} oversized images.")
+        img_dir = get_image_dir()
+        by_path = {}
+        for item in items:
+            path = img_dir / item['local_path']
+            if path.exists():
+                by_path[str(path)] = item
+            else:
+                print(f"[-] File not found: {path}")
+
+        resized = []
+        for result in resize_files(list(by_path), target, workers=args.workers, memory_mb=args.memory_mb):
+            _report(result)
+            if result.ok:
+                item = by_path[result.path]
+                resized.append(item['local_path'])
+                if result.size:
+                    # Crop boxes of the plate and of views split from it were in the old pixels
+                    db.rescale_boxes(item['local_path'], result.source_size, result.size)
+                if not args.preflight:
+                    reset_status(item['id'])
+                    print(f"[+] Reset status for {item['id']}")
+        # Record the new dimensions and sizes
+        probe_images.run(local_paths=resized)
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,15 @@ import sys
 import subprocess
 import json
 import glob
+import argparse
 from pathlib import Path
 
 # Add to path for config import
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from config import validate_config, DATA_DIR
+import profiling
 
-def run():
+def run(child_args=()):
     # Validate config BEFORE running any harvesters
     validate_config()
     
@@ -29,7 +31,7 @@ def run():
     for script in scripts:
         print(f"\n>>> Running {script}...")
         try:
-            subprocess.run([sys.executable, script], check=False)
+            subprocess.run([sys.executable, script, *child_args], check=False)
         except Exception as e:
             print(f"Failed to run {script}: {e}")
             
@@ -82,5 +84,13 @@ def run():
     with open(DATA_DIR / "images.js", "w") as f:
         f.write(f"const images = {json.dumps(frontend_images, indent=2)};")
 
+def main():
+    parser = argparse.ArgumentParser(description="Run every harvester and rebuild the master manifest")
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    # Each harvester is profiled in its own process with the same flags
+    with profiling.from_args(args, "run_all"):
+        run(child_args=profiling.forward(args))
+
 if __name__ == "__main__":
-    run()
+    main()
@@ -0,0 +1,199 @@
+"""
+Priority scheduler for the classification backlog.
+
+`get_pending` returns rows in table order, so a limited daily API budget
+used to be spent on whatever was imported first. The scheduler scores each
+pending image from cheap signals that need no API call:
+
+    source          curated plan archives outrank scanned recognition manuals
+    pixel size      megapixels (log-scaled); large plates extract better
+
+A missing pixel size (the metadata probe has not run) scores as neutral,
+so the scheduler works on any schema version.
+
+Work is handed out from a heap in score order, subject to per-source
+fairness quotas: a source that has used its share of the run waits while
+other sources still have work, so one large scan cannot eat the budget.
+"""
+
+import heapq
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+# Relative value of each harvest source for extraction (0.0 - 1.0)
+SOURCE_WEIGHTS = {
+    "Dreadnought Project": 1.0,
+    "NavSource": 0.9,
+    "Wikimedia Commons": 0.7,
+    "Library of Congress": 0.7,
+    "Pinterest": 0.4,
+}
+
+# Internet Archive harvesters use the item id as the source, so fall back to
+# the staging folder to recognize them
+PATH_SOURCES = {
+    "oni/": ("ONI Manuals", 0.3),
+    "ia/": ("Internet Archive", 0.5),
+}
+
+DEFAULT_SOURCE_WEIGHT = 0.5
+NEUTRAL = 0.5
+
+# Contribution of each signal to the final score (sums to 1.0)
+WEIGHTS = {
+    "source": 0.6,
+    "pixels": 0.4,
+}
+
+# Sources whose harvests are almost always ship plates; these go through
+# the combined single-pass prompt
+LIKELY_SHIP_SOURCES = {"Dreadnought Project", "NavSource", "Wikimedia Commons"}
+
+# Megapixels at which the pixel signal saturates
+FULL_RES_MEGAPIXELS = 24.0
+
+
+def source_group(item: dict) -> str:
+    "Canonical source name used for weights and quotas."
+    source = item.get("source") or ""
+    if source in SOURCE_WEIGHTS:
+        return source
+    local_path = item.get("local_path") or ""
+    for prefix, (name, _) in PATH_SOURCES.items():
+        if local_path.startswith(prefix) or f"/{prefix}" in local_path:
+            return name
+    return source or "unknown"
+
+
+def source_weight(item: dict) -> float:
+    group = source_group(item)
+    if group in SOURCE_WEIGHTS:
+        return SOURCE_WEIGHTS[group]
+    for name, weight in PATH_SOURCES.values():
+        if group == name:
+            return weight
+    return DEFAULT_SOURCE_WEIGHT
+
+
+def pixel_signal(item: dict) -> float:
+    width, height = item.get("width"), item.get("height")
+    if not width or not height:
+        return NEUTRAL
+    megapixels = (width * height) / 1_000_000
+    return min(1.0, math.log1p(megapixels) / math.log1p(FULL_RES_MEGAPIXELS))
+
+
+def likely_ship(item: dict) -> bool:
+    "True if an image is confidently a ship drawing before any API call."
+    return source_group(item) in LIKELY_SHIP_SOURCES
+
+
+def score(item: dict) -> float:
+    "Priority of a pending image, 0.0 (classify last) to 1.0 (classify first)."
+    return WEIGHTS["source"] * source_weight(item) + WEIGHTS["pixels"] * pixel_signal(item)
+
+
+def parse_quotas(specs: Iterable[str]) -> Dict[str, float]:
+    "Parse CLI quota specs like 'ONI Manuals=0.1' or 'Pinterest=50'."
+    quotas = {}
+    for spec in specs or []:
+        name, sep, value = spec.rpartition("=")
+        if not sep or not name:
+            raise ValueError(f"Invalid quota '{spec}', expected SOURCE=SHARE")
+        quotas[name.strip()] = float(value)
+    return quotas
+
+
+class PriorityScheduler:
+    """
+    Heap-backed work queue ordered by score with per-source quotas.
+
+    quotas maps a source group to either a share of the run (0 < q <= 1)
+    or an absolute number of images (q > 1). Quotas are work-conserving:
+    once only over-quota sources have work left, they are served anyway
+    (unless a budget says the run is over).
+
+    pinned ids (e.g. images in flight when the last run crashed) are served
+    first regardless of score or quota.
+    """
+
+    def __init__(self, items: List[dict], quotas: Optional[Dict[str, float]] = None,
+                 budget: Optional[int] = None, pinned: Iterable[str] = ()):
+        self.budget = budget
+        self.dispatched = 0
+        self.per_source = defaultdict(int)
+        self._pinned = []
+        self._heap = []
+        self._deferred = []
+        self._current = None
+        self._slack = False  # only over-quota sources are left: quotas no longer apply
+
+        pinned_order = {img_id: i for i, img_id in enumerate(pinned)}
+        for seq, item in enumerate(items):
+            if item["id"] in pinned_order:
+                self._pinned.append((pinned_order[item["id"]], item))
+                continue
+            # seq breaks ties in table order and keeps dicts out of comparisons
+            self._heap.append((-score(item), seq, item))
+        self._pinned.sort(key=lambda entry: entry[0])
+        self._pinned = [item for _, item in self._pinned]
+        heapq.heapify(self._heap)
+
+        run_size = len(items) if budget is None else min(budget, len(items))
+        self._limits = {}
+        for name, quota in (quotas or {}).items():
+            self._limits[name] = int(quota) if quota > 1 else max(1, math.floor(quota * run_size))
+
+    def __len__(self):
+        waiting = len(self._pinned) + len(self._heap) + len(self._deferred) + (self._current is not None)
+        if self.budget is None:
+            return waiting
+        return min(waiting, max(0, self.budget - self.dispatched))
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def _over_quota(self, item: dict) -> bool:
+        limit = self._limits.get(source_group(item))
+        return limit is not None and self.per_source[source_group(item)] >= limit
+
+    def _select(self) -> Optional[dict]:
+        if self._pinned:
+            return self._pinned.pop(0)
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if not self._slack and self._over_quota(entry[2]):
+                self._deferred.append(entry)
+                continue
+            return entry[2]
+        if self._deferred:
+            # Nobody else is waiting: let over-quota sources use the slack. Their
+            # counts only grow, so they stay over quota and are not checked again
+            heapq.heapify(self._deferred)
+            self._heap, self._deferred = self._deferred, []
+            self._slack = True
+            return heapq.heappop(self._heap)[2]
+        return None
+
+    def peek(self) -> Optional[dict]:
+        "Next image to classify, without dispatching it."
+        if not self:
+            return None
+        if self._current is None:
+            self._current = self._select()
+        return self._current
+
+    def pop(self) -> Optional[dict]:
+        "Dispatch the next image and charge it to its source."
+        item = self.peek()
+        if item is None:
+            return None
+        self._current = None
+        self.dispatched += 1
+        self.per_source[source_group(item)] += 1
+        return item
+
+    def __iter__(self):
+        while self:
+            yield self.pop()
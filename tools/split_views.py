@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Split multi-view plates into one record per view.
+
+Phase 1 labels plates that show several views (profile over plan,
+bow/stern pairs, grids of sections) as multi_view_stacked or
+multi_view_grid, but describes only the primary view. This finds the views
+locally, with no API call, by XY-cutting the plate on whitespace:
+
+1. Binarize the plate at analysis size and restrict it to the drawing
+   (margins.find_content_box, so rulers do not become views).
+2. Split it into bands on runs of empty rows in the row projection
+   profile, then split each band on empty columns.
+3. Merge segments too small to be a view (captions, scale bars, stray
+   labels) into the nearest neighbour.
+
+Each view becomes a child record `<parent id>_v<n>` with `parent_id` set
+and its box in `bounds` ({x, y, width, height}, full-resolution pixels of
+the parent's file). Children share the parent's file and start as
+pending, so the classifier analyzes each view on its own crop; organizing
+the parent carries the children along. Plates are split in parallel
+worker processes; plates that already have children are skipped unless
+--force is given.
+
+Requires NumPy (`pip install .[layout]`).
+
+Usage:
+    python tools/split_views.py [--workers N] [--limit N] [--force]
+"""
+
+import os
+import sys
+import math
+import argparse
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from config import get_image_dir, validate_config
+import db
+import imaging
+import profiling
+from layout import binarize
+from margins import find_content_box
+
+MULTI_VIEW_TYPES = ("multi_view_stacked", "multi_view_grid")
+
+# Plates are analyzed at this size; boxes are scaled back to full resolution
+ANALYSIS_MAX_SIDE = 1600
+
+MIN_GAP = 0.02           # empty run separating views, as a share of the side being cut
+NOISE = 0.002            # rows/columns with less ink than this share of their length count as empty
+MIN_VIEW = 0.08          # segments thinner than this share of the side are merged into a neighbour
+PAD_FRACTION = 0.005     # padding around each view, as a share of the longer side
+MIN_PAD = 4
+
+Box = Tuple[int, int, int, int]  # x0, y0, x1, y1 (exclusive)
+
+
+@dataclass
+class SplitResult:
+    image_id: str
+    ok: bool
+    views: List[dict] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+def _segments(profile: np.ndarray, length: int) -> List[Tuple[int, int]]:
+    "[start, end) runs of a projection profile separated by at least MIN_GAP of empty bins."
+    filled = np.flatnonzero(profile > NOISE * length)
+    if len(filled) == 0:
+        return []
+    min_gap = max(2, round(MIN_GAP * len(profile)))
+    breaks = np.flatnonzero(np.diff(filled) > min_gap)
+    starts = np.concatenate(([filled[0]], filled[breaks + 1]))
+    ends = np.concatenate((filled[breaks], [filled[-1]])) + 1
+    return _merge_small(list(zip(starts.tolist(), ends.tolist())), len(profile))
+
+
+def _merge_small(segments: List[Tuple[int, int]], size: int) -> List[Tuple[int, int]]:
+    "Fold segments thinner than MIN_VIEW of `size` into the neighbour across the smaller gap."
+    segments = list(segments)
+    while len(segments) > 1:
+        widths = [end - start for start, end in segments]
+        i = int(np.argmin(widths))
+        if widths[i] >= MIN_VIEW * size:
+            break
+        gap_before = segments[i][0] - segments[i - 1][1] if i > 0 else math.inf
+        gap_after = segments[i + 1][0] - segments[i][1] if i + 1 < len(segments) else math.inf
+        j = i - 1 if gap_before <= gap_after else i + 1
+        a, b = sorted((i, j))
+        segments[a:b + 1] = [(segments[a][0], segments[b][1])]
+    return segments
+
+
+def find_views(gray: np.ndarray) -> List[Box]:
+    "View boxes of a greyscale plate in reading order (analysis coordinates); [] for a single view."
+    content = find_content_box(gray)
+    if content is None:
+        return []
+    cx0, cy0, cx1, cy1 = content
+    ink = binarize(gray)[cy0:cy1, cx0:cx1]
+    views = []
+    for y0, y1 in _segments(ink.sum(axis=1), ink.shape[1]):
+        band = ink[y0:y1]
+        for x0, x1 in _segments(band.sum(axis=0), band.shape[0]):
+            # Trim the view to its own ink: the band is as tall as its tallest view
+            rows = np.flatnonzero(band[:, x0:x1].any(axis=1))
+            views.append((cx0 + x0, cy0 + y0 + int(rows[0]), cx0 + x1, cy0 + y0 + int(rows[-1]) + 1))
+    return views if len(views) > 1 else []
+
+
+def detect_views(image_path) -> List[dict]:
+    "View boxes of a plate as [{x, y, width, height}] in full-resolution pixels, padded."
+    gray = imaging.load(image_path, max_side=ANALYSIS_MAX_SIDE, mode="L", resample=Image.Resampling.BILINEAR)
+    full_w, full_h = gray.info["source_size"]
+    scale = gray.width / full_w
+    pad = max(MIN_PAD, round(max(full_w, full_h) * PAD_FRACTION))
+    views = []
+    for box in find_views(np.asarray(gray)):
+        x0 = max(0, int(box[0] / scale) - pad)
+        y0 = max(0, int(box[1] / scale) - pad)
+        x1 = min(full_w, math.ceil(box[2] / scale) + pad)
+        y1 = min(full_h, math.ceil(box[3] / scale) + pad)
+        views.append({"x": x0, "y": y0, "width": x1 - x0, "height": y1 - y0})
+    return views
+
+
+def split_image(image_id: str, path) -> SplitResult:
+    "Find the views of one plate (runs in a worker process)."
+    result = SplitResult(image_id=image_id, ok=False)
+    try:
+        result.views = detect_views(path)
+        result.ok = True
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    return result
+
+
+def split(items, workers: Optional[int] = None):
+    "Split (image_id, path) pairs in parallel; yields SplitResults as they finish."
+    return imaging.map_in_pool(split_image, items, workers)
+
+
+def run(workers: Optional[int] = None, limit: Optional[int] = None, force: bool = False) -> dict:
+    "Split every multi-view plate not split yet and record the views; returns counts."
+    image_dir = get_image_dir()
+    where = f"parent_id IS NULL AND image_type IN ({', '.join('?' * len(MULTI_VIEW_TYPES))})"
+    if not force:
+        where += " AND id NOT IN (SELECT parent_id FROM images WHERE parent_id IS NOT NULL)"
+    records = db.select_images(where, MULTI_VIEW_TYPES, columns=("id", "local_path"), limit=limit)
+    items = [(r["id"], image_dir / r["local_path"]) for r in records
+             if r["local_path"] and (image_dir / r["local_path"]).exists()]
+
+    counts = {"plates": len(items), "split": 0, "single": 0, "failed": 0, "views": 0}
+    splits = []
+    for result in split(items, workers=workers):
+        if not result.ok:
+            counts["failed"] += 1
+            print(f"[!] {result.image_id}: {result.error}")
+        elif result.views:
+            counts["split"] += 1
+            counts["views"] += len(result.views)
+            splits.append((result.image_id, result.views))
+        else:
+            counts["single"] += 1
+    if splits:
+        db.save_views(splits)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split multi-view plates into per-view records")
+    imaging.add_pool_arguments(parser, memory=False)
+    parser.add_argument("--limit", type=int, default=None, help="Only consider the first N plates")
+    parser.add_argument("--force", action="store_true", help="Split plates again, replacing their views")
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    validate_config()
+    db.init_db()  # adds parent_id to older databases
+    with profiling.from_args(args, "split_views"):
+        counts = run(workers=args.workers, limit=args.limit, force=args.force)
+
+    print(f"[*] {counts['split']} of {counts['plates']} plates split into {counts['views']} views, "
+          f"{counts['single']} with a single view found, {counts['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Pack gallery thumbnails into sprite atlases for the grid.
+
+Even with thumbnails, a first page of 200 cards is 200 requests to a file
+share. An atlas is one image holding PER_SHEET thumbnails, cover-cropped
+to CELL_WIDTH x CELL_HEIGHT cells in a COLUMNS-wide grid, in the order the
+grid shows them; each record gets its cell's coordinates and the grid draws
+it as a CSS background, so a page of cards costs one or two requests.
+
+Cells are cut from the thumbnails (thumb files or packed thumbs, see
+tools/thumbnails.py), or from the source when an image has none. Sheets are
+named by a hash of their members and their content hashes, so a sheet
+whose membership is unchanged is reused, and sheets no longer referenced
+are deleted. Sheets are built in parallel worker processes.
+
+Normally run from sync_frontend (`db.sync_frontend(atlas=True)`, or
+NAVAL_GALLERY_ATLAS=1); as a script it syncs the frontend with atlases.
+
+Usage:
+    python tools/sprite_atlas.py [--format webp|avif|jpeg] [--workers N]
+"""
+
+import io
+import os
+import sys
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageOps
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from config import validate_config
+import db
+import imaging
+import profiling
+import thumbnails
+import thumbpack
+
+ATLAS_DIR = f"{thumbnails.DERIVED_DIR}/atlas"  # under the image directory
+CELL_WIDTH = 320
+CELL_HEIGHT = 200
+COLUMNS = 16
+PER_SHEET = 256
+
+# (image_id, local_path, thumb_path, content_hash) for each cell, in grid order
+Member = Tuple[str, Optional[str], Optional[str], Optional[str]]
+
+
+def sheet_path(members: Sequence[Member], fmt: str) -> str:
+    "Sheet location, relative to the image dir, named by what goes into it."
+    digest = hashlib.sha256()
+    digest.update(f"{CELL_WIDTH}x{CELL_HEIGHT}/{COLUMNS}\n".encode())
+    for image_id, local_path, thumb_path, content_hash in members:
+        digest.update(f"{image_id}\0{content_hash or local_path}\0{thumb_path}\n".encode())
+    return f"{ATLAS_DIR}/{digest.hexdigest()[:24]}{thumbnails.EXTENSIONS[fmt]}"
+
+
+def _open_cell_source(member: Member, image_dir: Path) -> Image.Image:
+    "The member's thumbnail, or its source decoded near cell size."
+    _, local_path, thumb_path, _ = member
+    if thumb_path:
+        packed = thumbpack.parse_range_ref(thumb_path)
+        if packed:
+            path, offset, length = packed
+            with open(image_dir / path, "rb") as f:
+                f.seek(offset)
+                return imaging.open_image(io.BytesIO(f.read(length)))
+        if (image_dir / thumb_path).exists():
+            return imaging.open_image(image_dir / thumb_path)
+    return imaging.load(image_dir / local_path, max_side=2 * max(CELL_WIDTH, CELL_HEIGHT))
+
+
+def cell_box(index: int) -> Tuple[int, int]:
+    "(x, y) of the index-th cell of a sheet."
+    return (index % COLUMNS) * CELL_WIDTH, (index // COLUMNS) * CELL_HEIGHT
+
+
+def sheet_size(count: int) -> Tuple[int, int]:
+    rows = (count + COLUMNS - 1) // COLUMNS
+    return min(count, COLUMNS) * CELL_WIDTH, rows * CELL_HEIGHT
+
+
+def build_sheet(members: Sequence[Member], image_dir, rel: str, fmt: str) -> List[str]:
+    """
+    Draw one sheet (runs in a worker process); returns the ids whose cells
+    were drawn. An existing sheet is reused as is.
+    """
+    image_dir = Path(image_dir)
+    out = image_dir / rel
+    if out.exists():
+        # Same name, same members (cells that failed to draw stay blank)
+        return [m[0] for m in members]
+    drawn = []
+    sheet = Image.new("RGB", sheet_size(len(members)), "#050814")
+    for index, member in enumerate(members):
+        try:
+            with _open_cell_source(member, image_dir) as img:
+                cell = ImageOps.fit(img.convert("RGB"), (CELL_WIDTH, CELL_HEIGHT), Image.Resampling.LANCZOS)
+        except Exception as e:
+            print(f"[!] Atlas cell for {member[0]}: {type(e).__name__}: {e}")
+            continue
+        sheet.paste(cell, cell_box(index))
+        drawn.append(member[0])
+    out.parent.mkdir(parents=True, exist_ok=True)
+    imaging.write_atomic(out, thumbnails.encode(sheet, fmt))
+    return drawn
+
+
+def build_atlases(members: Sequence[Member], image_dir, fmt: str = thumbnails.DEFAULT_FORMAT,
+                  per_sheet: Optional[int] = None, workers: Optional[int] = None) -> Dict[str, dict]:
+    """
+    Pack `members` (in grid order) into sheets of `per_sheet` (default
+    PER_SHEET) cells and return {image_id: {sheet, x, y, w, h, sheet_w,
+    sheet_h}} for every cell drawn; `sheet` is relative to the image dir.
+    """
+    image_dir = Path(image_dir)
+    fmt = thumbnails.pick_format(fmt)
+    per_sheet = per_sheet or PER_SHEET
+    chunks = [list(members[i:i + per_sheet]) for i in range(0, len(members), per_sheet)]
+    paths = [sheet_path(chunk, fmt) for chunk in chunks]
+
+    drawn = list(imaging.map_in_pool(build_sheet, [(chunk, image_dir, rel, fmt) for chunk, rel in zip(chunks, paths)],
+                                     workers, ordered=True))
+
+    coords = {}
+    for chunk, rel, ids in zip(chunks, paths, drawn):
+        sheet_w, sheet_h = sheet_size(len(chunk))
+        ids = set(ids)
+        for index, member in enumerate(chunk):
+            if member[0] in ids:
+                x, y = cell_box(index)
+                coords[member[0]] = {"sheet": rel, "x": x, "y": y, "w": CELL_WIDTH, "h": CELL_HEIGHT,
+                                     "sheet_w": sheet_w, "sheet_h": sheet_h}
+    _prune(image_dir, set(paths))
+    return coords
+
+
+def _prune(image_dir: Path, keep) -> None:
+    "Delete sheets no longer referenced."
+    atlas_dir = image_dir / ATLAS_DIR
+    if not atlas_dir.exists():
+        return
+    for path in atlas_dir.iterdir():
+        if path.is_file() and f"{ATLAS_DIR}/{path.name}" not in keep:
+            path.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the frontend with thumbnails packed into sprite atlases")
+    parser.add_argument("--format", choices=thumbnails.FORMATS, default=thumbnails.DEFAULT_FORMAT,
+                        help="Sheet format; JPEG is used if Pillow cannot encode it (default: %(default)s)")
+    imaging.add_pool_arguments(parser, memory=False)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    validate_config()
+    with profiling.from_args(args, "sprite_atlas"):
+        db.sync_frontend(atlas=True, atlas_format=args.format, atlas_workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
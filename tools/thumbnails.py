@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Generate web derivatives of the plates for the gallery.
+
+The grid shows ~250 px cards, so sending it multi-MB originals wastes most
+of every download. For each image this writes two derivatives:
+
+    thumb     THUMB_WIDTH px wide, for the grid cards
+    preview   PREVIEW_WIDTH px wide, for the modal
+
+in WebP (or AVIF with --format avif), falling back to JPEG when Pillow
+was built without that encoder. Sources are never upscaled.
+
+Outputs are content-addressed: named after the sha256 of the source file
+under <image dir>/_derived/, so an image whose bytes have not changed is
+skipped without decoding (even after the organizer moves it), and
+identical files share derivatives. Paths are recorded in the thumb_path /
+preview_path columns, which sync_frontend exports as `thumb` / `full`.
+
+With --pack the thumbs go into a ThumbPack (tools/thumbpack.py) in
+data/thumbs instead, and are exported as a single _derived/thumbs.pack that
+the gallery reads with HTTP Range requests; --compact drops packed thumbs
+of images no longer in the database.
+
+Usage:
+    python tools/thumbnails.py [--format webp|avif|jpeg] [--workers N] [--force] [--limit N]
+                               [--pack [--compact]]
+"""
+
+import io
+import os
+import sys
+import math
+import hashlib
+import argparse
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from config import get_image_dir, validate_config, DATA_DIR
+import db
+import imaging
+import profiling
+import thumbpack
+from thumbpack import ThumbPack
+
+DERIVED_DIR = "_derived"  # under the image directory
+THUMB_WIDTH = 480         # 2x the grid card width
+PREVIEW_WIDTH = 1600
+WIDTHS = {"thumb": THUMB_WIDTH, "preview": PREVIEW_WIDTH}
+
+FORMATS = ("webp", "avif", "jpeg")
+DEFAULT_FORMAT = "webp"
+EXTENSIONS = {"webp": ".webp", "avif": ".avif", "jpeg": ".jpg"}
+QUALITY = {"webp": 80, "avif": 60, "jpeg": 85}
+
+HASH_CHUNK = 1024 * 1024
+
+PACK_DIR = DATA_DIR / "thumbs"              # live ThumbPack (local disk, written incrementally)
+WEB_PACK = f"{DERIVED_DIR}/thumbs.pack"     # exported copy the gallery reads, under the image dir
+PACK_BATCH = 256                            # thumbs buffered per bulk write
+
+
+@dataclass
+class DerivativeResult:
+    image_id: str
+    ok: bool
+    content_hash: Optional[str] = None
+    outputs: Dict[str, str] = field(default_factory=dict)  # kind -> path relative to the image dir
+    skipped: bool = False
+    bytes_in: int = 0
+    bytes_out: int = 0
+    thumb_data: Optional[bytes] = None  # the thumb, when it goes into a ThumbPack
+    error: Optional[str] = None
+
+
+def pick_format(preferred: str = DEFAULT_FORMAT) -> str:
+    "`preferred` if this Pillow build can encode it, else JPEG."
+    Image.init()
+    return preferred if preferred.upper() in Image.SAVE else "jpeg"
+
+
+def content_hash(path) -> str:
+    "sha256 of the file's bytes."
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def derivative_path(digest: str, kind: str, fmt: str) -> str:
+    "Where the `kind` derivative of a source with this hash lives, relative to the image dir."
+    return f"{DERIVED_DIR}/{kind}/{digest[:2]}/{digest[:24]}_{WIDTHS[kind]}{EXTENSIONS[fmt]}"
+
+
+def encode(img: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "jpeg":
+        img.save(buffer, "JPEG", quality=QUALITY[fmt], optimize=True, progressive=True)
+    else:
+        img.save(buffer, fmt.upper(), quality=QUALITY[fmt])
+    return buffer.getvalue()
+
+
+def _fit_width(img: Image.Image, width: int) -> Image.Image:
+    if img.width <= width:
+        return img
+    size = (width, max(1, round(img.height * width / img.width)))
+    return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=imaging.REDUCING_GAP)
+
+
+def make_derivatives(image_id: str, path, image_dir, fmt: str = DEFAULT_FORMAT, force: bool = False,
+                     pack: bool = False, packed_hash: Optional[str] = None,
+                     budget: Optional[int] = None) -> DerivativeResult:
+    """
+    Write the thumb and preview for one source file (runs in a worker process).
+
+    Skips decoding entirely when every output for the file's content hash
+    already exists, unless `force`. With `pack`, the thumb is returned in
+    `thumb_data` for the caller to add to the ThumbPack instead of being
+    written out; `packed_hash` is the hash the pack already has a thumb for.
+    """
+    result = DerivativeResult(image_id=image_id, ok=False)
+    image_dir = Path(image_dir)
+    try:
+        result.bytes_in = os.path.getsize(path)
+        result.content_hash = content_hash(path)
+        kinds = ("preview",) if pack else tuple(WIDTHS)
+        result.outputs = {kind: derivative_path(result.content_hash, kind, fmt) for kind in kinds}
+        have_thumb = not pack or packed_hash == result.content_hash
+        if not force and have_thumb and all((image_dir / rel).exists() for rel in result.outputs.values()):
+            result.ok = result.skipped = True
+            return result
+
+        # Decode once, just big enough for the preview; the thumb comes from that
+        (w, h), mode, _ = imaging.probe(path)
+        scale = min(1.0, PREVIEW_WIDTH / w)
+        max_side = math.ceil(max(w, h) * scale)
+        img = imaging.load(path, max_side=max_side, mode=imaging.jpeg_mode(mode), budget=budget)
+        preview = _fit_width(img, PREVIEW_WIDTH)
+        images = {"preview": preview, "thumb": _fit_width(preview, THUMB_WIDTH)}
+
+        for kind in WIDTHS:
+            data = encode(images[kind], fmt)
+            result.bytes_out += len(data)
+            if kind not in result.outputs:
+                result.thumb_data = data
+                continue
+            out = image_dir / result.outputs[kind]
+            out.parent.mkdir(parents=True, exist_ok=True)
+            imaging.write_atomic(out, data)
+        result.ok = True
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    return result
+
+
+def generate(items, image_dir, fmt: str = DEFAULT_FORMAT, workers: Optional[int] = None,
+             force: bool = False, memory_mb: Optional[float] = None, pack: bool = False):
+    """
+    Make derivatives for (image_id, path, packed_hash) items in parallel;
+    yields DerivativeResults as they finish. `memory_mb` is shared across
+    workers (imaging.map_in_pool).
+    """
+    return imaging.map_in_pool(make_derivatives, [(image_id, path, image_dir, fmt, force, pack, packed_hash)
+                                                  for image_id, path, packed_hash in items], workers, memory_mb)
+
+
+def run(fmt: str = DEFAULT_FORMAT, workers: Optional[int] = None, force: bool = False,
+        limit: Optional[int] = None, memory_mb: Optional[float] = None, pack: bool = False) -> dict:
+    """
+    Generate derivatives for every image on disk and record them; returns counts.
+
+    With `pack`, thumbs go into the ThumbPack in PACK_DIR and are exported
+    to WEB_PACK under the image dir, one file for the whole grid.
+    """
+    image_dir = get_image_dir()
+    fmt = pick_format(fmt)
+    records = db.select_images(db.PLATE_FILES,
+                               columns=("id", "local_path", "content_hash", "thumb_path", "preview_path"),
+                               limit=limit)
+    store = ThumbPack(PACK_DIR) if pack else None
+    items = []
+    missing = 0
+    for record in records:
+        path = image_dir / record["local_path"]
+        if path.exists():
+            digest = record.get("content_hash")
+            packed = digest if store is not None and digest and digest in store else None
+            items.append((record["id"], path, packed))
+        else:
+            missing += 1
+    known = {r["id"]: (r.get("content_hash"), r.get("thumb_path"), r.get("preview_path")) for r in records}
+
+    counts = {"format": fmt, "made": 0, "skipped": 0, "failed": 0, "missing": missing,
+              "bytes_in": 0, "bytes_out": 0}
+    results = {}
+    batch = []
+    try:
+        for result in generate(items, image_dir, fmt, workers=workers, force=force, memory_mb=memory_mb,
+                               pack=pack):
+            if not result.ok:
+                counts["failed"] += 1
+                print(f"[!] {result.image_id}: {result.error}")
+                continue
+            counts["skipped" if result.skipped else "made"] += 1
+            if not result.skipped:
+                counts["bytes_in"] += result.bytes_in
+                counts["bytes_out"] += result.bytes_out
+            if result.thumb_data is not None:
+                batch.append((result.content_hash, result.thumb_data))
+                result.thumb_data = None
+                if len(batch) >= PACK_BATCH:
+                    store.put_many(batch)
+                    batch = []
+            results[result.image_id] = result
+        if store is not None:
+            store.put_many(batch)
+            thumbs = _export_pack(store, records, results, image_dir, changed=counts["made"] > 0)
+    finally:
+        if store is not None:
+            store.close()
+
+    rows = []
+    for image_id, result in results.items():
+        thumb = thumbs.get(image_id, known[image_id][1]) if pack else result.outputs["thumb"]
+        row = (image_id, result.content_hash, thumb, result.outputs["preview"])
+        if known[image_id] != row[1:]:
+            rows.append(row)
+    if rows:
+        db.save_derivatives(rows)
+    return counts
+
+
+def _export_pack(store: ThumbPack, records, results, image_dir, changed: bool) -> dict:
+    """
+    Write the web pack (thumbs in grid order) unless nothing changed since
+    the last export; returns {image_id: thumb range reference} when written.
+    """
+    digests = {}
+    for record in records:
+        result = results.get(record["id"])
+        if result is not None:
+            digests[record["id"]] = result.content_hash
+    current = {r["id"]: r.get("thumb_path") for r in records}
+    web_pack = image_dir / WEB_PACK
+    if (not changed and web_pack.exists()
+            and all((current[i] or "").startswith(WEB_PACK + thumbpack.RANGE_MARKER) for i in digests)):
+        return {}
+    web_pack.parent.mkdir(parents=True, exist_ok=True)
+    ranges = store.export(web_pack, digests.values())
+    return {image_id: thumbpack.range_ref(WEB_PACK, *ranges[digest])
+            for image_id, digest in digests.items() if digest in ranges}
+
+
+def compact_pack() -> tuple:
+    "Drop pack entries no image in the database references; returns (dropped, bytes reclaimed)."
+    live = [r["content_hash"] for r in db.select_images("content_hash IS NOT NULL", columns=("content_hash",))]
+    with ThumbPack(PACK_DIR) as store:
+        return store.compact(live)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate gallery thumbnails and previews")
+    parser.add_argument("--format", choices=FORMATS, default=DEFAULT_FORMAT,
+                        help="Output format; JPEG is used if Pillow cannot encode it (default: %(default)s)")
+    parser.add_argument("--force", action="store_true", help="Regenerate even if outputs are up to date")
+    parser.add_argument("--limit", type=int, default=None, help="Only consider the first N images")
+    parser.add_argument("--pack", action="store_true",
+                        help="Store thumbs in one packed file instead of a file per image")
+    parser.add_argument("--compact", action="store_true",
+                        help="Afterwards, drop packed thumbs of images no longer in the database")
+    imaging.add_pool_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    validate_config()
+    with profiling.from_args(args, "thumbnails"):
+        counts = run(args.format, workers=args.workers, force=args.force, limit=args.limit,
+                     memory_mb=args.memory_mb, pack=args.pack)
+        if args.compact:
+            dropped, reclaimed = compact_pack()
+            print(f"[*] Compacted thumbnail pack: dropped {dropped} entries, {reclaimed / 1024 / 1024:.1f} MB")
+
+    print(f"[*] {counts['format']}: {counts['made']} made, {counts['skipped']} up to date, "
+          f"{counts['failed']} failed, {counts['missing']} missing on disk")
+    if counts["made"]:
+        print(f"[*] {counts['bytes_in'] / 1024 / 1024:.1f} MB of sources -> "
+              f"{counts['bytes_out'] / 1024 / 1024:.1f} MB of derivatives")
+    db.sync_frontend()
+
+
+if __name__ == "__main__":
+    main()
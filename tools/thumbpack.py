@@ -0,0 +1,282 @@
+"""
+Packed thumbnail store: one data file plus an offset index, read via mmap.
+
+Drive and other FUSE mounts handle thousands of small files badly, so
+instead of one file per thumbnail the thumbnails can live in a pack:
+
+    thumbs.pack   header, then the encoded thumbnails back to back (append-only)
+    thumbs.idx    header, then one fixed-size record per thumbnail:
+                  sha256 content hash (32 bytes), offset (u64), length (u32)
+
+Entries are keyed by the source image's content hash (the content_hash
+column), so identical sources share an entry and an image that is moved or
+renamed keeps its thumbnail. Data is appended and fsync'd before its index
+records, so a crash mid-write loses at most the unindexed tail; on open,
+index records pointing past the end of the data are ignored and a later
+record for the same key wins. There must be only one writer at a time.
+
+Both headers carry the pack's random id. `compact()` rewrites both files
+under a new id and renames them into place; if it is interrupted between
+the two renames, the next open sees mismatched ids and finishes the job.
+
+The static frontend reads a thumbnail straight out of the pack with an HTTP
+Range request: `range_ref(path, offset, length)` gives the
+"<path>#bytes=<first>-<last>" reference stored as thumb_path.
+
+Usage:
+    with ThumbPack(directory) as pack:
+        pack.put_many([(digest, data), ...])
+        data = pack.get(digest)
+        pack.compact(live_digests)
+"""
+
+import os
+import mmap
+import struct
+import secrets
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+PACK_MAGIC = b"NGTHPAK1"
+INDEX_MAGIC = b"NGTHIDX1"
+HEADER = struct.Struct("<8s8s")     # magic, pack id
+RECORD = struct.Struct("<32sQI")    # content hash, offset, length
+RANGE_MARKER = "#bytes="
+
+DEFAULT_NAME = "thumbs"
+
+
+class PackError(Exception):
+    "The pack or its index is unreadable or they do not belong together."
+    pass
+
+
+def range_ref(path: str, offset: int, length: int) -> str:
+    "Reference to `length` bytes at `offset` in the file at `path` (an HTTP Range, inclusive)."
+    return f"{path}{RANGE_MARKER}{offset}-{offset + length - 1}"
+
+
+def parse_range_ref(ref: str) -> Optional[Tuple[str, int, int]]:
+    "(path, offset, length) for a range_ref string, None for a plain path."
+    path, marker, span = ref.partition(RANGE_MARKER)
+    if not marker:
+        return None
+    first, _, last = span.partition("-")
+    return path, int(first), int(last) - int(first) + 1
+
+
+def _key(digest: str) -> bytes:
+    key = bytes.fromhex(digest)
+    if len(key) != 32:
+        raise ValueError(f"expected a sha256 hex digest, got {digest!r}")
+    return key
+
+
+class ThumbPack:
+    "A pack/index pair in `directory` named `<name>.pack` / `<name>.idx`."
+
+    def __init__(self, directory, name: str = DEFAULT_NAME):
+        self.directory = Path(directory)
+        self.pack_path = self.directory / f"{name}.pack"
+        self.index_path = self.directory / f"{name}.idx"
+        self._entries: Dict[bytes, Tuple[int, int]] = {}
+        self._pack_id = None
+        self._file = None
+        self._map = None
+        self._open()
+
+    # -- opening -------------------------------------------------------------
+
+    def _open(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._finish_compaction()
+        if not self.pack_path.exists():
+            self._pack_id = secrets.token_bytes(8)
+            self.pack_path.write_bytes(HEADER.pack(PACK_MAGIC, self._pack_id))
+            self.index_path.write_bytes(HEADER.pack(INDEX_MAGIC, self._pack_id))
+        self._file = open(self.pack_path, "rb")
+        self._pack_id = self._read_header(self._file.read(HEADER.size), PACK_MAGIC, self.pack_path)
+        self._entries = self._load_index(self.index_path, self._pack_id, os.path.getsize(self.pack_path))
+        self._map = None
+
+    @staticmethod
+    def _read_header(data: bytes, magic: bytes, path) -> bytes:
+        if len(data) < HEADER.size:
+            raise PackError(f"{path}: truncated header")
+        found, pack_id = HEADER.unpack(data[:HEADER.size])
+        if found != magic:
+            raise PackError(f"{path}: not a thumbnail pack file")
+        return pack_id
+
+    @classmethod
+    def _load_index(cls, path: Path, pack_id: bytes, pack_size: int) -> Dict[bytes, Tuple[int, int]]:
+        if not path.exists():
+            raise PackError(f"{path}: index missing")
+        data = path.read_bytes()
+        if cls._read_header(data, INDEX_MAGIC, path) != pack_id:
+            raise PackError(f"{path}: index belongs to a different pack")
+        entries = {}
+        end = HEADER.size + (len(data) - HEADER.size) // RECORD.size * RECORD.size  # drop a torn record
+        for key, offset, length in RECORD.iter_unpack(data[HEADER.size:end]):
+            if offset + length <= pack_size:
+                entries[key] = (offset, length)
+        return entries
+
+    def _finish_compaction(self) -> None:
+        "Complete a compaction interrupted after the pack was renamed but before the index was."
+        pending = self.index_path.with_name(self.index_path.name + ".tmp")
+        if not (pending.exists() and self.pack_path.exists()):
+            return
+        with open(self.pack_path, "rb") as f:
+            pack_id = self._read_header(f.read(HEADER.size), PACK_MAGIC, self.pack_path)
+        if self._read_header(pending.read_bytes(), INDEX_MAGIC, pending) == pack_id:
+            os.replace(pending, self.index_path)
+        else:
+            pending.unlink()
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    # -- reading -------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, digest: str) -> bool:
+        return _key(digest) in self._entries
+
+    def keys(self):
+        return [key.hex() for key in self._entries]
+
+    def locate(self, digest: str) -> Optional[Tuple[int, int]]:
+        "(offset, length) of the entry in the pack file, or None."
+        return self._entries.get(_key(digest))
+
+    def get(self, digest: str) -> Optional[bytes]:
+        "The stored bytes for `digest`, or None."
+        entry = self._entries.get(_key(digest))
+        if entry is None:
+            return None
+        offset, length = entry
+        if self._map is None or len(self._map) < offset + length:
+            # Map (again) once appends have grown the file past the mapping
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
+
+    # -- writing -------------------------------------------------------------
+
+    def put(self, digest: str, data: bytes) -> bool:
+        return self.put_many([(digest, data)]) == 1
+
+    def put_many(self, items: Iterable[Tuple[str, bytes]]) -> int:
+        """
+        Append entries in one write and one fsync per file. Keys already in
+        the pack are skipped (the content is the same); returns how many
+        were added.
+        """
+        records = []
+        chunks = []
+        offset = os.path.getsize(self.pack_path)
+        seen = set()
+        for digest, data in items:
+            key = _key(digest)
+            if key in self._entries or key in seen:
+                continue
+            seen.add(key)
+            chunks.append(data)
+            records.append(RECORD.pack(key, offset, len(data)))
+            offset += len(data)
+        if not records:
+            return 0
+        self._append(self.pack_path, b"".join(chunks))
+        self._append(self.index_path, b"".join(records))
+        for record in records:
+            key, offset, length = RECORD.unpack(record)
+            self._entries[key] = (offset, length)
+        return len(records)
+
+    @staticmethod
+    def _append(path: Path, data: bytes) -> None:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def export(self, path, digests: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+        """
+        Write a standalone pack holding only `digests` (missing ones are
+        skipped), in the given order so thumbnails shown together sit
+        together. Returns {digest: (offset, length)} in the new file.
+        Neither the index nor the header is needed to serve it.
+        """
+        path = Path(path)
+        tmp = path.with_name(f".{path.name}.tmp")
+        ranges = {}
+        offset = 0
+        try:
+            with open(tmp, "wb") as f:
+                for digest in digests:
+                    data = self.get(digest)
+                    if data is None or digest in ranges:
+                        continue
+                    f.write(data)
+                    ranges[digest] = (offset, len(data))
+                    offset += len(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        return ranges
+
+    def compact(self, live: Iterable[str]) -> Tuple[int, int]:
+        """
+        Rewrite the pack keeping only the `live` digests, dropping entries of
+        deleted images and bytes orphaned by interrupted writes. Returns
+        (entries dropped, bytes reclaimed).
+        """
+        live_keys = {_key(d) for d in live}
+        keep = [(key, entry) for key, entry in self._entries.items() if key in live_keys]
+        before = os.path.getsize(self.pack_path)
+        pack_id = secrets.token_bytes(8)
+        pack_tmp = self.pack_path.with_name(self.pack_path.name + ".tmp")
+        index_tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+
+        offset = HEADER.size
+        records = []
+        with open(pack_tmp, "wb") as f:
+            f.write(HEADER.pack(PACK_MAGIC, pack_id))
+            for key, (old_offset, length) in sorted(keep, key=lambda kv: kv[1][0]):
+                f.write(self.get(key.hex()))
+                records.append(RECORD.pack(key, offset, length))
+                offset += length
+            f.flush()
+            os.fsync(f.fileno())
+        with open(index_tmp, "wb") as f:
+            f.write(HEADER.pack(INDEX_MAGIC, pack_id) + b"".join(records))
+            f.flush()
+            os.fsync(f.fileno())
+
+        dropped = len(self._entries) - len(keep)
+        self.close()
+        os.replace(pack_tmp, self.pack_path)
+        os.replace(index_tmp, self.index_path)  # an interruption before this is finished on open
+        self._open()
+        return dropped, before - os.path.getsize(self.pack_path)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Build Deep Zoom (DZI) tile pyramids for very large plates.
+
+A 9000 px foldout is too much to load whole in the modal. For images whose
+longer side is at least MIN_SIDE px, this writes a Deep Zoom pyramid: level
+N is the full image, each level below is half the size down to 1x1, and
+every level is cut into TILE_SIZE px tiles overlapping by OVERLAP px:
+
+    _derived/tiles/ab/<hash>.dzi                    XML descriptor (size, tile size, format)
+    _derived/tiles/ab/<hash>_files/<level>/<col>_<row>.webp
+
+The viewer in index.html fetches only the tiles visible at the current
+zoom. Like the thumbnails, pyramids are named by the source's content hash
+and the .dzi is written last, so a finished pyramid is skipped on the next
+run and an interrupted one is rebuilt. Images are tiled in parallel worker
+processes.
+
+Usage:
+    python tools/tiles.py [--min-side 3200] [--format webp|avif|jpeg] [--workers N] [--force]
+"""
+
+import os
+import sys
+import math
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from config import get_image_dir, validate_config
+import db
+import imaging
+import profiling
+import thumbnails
+
+MIN_SIDE = 3200    # smaller plates are served whole as the preview
+TILE_SIZE = 254    # 254 + 2 px overlap = 256 px tiles (the Deep Zoom convention)
+OVERLAP = 1
+DZI_NAMESPACE = "http://schemas.microsoft.com/deepzoom/2008"
+
+
+@dataclass
+class TileResult:
+    image_id: str
+    ok: bool
+    dzi_path: Optional[str] = None  # relative to the image dir; None if below MIN_SIDE
+    skipped: bool = False
+    levels: int = 0
+    tiles: int = 0
+    bytes_out: int = 0
+    error: Optional[str] = None
+
+
+def dzi_path(digest: str) -> str:
+    "Where the pyramid of a source with this hash lives, relative to the image dir."
+    return f"{thumbnails.DERIVED_DIR}/tiles/{digest[:2]}/{digest[:24]}.dzi"
+
+
+def max_level(size) -> int:
+    "Deep Zoom level holding the full-size image (level 0 is 1x1)."
+    return math.ceil(math.log2(max(size))) if max(size) > 1 else 0
+
+
+def tile_boxes(size, tile_size: int = TILE_SIZE, overlap: int = OVERLAP):
+    "Yield (col, row, box) for the tiles of one level, overlap included."
+    w, h = size
+    for col in range(math.ceil(w / tile_size)):
+        left = max(0, col * tile_size - overlap)
+        right = min(w, (col + 1) * tile_size + overlap)
+        for row in range(math.ceil(h / tile_size)):
+            top = max(0, row * tile_size - overlap)
+            bottom = min(h, (row + 1) * tile_size + overlap)
+            yield col, row, (left, top, right, bottom)
+
+
+def dzi_xml(size, fmt: str, tile_size: int = TILE_SIZE, overlap: int = OVERLAP) -> str:
+    extension = thumbnails.EXTENSIONS[fmt].lstrip(".")
+    return (f'<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<Image xmlns="{DZI_NAMESPACE}" Format="{extension}" Overlap="{overlap}" TileSize="{tile_size}">\n'
+            f'  <Size Width="{size[0]}" Height="{size[1]}"/>\n'
+            f'</Image>\n')
+
+
+def write_pyramid(img: Image.Image, dzi: Path, fmt: str) -> Tuple[int, int, int]:
+    """
+    Cut `img` into a Deep Zoom pyramid next to `dzi`, writing the descriptor
+    last. Returns (levels, tiles, bytes written).
+    """
+    tiles = bytes_out = 0
+    files = dzi.with_name(dzi.stem + "_files")
+    top = max_level(img.size)
+    level_img = img
+    for level in range(top, -1, -1):
+        level_dir = files / str(level)
+        level_dir.mkdir(parents=True, exist_ok=True)
+        for col, row, box in tile_boxes(level_img.size):
+            data = thumbnails.encode(level_img.crop(box), fmt)
+            # Plain writes: the .dzi written below marks the pyramid complete
+            (level_dir / f"{col}_{row}{thumbnails.EXTENSIONS[fmt]}").write_bytes(data)
+            tiles += 1
+            bytes_out += len(data)
+        if level:
+            # Box-halve for the next level; reduce() rounds up, matching Deep Zoom's ceil(size / 2)
+            level_img = level_img.reduce(2)
+    imaging.write_atomic(dzi, dzi_xml(img.size, fmt).encode("utf-8"))
+    return top + 1, tiles, bytes_out
+
+
+def make_pyramid(image_id: str, path, image_dir, fmt: str = thumbnails.DEFAULT_FORMAT,
+                 min_side: int = MIN_SIDE, force: bool = False, budget: Optional[int] = None) -> TileResult:
+    """
+    Tile one source file (runs in a worker process). Images below
+    `min_side` are left alone; finished pyramids are skipped unless `force`.
+    """
+    result = TileResult(image_id=image_id, ok=False)
+    image_dir = Path(image_dir)
+    try:
+        size, mode, _ = imaging.probe(path)
+        if max(size) < min_side:
+            result.ok = True
+            return result
+        rel = dzi_path(thumbnails.content_hash(path))
+        dzi = image_dir / rel
+        if dzi.exists() and not force:
+            result.ok = result.skipped = True
+            result.dzi_path = rel
+            return result
+        dzi.parent.mkdir(parents=True, exist_ok=True)
+        img = imaging.load(path, mode=imaging.jpeg_mode(mode), budget=budget)
+        result.levels, result.tiles, result.bytes_out = write_pyramid(img, dzi, fmt)
+        result.ok, result.dzi_path = True, rel
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    return result
+
+
+def generate(items, image_dir, fmt: str = thumbnails.DEFAULT_FORMAT, min_side: int = MIN_SIDE,
+             workers: Optional[int] = None, force: bool = False, memory_mb: Optional[float] = None):
+    "Tile (image_id, path) pairs in parallel; yields TileResults as they finish."
+    return imaging.map_in_pool(make_pyramid, [(image_id, path, image_dir, fmt, min_side, force)
+                                              for image_id, path in items], workers, memory_mb)
+
+
+def run(fmt: str = thumbnails.DEFAULT_FORMAT, min_side: int = MIN_SIDE, workers: Optional[int] = None,
+        force: bool = False, limit: Optional[int] = None, memory_mb: Optional[float] = None) -> dict:
+    "Tile every large image on disk and record the pyramids; returns counts."
+    image_dir = get_image_dir()
+    fmt = thumbnails.pick_format(fmt)
+    records = db.select_images(db.PLATE_FILES, columns=("id", "local_path", "tiles_path"), limit=limit)
+    known = {r["id"]: r.get("tiles_path") for r in records}
+    items = [(r["id"], image_dir / r["local_path"]) for r in records if (image_dir / r["local_path"]).exists()]
+
+    counts = {"format": fmt, "tiled": 0, "skipped": 0, "small": 0, "failed": 0, "tiles": 0, "bytes_out": 0}
+    rows = []
+    for result in generate(items, image_dir, fmt, min_side, workers=workers, force=force, memory_mb=memory_mb):
+        if not result.ok:
+            counts["failed"] += 1
+            print(f"[!] {result.image_id}: {result.error}")
+            continue
+        if result.dzi_path is None:
+            counts["small"] += 1
+        elif result.skipped:
+            counts["skipped"] += 1
+        else:
+            counts["tiled"] += 1
+            counts["tiles"] += result.tiles
+            counts["bytes_out"] += result.bytes_out
+        if known.get(result.image_id) != result.dzi_path:
+            rows.append((result.image_id, result.dzi_path))
+    if rows:
+        db.save_tiles(rows)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build Deep Zoom tile pyramids for large plates")
+    parser.add_argument("--min-side", type=int, default=MIN_SIDE,
+                        help="Only tile images whose longer side is at least this many px (default: %(default)s)")
+    parser.add_argument("--format", choices=thumbnails.FORMATS, default=thumbnails.DEFAULT_FORMAT,
+                        help="Tile format; JPEG is used if Pillow cannot encode it (default: %(default)s)")
+    parser.add_argument("--force", action="store_true", help="Rebuild pyramids that already exist")
+    parser.add_argument("--limit", type=int, default=None, help="Only consider the first N images")
+    imaging.add_pool_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    validate_config()
+    with profiling.from_args(args, "tiles"):
+        counts = run(args.format, min_side=args.min_side, workers=args.workers, force=args.force,
+                     limit=args.limit, memory_mb=args.memory_mb)
+
+    print(f"[*] {counts['format']}: {counts['tiled']} tiled ({counts['tiles']} tiles, "
+          f"{counts['bytes_out'] / 1024 / 1024:.1f} MB), {counts['skipped']} up to date, "
+          f"{counts['small']} below {args.min_side} px, {counts['failed']} failed")
+    db.sync_frontend()
+
+
+if __name__ == "__main__":
+    main()
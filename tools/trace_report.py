@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Latency breakdown from span trace files (see tools/tracing.py).
+
+Prints, per stage (span name), how many spans ran and how their time is
+distributed, then the slowest images end to end with the stages that
+dominated each one. "Self" time excludes time spent in child spans, so
+the self column adds up to wall time without double counting.
+
+Usage:
+    python tools/trace_report.py                       # data/traces/trace.jsonl
+    python tools/trace_report.py run1.jsonl run2.jsonl --top 20
+"""
+
+import os
+import sys
+import json
+import argparse
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from tracing import TRACE_DIR
+
+
+def load_spans(paths: Iterable) -> List[dict]:
+    "Read spans from JSONL files, skipping blank or torn lines."
+    spans = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("startTimeUnixNano") is None or record.get("endTimeUnixNano") is None:
+                    continue
+                record["duration_s"] = (record["endTimeUnixNano"] - record["startTimeUnixNano"]) / 1e9
+                spans.append(record)
+    return spans
+
+
+def _self_times(spans: List[dict]) -> None:
+    "Annotate each span with `self_s`: its duration minus its direct children's."
+    children = defaultdict(float)
+    for s in spans:
+        if s.get("parentSpanId"):
+            children[s["parentSpanId"]] += s["duration_s"]
+    for s in spans:
+        s["self_s"] = max(0.0, s["duration_s"] - children.get(s["spanId"], 0.0))
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def stage_breakdown(spans: List[dict]) -> List[dict]:
+    "Per span name: count, total/self seconds, mean, p50, p95, max and errors; by self time."
+    _self_times(spans)
+    by_name = defaultdict(list)
+    for s in spans:
+        by_name[s["name"]].append(s)
+    total_self = sum(s["self_s"] for s in spans) or 1.0
+    rows = []
+    for name, group in by_name.items():
+        durations = [s["duration_s"] for s in group]
+        self_s = sum(s["self_s"] for s in group)
+        rows.append({
+            "stage": name,
+            "count": len(group),
+            "total_s": sum(durations),
+            "self_s": self_s,
+            "share": self_s / total_self,
+            "mean_s": sum(durations) / len(group),
+            "p50_s": _percentile(durations, 0.5),
+            "p95_s": _percentile(durations, 0.95),
+            "max_s": max(durations),
+            "errors": sum(1 for s in group if s.get("status", {}).get("code") == "STATUS_CODE_ERROR"),
+        })
+    return sorted(rows, key=lambda r: r["self_s"], reverse=True)
+
+
+def slowest_images(spans: List[dict], top: int = 10) -> List[dict]:
+    """
+    Images ranked by end-to-end time: the sum of root span durations in
+    each image's trace (downloads, classification and organization may
+    come from different processes but share the trace id).
+    """
+    _self_times(spans)
+    span_ids = {s["spanId"] for s in spans}
+    traces: Dict[str, dict] = {}
+    for s in spans:
+        image_id = s.get("attributes", {}).get("image.id")
+        entry = traces.setdefault(s["traceId"], {"image_id": None, "total_s": 0.0, "stages": defaultdict(float)})
+        if image_id is not None and entry["image_id"] is None:
+            entry["image_id"] = image_id
+        if not s.get("parentSpanId") or s["parentSpanId"] not in span_ids:
+            entry["total_s"] += s["duration_s"]
+        entry["stages"][s["name"]] += s["self_s"]
+    images = [dict(e, stages=dict(e["stages"])) for e in traces.values() if e["image_id"] is not None]
+    return sorted(images, key=lambda e: e["total_s"], reverse=True)[:top]
+
+
+def format_report(spans: List[dict], top: int = 10) -> str:
+    if not spans:
+        return "No spans recorded."
+    lines = [f"{'stage':<24}{'count':>7}{'total s':>10}{'self s':>10}{'self %':>8}"
+             f"{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'errors':>8}"]
+    for r in stage_breakdown(spans):
+        lines.append(f"{r['stage']:<24}{r['count']:>7}{r['total_s']:>10.2f}{r['self_s']:>10.2f}"
+                     f"{100 * r['share']:>7.1f}%{1000 * r['mean_s']:>10.1f}{1000 * r['p50_s']:>10.1f}"
+                     f"{1000 * r['p95_s']:>10.1f}{1000 * r['max_s']:>10.1f}{r['errors']:>8}")
+
+    images = slowest_images(spans, top)
+    if images:
+        lines.append("")
+        lines.append(f"Slowest {len(images)} images:")
+        for e in images:
+            dominant = sorted(e["stages"].items(), key=lambda kv: kv[1], reverse=True)[:3]
+            parts = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in dominant)
+            lines.append(f"  {e['total_s']:>8.2f}s  {e['image_id']}  ({parts})")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage latency breakdown from span traces")
+    parser.add_argument("files", nargs="*", help="Trace JSONL files (default: data/traces/trace.jsonl)")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest images to list")
+    args = parser.parse_args()
+
+    files = args.files or [TRACE_DIR / "trace.jsonl"]
+    missing = [str(f) for f in files if not os.path.exists(f)]
+    if missing:
+        print(f"[!] Trace file not found: {', '.join(missing)}")
+        sys.exit(1)
+    print(format_report(load_spans(files), top=args.top))
+
+
+if __name__ == "__main__":
+    main()
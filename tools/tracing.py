@@ -0,0 +1,235 @@
+"""
+Span tracing across harvest, classify and organize.
+
+A span times one unit of work (a download, a vision call, a DB write) and
+is appended as one JSON line when it ends. Field names follow the
+OpenTelemetry OTLP/JSON span (traceId, spanId, parentSpanId,
+startTimeUnixNano, ...) with attributes flattened to an object, so the
+files can be converted for any OTel backend; `tools/trace_report.py`
+reads them directly.
+
+The current span lives in a contextvar, so nested spans pick up their
+parent across `await` and per-task without passing anything around.
+Spans tagged with an image id share a trace id derived from that id,
+which joins the download, classification and organization of a plate
+into one trace even though they run in different processes.
+
+Tracing is off by default and `span()` then returns a shared no-op.
+Turn it on with NAVAL_GALLERY_TRACE=1 (writes data/traces/trace.jsonl),
+NAVAL_GALLERY_TRACE_FILE=<path>, or `tracing.enable(path)`.
+
+Usage:
+    import tracing
+    with tracing.span("download", image_id=item["id"], source="wiki") as span:
+        r = requests.get(url)
+        span.set_attribute("http.status_code", r.status_code)
+
+    @tracing.traced("db.save_analysis", image_arg=0)
+    def save_analysis(img_id, results, error=None): ...
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import inspect
+import functools
+import threading
+import contextvars
+from pathlib import Path
+from typing import Optional
+
+from config import DATA_DIR
+
+TRACE_DIR = DATA_DIR / "traces"
+SERVICE_NAME = "naval-gallery"
+
+_current: contextvars.ContextVar = contextvars.ContextVar("naval_gallery_span", default=None)
+
+
+def trace_id_for(image_id) -> str:
+    "Stable 128-bit trace id for an image, shared by every process that touches it."
+    return hashlib.sha256(f"{SERVICE_NAME}:{image_id}".encode()).hexdigest()[:32]
+
+
+class _Writer:
+    "Appends span lines to a JSONL file; one short write per span keeps lines whole."
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._file = None
+
+    def write(self, record: dict) -> None:
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Span:
+    "One timed operation. Use via `span()`; ends and is written when the block exits."
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "attributes",
+                 "start_ns", "end_ns", "status", "_token")
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str], attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_span_id = parent_span_id
+        self.attributes = attributes
+        self.start_ns = None
+        self.end_ns = None
+        self.status = {"code": "STATUS_CODE_OK"}
+        self._token = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: dict) -> None:
+        self.attributes.update(attributes)
+
+    def set_error(self, message: str) -> None:
+        self.status = {"code": "STATUS_CODE_ERROR", "message": message}
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        writer = _writer
+        if writer is not None:
+            writer.write(self.to_dict())
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "kind": "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "status": self.status,
+            "resource": {"service.name": SERVICE_NAME, "process.pid": os.getpid()},
+        }
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def set_error(self, message):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+_writer: Optional[_Writer] = None
+
+
+def enable(path=None) -> Path:
+    "Start writing spans to `path` (default data/traces/trace.jsonl). Returns the path."
+    global _writer
+    disable()
+    _writer = _Writer(path or TRACE_DIR / "trace.jsonl")
+    return _writer.path
+
+
+def disable() -> None:
+    global _writer
+    if _writer is not None:
+        _writer.close()
+    _writer = None
+
+
+def enabled() -> bool:
+    return _writer is not None
+
+
+def current_span():
+    "The innermost open span in this context (a no-op span when there is none)."
+    return _current.get() or _NULL_SPAN
+
+
+def span(name: str, image_id=None, **attributes):
+    """
+    Context manager for a span named `name`, child of the current span.
+
+    `image_id` is recorded as the `image.id` attribute; a root span with an
+    image id joins that image's trace.
+    """
+    if _writer is None:
+        return _NULL_SPAN
+    parent = _current.get()
+    if image_id is not None:
+        attributes["image.id"] = image_id
+    if parent is not None:
+        trace_id = parent.trace_id
+    elif image_id is not None:
+        trace_id = trace_id_for(image_id)
+    else:
+        trace_id = uuid.uuid4().hex
+    return Span(name, trace_id, parent.span_id if parent is not None else None, attributes)
+
+
+def traced(name: str, image_arg: Optional[int] = None):
+    """
+    Decorator wrapping every call of a function (sync or async) in a span.
+    `image_arg` is the position of the image id argument, if any.
+    """
+    def decorate(fn):
+        def image_of(args):
+            return args[image_arg] if image_arg is not None and len(args) > image_arg else None
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if _writer is None:
+                    return await fn(*args, **kwargs)
+                with span(name, image_id=image_of(args)):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _writer is None:
+                return fn(*args, **kwargs)
+            with span(name, image_id=image_of(args)):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+if os.environ.get("NAVAL_GALLERY_TRACE_FILE"):
+    enable(os.environ["NAVAL_GALLERY_TRACE_FILE"])
+elif os.environ.get("NAVAL_GALLERY_TRACE", "").lower() in ("1", "true", "yes"):
+    enable()
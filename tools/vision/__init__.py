@@ -1,3 +1,6 @@
-from .client import MCPVisionClient, VisionResult, MCPConnectionError
+from .client import MCPVisionClient, VisionResult, MCPConnectionError, MCPServerDied
+from .supervisor import CircuitBreaker, CircuitOpenError
+from .cassette import Cassette, CassetteMiss
 
-__all__ = ["MCPVisionClient", "VisionResult", "MCPConnectionError"]
+__all__ = ["MCPVisionClient", "VisionResult", "MCPConnectionError", "MCPServerDied",
+           "CircuitBreaker", "CircuitOpenError", "Cassette", "CassetteMiss"]
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RECORD = "record"
+REPLAY = "replay"
+
+
+class CassetteMiss(LookupError):
+    "A replayed call has no recorded response; the image should be skipped, not failed."
+    pass
+
+
+def _is_scratch(path) -> bool:
+    "True for files under the temp dir (low-res copies, trimmed plates), rewritten for every image."
+    try:
+        return Path(path).resolve().is_relative_to(Path(tempfile.gettempdir()).resolve())
+    except OSError:
+        return True
+
+
+def hash_file(path, chunk_size: int = 1024 * 1024) -> str:
+    "SHA-256 of a file's content, streamed so large plates aren't loaded whole."
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_prompt(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    Append-only JSONL log of vision tools/call exchanges.
+
+    Each line holds the request arguments and the raw JSON-RPC result/error,
+    keyed by the SHA-256 of the image content and of the prompt, so entries
+    survive files being moved by organize_gallery.py. In record mode new
+    exchanges are appended; in replay mode responses are served from memory
+    and nothing is sent to the server.
+    """
+
+    def __init__(self, path, mode: str = RECORD):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self._index = {}
+        self._file_hashes = {}
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            if self.replaying:
+                raise FileNotFoundError(f"Cassette not found: {self.path}")
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from an interrupted run; everything before it is intact
+                    logger.warning(f"Skipping corrupt cassette line {line_no} in {self.path}")
+                    continue
+                # Later entries win, so re-recording an image supersedes the old answer
+                self._index[(entry["image_sha256"], entry["prompt_sha256"])] = entry["response"]
+        logger.info(f"Loaded {len(self._index)} cassette entries from {self.path}")
+
+    def key(self, image_path, prompt: str) -> Tuple[str, str]:
+        """
+        Content-addressed key for an image/prompt pair. Hashes of stored
+        plates are memoized by path, size and mtime; scratch files are
+        reused for every image, often within one mtime tick, so they are
+        always hashed.
+        """
+        if _is_scratch(image_path):
+            return hash_file(image_path), hash_prompt(prompt)
+        stat = os.stat(image_path)
+        file_key = (str(image_path), stat.st_size, stat.st_mtime_ns)
+        image_hash = self._file_hashes.get(file_key)
+        if image_hash is None:
+            image_hash = hash_file(image_path)
+            self._file_hashes[file_key] = image_hash
+        return image_hash, hash_prompt(prompt)
+
+    def lookup(self, image_path, prompt: str) -> Optional[dict]:
+        "Return the recorded JSON-RPC response ({result} or {error}) or None."
+        try:
+            response = self._index.get(self.key(image_path, prompt))
+        except OSError:
+            response = None
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def record(self, image_path, prompt: str, arguments: dict, response: dict) -> None:
+        "Append one exchange to the cassette."
+        image_hash, prompt_hash = self.key(image_path, prompt)
+        entry = {
+            "image_sha256": image_hash,
+            "prompt_sha256": prompt_hash,
+            "image_path": str(image_path),
+            "recorded_at": datetime.now().isoformat(),
+            "request": {"name": "analyze_image", "arguments": arguments},
+            "response": response,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        self._index[(image_hash, prompt_hash)] = response
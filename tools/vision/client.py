@@ -1,7 +1,7 @@
 import asyncio
-import json
 import logging
 import os
+import shlex
 import shutil
 import subprocess
 import sys
@@ -9,10 +9,17 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
 
+import metrics
+import tracing
+
+from .cassette import Cassette, CassetteMiss
 from .protocol import MCPProtocol, MCPResponse
+from .supervisor import CircuitBreaker, CircuitOpenError, StderrDrain, backoff_delay
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_SERVER_COMMAND = ["npx", "-y", "@z_ai/mcp-server@latest"]
+
 @dataclass
 class VisionResult:
     "Result from a vision analysis call."
@@ -25,25 +32,56 @@ class MCPConnectionError(Exception):
     "Raised when MCP server connection fails."
     pass
 
+class MCPServerDied(MCPConnectionError):
+    "Raised when the MCP server process exits or its pipes break."
+    pass
+
 class MCPVisionClient:
     """
     Direct MCP client for Z.AI vision server.
     Spawns the MCP server as a subprocess and communicates via JSON-RPC over stdio.
+
+    The server is supervised: stderr is drained in the background, a dead
+    process is restarted with exponential backoff (re-running the initialize
+    handshake), and repeated failures trip a circuit breaker so callers can
+    pause instead of failing every remaining image.
+
+    The server command defaults to the Z.AI npm package; override it with
+    `command` or NAVAL_GALLERY_MCP_COMMAND (e.g. to use tools/vision/fake_server.py).
+
+    With a Cassette, every tools/call exchange is recorded, or in replay mode
+    served from the cassette without spawning a server at all.
     """
 
-    def __init__(self, api_key: str = None, mode: str = "ZAI"):
+    def __init__(self, api_key: str = None, mode: str = "ZAI", command: Optional[list] = None,
+                 max_restarts: int = 3, backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 breaker: Optional[CircuitBreaker] = None, cassette: Optional[Cassette] = None):
         self.api_key = api_key or os.environ.get("Z_AI_API_KEY") or os.environ.get("ZAI_API_KEY")
         self.mode = mode
+        env_command = os.environ.get("NAVAL_GALLERY_MCP_COMMAND")
+        self.command = command or (shlex.split(env_command) if env_command else DEFAULT_SERVER_COMMAND)
         self.process: Optional[subprocess.Popen] = None
         self.protocol = MCPProtocol()
         self._initialized = False
         self._lock = asyncio.Lock()
-
-        if not self.api_key:
+        self._stderr: Optional[StderrDrain] = None
+        self.max_restarts = max_restarts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.restarts = 0
+        self._supervising = False
+        self.cassette = cassette
+
+        if not self.api_key and not (cassette is not None and cassette.replaying):
             raise ValueError("Z_AI_API_KEY or ZAI_API_KEY required in environment")
 
     async def start(self, timeout: float = 30.0) -> None:
         "Spawn MCP server and complete initialization handshake."
+        self._supervising = True
+        if self.cassette is not None and self.cassette.replaying:
+            logger.info(f"Replaying vision responses from {self.cassette.path} ({len(self.cassette)} entries)")
+            return
         self._spawn_server()
         start_time = asyncio.get_event_loop().time()
 
@@ -59,8 +97,8 @@ class MCPVisionClient:
                     raise MCPConnectionError(f"Failed to initialize MCP server within {timeout}s: {e}")
                 
                 if self.process.poll() is not None:
-                    stderr = self.process.stderr.read().decode(errors='ignore') if self.process.stderr else ""
-                    raise MCPConnectionError(f"MCP server process died during startup. Stderr: {stderr}")
+                    stderr = await self._stderr_tail()
+                    raise MCPServerDied(f"MCP server process died during startup. Stderr: {stderr}")
 
                 await asyncio.sleep(0.5)
 
@@ -68,12 +106,9 @@ class MCPVisionClient:
         "Spawn the MCP server process."
         env = {**os.environ, "Z_AI_API_KEY": self.api_key, "Z_AI_MODE": self.mode}
         
-        # In this environment, npx is on the path
-        cmd = ["npx", "-y", "@z_ai/mcp-server@latest"]
-
         try:
             self.process = subprocess.Popen(
-                cmd,
+                self.command,
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE, # Keep stderr separate for debugging
@@ -83,6 +118,46 @@ class MCPVisionClient:
         except OSError as e:
             raise MCPConnectionError(f"Failed to spawn MCP server: {e}")
 
+        self._stderr = StderrDrain(self.process.stderr).start()
+
+    async def _stderr_tail(self) -> str:
+        "Recent stderr lines from the server, collected by the drain thread."
+        if not self._stderr:
+            return ""
+        # Give the drain a moment to pick up the final lines of a dying
+        # process, waiting in a worker thread so other tasks keep running
+        await asyncio.get_event_loop().run_in_executor(None, self._stderr.join, 0.5)
+        return self._stderr.tail()
+
+    def _terminate(self) -> None:
+        "Stop the server process without touching supervision state."
+        if self.process:
+            if self.process.poll() is None:
+                self.process.terminate()
+                try:
+                    self.process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+                    self.process.wait()
+            # Only stdin is ours to close; stdout/stderr may still have a
+            # reader thread blocked on them and will hit EOF on their own.
+            try:
+                if self.process.stdin:
+                    self.process.stdin.close()
+            except OSError:
+                pass
+            self.process = None
+        self._initialized = False
+
+    async def restart(self) -> None:
+        "Respawn the server after a crash, backing off on repeated attempts."
+        self.restarts += 1
+        delay = backoff_delay(self.restarts, self.backoff_base, self.backoff_max)
+        logger.warning(f"Restarting MCP server in {delay:.1f}s (restart #{self.restarts})")
+        self._terminate()
+        await asyncio.sleep(delay)
+        await self.start()
+
     async def _initialize(self) -> None:
         "Complete MCP initialization handshake."
         response = await self._send_request("initialize", {
@@ -99,66 +174,141 @@ class MCPVisionClient:
     async def _send_request(self, method: str, params: dict, timeout: float = 60.0) -> MCPResponse:
         "Send JSON-RPC request and wait for response."
         async with self._lock:
-            request = self.protocol.create_request(method, params)
-            request_line = request.to_json() + "\n"
-            
-            self.process.stdin.write(request_line.encode())
+            with metrics.timed("vision_request_seconds", method=method):
+                try:
+                    return await self._exchange(method, params, timeout)
+                except MCPConnectionError as e:
+                    metrics.error("vision", e)
+                    raise
+
+    async def _exchange(self, method: str, params: dict, timeout: float) -> MCPResponse:
+        "Write one request line and read lines until its response arrives (caller holds the lock)."
+        request = self.protocol.create_request(method, params)
+        request_line = self.protocol.encode_request(request)
+
+        try:
+            self.process.stdin.write(request_line)
             self.process.stdin.flush()
+        except (BrokenPipeError, OSError, ValueError) as e:
+            stderr = await self._stderr_tail()
+            raise MCPServerDied(f"MCP server pipe closed: {e}. Stderr: {stderr}")
 
-            loop = asyncio.get_event_loop()
-            deadline = loop.time() + timeout
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
 
-            while True:
-                remaining = deadline - loop.time()
-                if remaining <= 0:
-                    raise MCPConnectionError(f"Timeout waiting for response to {method}")
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise MCPConnectionError(f"Timeout waiting for response to {method}")
 
+            try:
+                # Non-blocking read of stdout
+                response_line = await asyncio.wait_for(
+                    loop.run_in_executor(None, self.process.stdout.readline),
+                    timeout=remaining,
+                )
+            except asyncio.TimeoutError:
+                raise MCPConnectionError(f"Timeout waiting for response to {method}")
+
+            if not response_line:
+                # EOF on stdout: the process is gone or about to be
                 try:
-                    # Non-blocking read of stdout
-                    response_line = await asyncio.wait_for(
-                        loop.run_in_executor(None, self.process.stdout.readline),
-                        timeout=remaining,
-                    )
-                except asyncio.TimeoutError:
-                    raise MCPConnectionError(f"Timeout waiting for response to {method}")
-
-                if not response_line:
-                    if self.process.poll() is not None:
-                        stderr = self.process.stderr.read().decode(errors="ignore") if self.process.stderr else ""
-                        raise MCPConnectionError(f"MCP server died: {stderr}")
+                    self.process.wait(timeout=1)
+                except subprocess.TimeoutExpired:
                     raise MCPConnectionError("Empty response from MCP server")
+                stderr = await self._stderr_tail()
+                raise MCPServerDied(f"MCP server died: {stderr}")
 
-                raw = response_line.decode(errors="ignore").strip()
-                try:
-                    parsed = json.loads(raw)
-                    if parsed.get("id") == request.id:
-                        return MCPResponse.from_json(raw)
-                except json.JSONDecodeError:
-                    continue
+            try:
+                parsed = self.protocol.decode(response_line)
+            except ValueError:
+                continue
+            # Single parse: the id check and the response share one decoded dict
+            if isinstance(parsed, dict) and parsed.get("id") == request.id:
+                return MCPResponse.from_dict(parsed)
 
     async def _send_notification(self, method: str, params: dict = None) -> None:
         "Send JSON-RPC notification (no response expected)."
-        notification = self.protocol.create_notification(method, params)
-        self.process.stdin.write((notification + "\n").encode())
-        self.process.stdin.flush()
+        notification = self.protocol.encode_notification(method, params)
+        try:
+            self.process.stdin.write(notification)
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError, ValueError) as e:
+            raise MCPServerDied(f"MCP server pipe closed: {e}")
 
+    @tracing.traced("vision.analyze_image")
     async def analyze_image(self, image_path: str, prompt: str, timeout: float = 120.0) -> VisionResult:
-        "Analyze an image using Z.AI vision."
-        if not self._initialized:
+        """
+        Analyze an image using Z.AI vision.
+
+        Raises CircuitOpenError while the breaker is open; callers should
+        pause and retry the same image rather than record a failure. In
+        replay mode, raises CassetteMiss for a call that was never recorded;
+        callers should skip the image.
+        """
+        if not self._supervising:
             raise RuntimeError("Client not initialized. Call start() first.")
 
         # Normalize path to absolute
         abs_path = str(Path(image_path).resolve()).replace("\\", "/")
-
-        response = await self._send_request("tools/call", {
+        params = {
             "name": "analyze_image",
             "arguments": {
                 "image_source": abs_path,
                 "prompt": prompt
             }
-        }, timeout=timeout)
+        }
 
-        return self._parse_tool_response(response)
+        if self.cassette is not None and self.cassette.replaying:
+            recorded = self.cassette.lookup(image_path, prompt)
+            if recorded is None:
+                raise CassetteMiss(f"Cassette miss for {image_path}")
+            return self._parse_tool_response(MCPResponse(id=None, **recorded))
+
+        attempts = 0
+        while True:
+            self.breaker.check()
+            try:
+                if not self._initialized:
+                    try:
+                        await self.restart()
+                    except MCPServerDied:
+                        raise
+                    except MCPConnectionError as e:
+                        # A respawn that cannot finish its handshake is the same outage
+                        raise MCPServerDied(f"MCP server restart failed: {e}") from e
+                response = await self._send_request("tools/call", params, timeout=timeout)
+            except MCPServerDied as e:
+                self.breaker.record_failure()
+                attempts += 1
+                logger.error(f"MCP server died: {e}")
+                if attempts > self.max_restarts:
+                    raise
+                # Force a respawn on the next loop iteration (unless the breaker opened)
+                self._terminate()
+                continue
+            except MCPConnectionError:
+                self.breaker.record_failure()
+                raise
+
+            self.breaker.record_success()
+            self.restarts = 0
+            if self.cassette is not None:
+                recorded = {"error": response.error} if response.error is not None else {"result": response.result}
+                self.cassette.record(image_path, prompt, params["arguments"], recorded)
+            result = self._parse_tool_response(response)
+            if tracing.enabled():
+                tracing.current_span().set_attributes({
+                    "image.path": abs_path, "vision.success": result.success,
+                    "vision.restarts": attempts, "upload.bytes": os.path.getsize(abs_path) if os.path.exists(abs_path) else 0,
+                })
+            if metrics.enabled():
+                size = os.path.getsize(abs_path) if os.path.exists(abs_path) else 0
+                metrics.inc("vision_upload_bytes_total", size)
+                metrics.observe("vision_upload_bytes", size)
+                if not result.success:
+                    metrics.error("vision", "jsonrpc_error" if response.error is not None else "tool_error")
+            return result
 
     def _parse_tool_response(self, response: MCPResponse) -> VisionResult:
         "Parse MCP tool response into VisionResult."
@@ -191,14 +341,8 @@ class MCPVisionClient:
 
     async def close(self) -> None:
         "Shutdown MCP server."
-        if self.process:
-            self.process.terminate()
-            try:
-                self.process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self.process.kill()
-            self.process = None
-            self._initialized = False
+        self._supervising = False
+        self._terminate()
 
     async def __aenter__(self):
         await self.start()
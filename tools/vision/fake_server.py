@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for @z_ai/mcp-server.
+
+Speaks the same newline-delimited JSON-RPC over stdio (initialize,
+notifications/initialized, tools/list, tools/call analyze_image) so the
+classifier, MCPVisionClient and the DB write path can be exercised and
+load-tested without spending API quota.
+
+Usage:
+    python tools/vision/fake_server.py --latency lognormal:0.8,0.4 --error-rate 0.02
+    NAVAL_GALLERY_MCP_COMMAND="python tools/vision/fake_server.py" python tools/classify_images.py
+
+Latency specs (seconds):
+    fixed:0.5            constant delay
+    uniform:0.2,1.5      uniform between bounds
+    normal:0.8,0.2       gaussian, clamped at 0
+    lognormal:0.8,0.4    lognormal with the given median and sigma
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+import time
+
+DEFAULT_CLASSIFICATION = {
+    "image_type": "single_view",
+    "view_type": "side_profile",
+    "view_style": "line_drawing_bw",
+    "orientation": "bow_left",
+    "ship_type": "battleship",
+    "ship_class": None,
+    "ship_name": None,
+    "navy": "Royal Navy",
+    "era": "dreadnought",
+    "is_historical": True,
+    "designer": None,
+    "silhouette_clarity": "clean",
+    "annotation_density": "light",
+    "resolution_quality": "high",
+    "extraction_tier": 2,
+    "suitable_for_extraction": True,
+    "quality_issues": [],
+    "reasoning": "Canned response from the offline fake MCP server.",
+    "confidence": 0.85,
+    "notes": None,
+}
+
+
+def parse_latency(spec):
+    "Turn a latency spec string into a zero-argument sampler returning seconds."
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()] if args else []
+
+    if kind == "fixed":
+        delay = values[0] if values else 0.0
+        return lambda: delay
+    if kind == "uniform":
+        low, high = values
+        return lambda: random.uniform(low, high)
+    if kind == "normal":
+        mean, sd = values
+        return lambda: max(0.0, random.gauss(mean, sd))
+    if kind == "lognormal":
+        median, sigma = values
+        mu = math.log(median)
+        return lambda: random.lognormvariate(mu, sigma)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def load_canned(path):
+    "Load canned classifications: a single JSON object or a list to sample from."
+    if not path:
+        return [DEFAULT_CLASSIFICATION]
+    with open(path, "r") as f:
+        data = json.load(f)
+    return data if isinstance(data, list) else [data]
+
+
+class FakeVisionServer:
+    def __init__(self, latency, error_rate=0.0, tool_error_rate=0.0, canned=None, die_after=None,
+                 fenced=False):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.tool_error_rate = tool_error_rate
+        self.canned = canned or [DEFAULT_CLASSIFICATION]
+        self.die_after = die_after
+        self.fenced = fenced
+        self.calls = 0
+
+    def handle(self, message):
+        "Return the response dict for a request, or None for notifications."
+        method = message.get("method")
+        msg_id = message.get("id")
+        if msg_id is None:
+            return None
+
+        if method == "initialize":
+            return self._result(msg_id, {
+                "protocolVersion": message.get("params", {}).get("protocolVersion", "2024-11-05"),
+                "capabilities": {"tools": {}},
+                "serverInfo": {"name": "naval-gallery-fake-vision", "version": "0.1.0"},
+            })
+        if method == "tools/list":
+            return self._result(msg_id, {"tools": [{
+                "name": "analyze_image",
+                "description": "Offline stand-in for Z.AI image analysis",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {"image_source": {"type": "string"}, "prompt": {"type": "string"}},
+                    "required": ["image_source", "prompt"],
+                },
+            }]})
+        if method == "tools/call":
+            return self._tools_call(msg_id, message.get("params", {}))
+        return self._error(msg_id, -32601, f"Method not found: {method}")
+
+    def _tools_call(self, msg_id, params):
+        self.calls += 1
+        if self.die_after is not None and self.calls > self.die_after:
+            sys.stderr.write(f"fake server: exiting after {self.die_after} calls\n")
+            sys.stderr.flush()
+            sys.exit(1)
+
+        time.sleep(self.latency())
+
+        if params.get("name") != "analyze_image":
+            return self._error(msg_id, -32602, f"Unknown tool: {params.get('name')}")
+        if random.random() < self.error_rate:
+            return self._error(msg_id, -32000, "Simulated upstream failure")
+        if random.random() < self.tool_error_rate:
+            return self._result(msg_id, {
+                "content": [{"type": "text", "text": "Simulated tool error: image too large"}],
+                "isError": True,
+            })
+
+        text = json.dumps(random.choice(self.canned))
+        if self.fenced:
+            text = f"```json\n{text}\n```"
+        return self._result(msg_id, {"content": [{"type": "text", "text": text}], "isError": False})
+
+    @staticmethod
+    def _result(msg_id, result):
+        return {"jsonrpc": "2.0", "id": msg_id, "result": result}
+
+    @staticmethod
+    def _error(msg_id, code, message):
+        return {"jsonrpc": "2.0", "id": msg_id, "error": {"code": code, "message": message}}
+
+    def serve(self, stdin=sys.stdin, stdout=sys.stdout):
+        for line in stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                sys.stderr.write(f"fake server: ignoring malformed line: {line[:80]}\n")
+                continue
+            response = self.handle(message)
+            if response is not None:
+                stdout.write(json.dumps(response) + "\n")
+                stdout.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline fake MCP vision server")
+    parser.add_argument("--latency", default="fixed:0", help="Latency distribution spec (see module docstring)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls returning a JSON-RPC error")
+    parser.add_argument("--tool-error-rate", type=float, default=0.0, help="Fraction of calls returning isError")
+    parser.add_argument("--canned", type=str, default=None, help="JSON file with a classification object or list")
+    parser.add_argument("--fenced", action="store_true", help="Wrap responses in markdown code fences")
+    parser.add_argument("--die-after", type=int, default=None, help="Exit after N tool calls (crash testing)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    server = FakeVisionServer(
+        latency=parse_latency(args.latency),
+        error_rate=args.error_rate,
+        tool_error_rate=args.tool_error_rate,
+        canned=load_canned(args.canned),
+        die_after=args.die_after,
+        fenced=args.fenced,
+    )
+    sys.stderr.write("fake server: ready\n")
+    sys.stderr.flush()
+    server.serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,93 @@
 import json
 import logging
+import os
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Optional
 
 logger = logging.getLogger(__name__)
 
+# ============================================================================
+# JSON CODECS
+# ============================================================================
+# Every codec turns a Python object into one UTF-8 encoded line (no trailing
+# newline) and back. loads() raises ValueError on malformed input whatever the
+# backend, so callers only need to catch one exception type.
+
+class StdlibCodec:
+    "json module fallback; always available."
+    name = "json"
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, data) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    "orjson fast path (Rust, returns bytes directly)."
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._orjson.dumps(obj)
+
+    def loads(self, data) -> Any:
+        # orjson.JSONDecodeError subclasses ValueError
+        return self._orjson.loads(data)
+
+
+class MsgspecCodec:
+    "msgspec fast path."
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+        self._decode_error = msgspec.DecodeError
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj)
+
+    def loads(self, data) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except self._decode_error as e:
+            raise ValueError(str(e)) from e
+
+
+CODECS = {"orjson": OrjsonCodec, "msgspec": MsgspecCodec, "json": StdlibCodec}
+
+
+def get_codec(name: Optional[str] = None):
+    """
+    Return a codec instance.
+
+    With no name (and NAVAL_GALLERY_JSON_CODEC unset) the fastest installed
+    backend is used: orjson, then msgspec, then the stdlib json module.
+    """
+    name = name or os.environ.get("NAVAL_GALLERY_JSON_CODEC")
+    if name:
+        if name not in CODECS:
+            raise ValueError(f"Unknown JSON codec: {name} (choose from {', '.join(CODECS)})")
+        return CODECS[name]()
+
+    for candidate in ("orjson", "msgspec"):
+        try:
+            return CODECS[candidate]()
+        except ImportError:
+            continue
+    return StdlibCodec()
+
+
+# ============================================================================
+# JSON-RPC MESSAGES
+# ============================================================================
+
 @dataclass
 class MCPRequest:
     "JSON-RPC request structure."
@@ -12,13 +95,16 @@ class MCPRequest:
     params: dict
     id: int
 
-    def to_json(self) -> str:
-        return json.dumps({
+    def to_dict(self) -> dict:
+        return {
             "jsonrpc": "2.0",
             "method": self.method,
             "params": self.params,
             "id": self.id
-        })
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
 
 @dataclass
 class MCPResponse:
@@ -28,44 +114,70 @@ class MCPResponse:
     error: Optional[dict] = None
 
     @classmethod
-    def from_json(cls, data: str) -> "MCPResponse":
-        parsed = json.loads(data)
+    def from_dict(cls, parsed: dict) -> "MCPResponse":
         return cls(
             id=parsed.get("id"),
             result=parsed.get("result"),
             error=parsed.get("error")
         )
 
+    @classmethod
+    def from_json(cls, data: str) -> "MCPResponse":
+        return cls.from_dict(json.loads(data))
+
     @property
     def success(self) -> bool:
         return self.error is None
 
 class MCPProtocol:
-    "MCP protocol handler."
+    """
+    MCP protocol handler.
 
-    def __init__(self):
+    Messages are encoded and decoded exactly once through the configured
+    codec; debug logging of the wire format only happens when the
+    mcp.protocol logger is actually enabled for DEBUG.
+    """
+
+    def __init__(self, codec=None):
         self._request_id = 0
         self._protocol_logger = logging.getLogger("mcp.protocol")
+        self.codec = codec or get_codec()
 
     def create_request(self, method: str, params: dict) -> MCPRequest:
         "Create a new request with auto-incrementing ID."
         self._request_id += 1
-        request = MCPRequest(method=method, params=params, id=self._request_id)
-        self._protocol_logger.debug(f">>> {request.to_json()}")
-        return request
+        return MCPRequest(method=method, params=params, id=self._request_id)
+
+    def encode_request(self, request: MCPRequest) -> bytes:
+        "Serialize a request to a newline-terminated wire line."
+        line = self.codec.dumps(request.to_dict())
+        if self._protocol_logger.isEnabledFor(logging.DEBUG):
+            self._protocol_logger.debug(">>> %s", line.decode("utf-8", errors="replace"))
+        return line + b"\n"
+
+    def decode(self, line) -> dict:
+        "Parse one wire line (bytes or str). Raises ValueError on malformed JSON."
+        if self._protocol_logger.isEnabledFor(logging.DEBUG):
+            text = line.decode("utf-8", errors="replace") if isinstance(line, bytes) else line
+            self._protocol_logger.debug("<<< %s", text.strip())
+        return self.codec.loads(line)
 
-    def parse_response(self, data: str) -> MCPResponse:
+    def parse_response(self, data) -> MCPResponse:
         "Parse a JSON-RPC response."
-        self._protocol_logger.debug(f"<<< {data.strip()}")
-        return MCPResponse.from_json(data)
+        return MCPResponse.from_dict(self.decode(data))
 
-    def create_notification(self, method: str, params: dict = None) -> str:
-        "Create a notification (no response expected)."
+    def encode_notification(self, method: str, params: dict = None) -> bytes:
+        "Serialize a notification (no response expected) to a wire line."
         notification = {
             "jsonrpc": "2.0",
             "method": method,
             "params": params or {}
         }
-        msg = json.dumps(notification)
-        self._protocol_logger.debug(f">>> {msg}")
-        return msg
+        line = self.codec.dumps(notification)
+        if self._protocol_logger.isEnabledFor(logging.DEBUG):
+            self._protocol_logger.debug(">>> %s", line.decode("utf-8", errors="replace"))
+        return line + b"\n"
+
+    def create_notification(self, method: str, params: dict = None) -> str:
+        "Create a notification (no response expected)."
+        return self.encode_notification(method, params).decode("utf-8").rstrip("\n")
@@ -0,0 +1,416 @@
+"""
+Parsing and validation of LLM vision output.
+
+The model is asked for bare JSON but regularly wraps it in markdown fences,
+adds a sentence of prose, uses single quotes or Python literals, leaves
+trailing commas, or gets cut off mid-object. Every one of those used to be a
+"JSON Parse Error" and a wasted, paid-for call. This module:
+
+1. finds the outermost JSON object with a single-pass, string-aware scanner
+2. repairs common defects (fences, trailing commas, single quotes,
+   True/False/None, unterminated strings and brackets)
+3. validates and coerces fields against the Phase 1 / Phase 2 schemas
+   (enum normalization, confidence as a float, tier as an int, ...)
+"""
+
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseParseError(ValueError):
+    "Raised when no JSON object can be recovered from a model response."
+    pass
+
+
+# ============================================================================
+# EXTRACTION
+# ============================================================================
+
+def extract_json_object(text: str) -> Optional[str]:
+    """
+    Return the first outermost {...} object in text, or None.
+
+    Single pass: tracks nesting depth and whether we are inside a string
+    (either quote style, with backslash escapes), so braces inside strings
+    and prose on either side do not confuse it. If the text ends before the
+    object closes (truncated output), the unterminated tail is returned and
+    left for repair_json to close.
+    """
+    start = None
+    depth = 0
+    quote = None
+    escaped = False
+
+    for i, ch in enumerate(text):
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote:
+                quote = None
+            continue
+
+        if ch == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == "}" and depth > 0:
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+        elif ch in ("\"", "'") and depth > 0:
+            # Only treat ' as a quote where it can open a value/key, not in prose apostrophes
+            if ch == "\"" or _opens_single_quote(text, i):
+                quote = ch
+
+    if start is not None:
+        return text[start:]
+    return None
+
+
+def _opens_single_quote(text: str, i: int) -> bool:
+    "True if the ' at position i sits where a JSON string could start."
+    j = i - 1
+    while j >= 0 and text[j] in " \t\r\n":
+        j -= 1
+    return j < 0 or text[j] in "{[,:"
+
+
+# ============================================================================
+# REPAIR
+# ============================================================================
+
+_FENCE_RE = re.compile(r"^```[a-zA-Z0-9_-]*\s*$", re.MULTILINE)
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def strip_fences(text: str) -> str:
+    "Remove markdown code fence lines (```json ... ```)."
+    return _FENCE_RE.sub("", text)
+
+
+def repair_json(text: str) -> str:
+    """
+    Rewrite near-JSON into valid JSON in one pass.
+
+    Handles single-quoted strings, Python literals, trailing commas,
+    unescaped newlines inside strings, and unterminated strings/containers
+    from truncated output.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    quote = None
+    escaped = False
+    i = 0
+    n = len(text)
+
+    while i < n:
+        ch = text[i]
+
+        if quote:
+            if escaped:
+                escaped = False
+                out.append(ch)
+            elif ch == "\\":
+                escaped = True
+                out.append(ch)
+            elif ch == quote:
+                quote = None
+                out.append("\"")
+            elif ch == "\"":
+                # Double quote inside a single-quoted string
+                out.append("\\\"")
+            elif ch == "\n":
+                out.append("\\n")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch == "\"" or (ch == "'" and _opens_single_quote(text, i)):
+            quote = ch
+            out.append("\"")
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch in "}]":
+            _drop_trailing_comma(out)
+            if stack:
+                stack.pop()
+            out.append(ch)
+        elif ch.isalpha() or ch == "_":
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            k = j
+            while k < n and text[k] in " \t":
+                k += 1
+            word = _PY_LITERALS.get(word, word)
+            if i > 0 and text[i - 1].isdigit():
+                out.append(word)  # exponent or unit suffix glued to a number
+            elif k < n and text[k] == ":" and stack and stack[-1] == "}":
+                out.append(f"\"{word}\"")  # bare object key
+            elif word in ("true", "false", "null"):
+                out.append(word)
+            else:
+                out.append(f"\"{word}\"")  # bare word value, e.g. confidence: high
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    # Truncated output: close whatever is still open
+    if quote:
+        if escaped:
+            out.pop()
+        out.append("\"")
+    _drop_trailing_comma(out)
+    if _last_significant(out) == ":":
+        out.append(" null")
+    while stack:
+        _drop_trailing_comma(out)
+        out.append(stack.pop())
+    return "".join(out)
+
+
+def _last_significant(out: List[str]) -> Optional[str]:
+    "Last non-whitespace character in the output buffer."
+    for ch in reversed(out):
+        if not ch.isspace():
+            return ch
+    return None
+
+
+def _drop_trailing_comma(out: List[str]) -> None:
+    "Remove a trailing comma (ignoring whitespace) from the output buffer."
+    k = len(out) - 1
+    while k >= 0 and out[k].isspace():
+        k -= 1
+    if k >= 0 and out[k] == ",":
+        del out[k]
+
+
+# ============================================================================
+# SCHEMAS
+# ============================================================================
+
+@dataclass
+class FieldSpec:
+    kind: str                          # str | enum | int | float | bool | list
+    choices: tuple = ()
+    aliases: Dict[str, str] = field(default_factory=dict)
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+
+
+def _enum(*choices, **aliases):
+    return FieldSpec("enum", choices=choices, aliases=aliases)
+
+
+PHASE_1_SCHEMA: Dict[str, FieldSpec] = {
+    "image_type": _enum("single_view", "multi_view_stacked", "multi_view_grid", "photograph", "painting",
+                        multi_view="multi_view_stacked", stacked="multi_view_stacked", grid="multi_view_grid",
+                        photo="photograph"),
+    "view_type": _enum("side_profile", "plan_view", "bow_view", "stern_view", "cross_section", "detail", "unknown",
+                       profile="side_profile", side_view="side_profile", elevation="side_profile",
+                       plan="plan_view", top_view="plan_view", deck_plan="plan_view",
+                       section="cross_section", front_view="bow_view", rear_view="stern_view"),
+    "view_style": _enum("line_drawing_bw", "line_drawing_color", "filled_color", "shaded", "photograph", "painting",
+                        line_drawing="line_drawing_bw", bw_line_drawing="line_drawing_bw",
+                        color_line_drawing="line_drawing_color", photo="photograph"),
+    "orientation": _enum("bow_left", "bow_right", "bow_up", "bow_down"),
+    "ship_type": _enum("battleship", "cruiser", "destroyer", "submarine", "carrier", "auxiliary", "unknown",
+                       battlecruiser="cruiser", armored_cruiser="cruiser", light_cruiser="cruiser",
+                       heavy_cruiser="cruiser", aircraft_carrier="carrier", pre_dreadnought="battleship",
+                       dreadnought="battleship"),
+    "ship_class": FieldSpec("str"),
+    "ship_name": FieldSpec("str"),
+    "navy": FieldSpec("str"),
+    "era": _enum("pre_dreadnought", "dreadnought", "interwar", "wwii", "post_war",
+                 ww2="wwii", world_war_ii="wwii", world_war_2="wwii", wwi="dreadnought", ww1="dreadnought",
+                 postwar="post_war", cold_war="post_war", predreadnought="pre_dreadnought"),
+    "is_historical": FieldSpec("bool"),
+    "designer": FieldSpec("str"),
+    "silhouette_clarity": _enum("clean", "moderate", "noisy"),
+    "annotation_density": _enum("none", "light", "heavy"),
+    "resolution_quality": _enum("high", "medium", "low"),
+    "extraction_tier": FieldSpec("int", minimum=1, maximum=5),
+    "suitable_for_extraction": FieldSpec("bool"),
+    "quality_issues": FieldSpec("list"),
+    "reasoning": FieldSpec("str"),
+    "confidence": FieldSpec("float", minimum=0.0, maximum=1.0),
+    "notes": FieldSpec("str"),
+}
+
+PHASE_2_SCHEMA: Dict[str, FieldSpec] = {
+    **{name: FieldSpec("str") for name in (
+        "ship_name", "ship_class", "hull_number", "shipyard", "dimensions", "displacement",
+        "propulsion", "speed", "armor", "armament", "complement", "launch_date",
+        "commission_date", "reasoning", "notes",
+    )},
+    "confidence": FieldSpec("float", minimum=0.0, maximum=1.0),
+}
+
+# Single-pass mode asks for both phases at once
+COMBINED_SCHEMA: Dict[str, FieldSpec] = {**PHASE_1_SCHEMA, **PHASE_2_SCHEMA}
+
+SCHEMAS = {1: PHASE_1_SCHEMA, 2: PHASE_2_SCHEMA, "combined": COMBINED_SCHEMA}
+
+_NULL_STRINGS = {"", "null", "none", "n/a", "na", "unknown", "not visible", "not available", "not labeled", "-"}
+_CONFIDENCE_WORDS = {"very high": 0.95, "high": 0.9, "medium": 0.6, "moderate": 0.6, "low": 0.3, "very low": 0.1}
+_TRUE_WORDS = {"true", "yes", "y", "1"}
+_FALSE_WORDS = {"false", "no", "n", "0"}
+
+
+def _normalize_token(value: str) -> str:
+    return re.sub(r"[\s\-/]+", "_", value.strip().lower()).strip("_")
+
+
+def coerce_field(name: str, spec: FieldSpec, value: Any, warnings: List[str]) -> Any:
+    "Coerce a single value to its schema type; returns None when it cannot be salvaged."
+    if value is None:
+        return None
+
+    if spec.kind == "str":
+        if isinstance(value, (list, dict)):
+            return json.dumps(value)
+        text = str(value).strip()
+        return None if text.lower() in _NULL_STRINGS else text
+
+    if spec.kind == "enum":
+        token = _normalize_token(str(value))
+        if token in spec.choices:
+            return token
+        if token in spec.aliases:
+            return spec.aliases[token]
+        # Tolerate decorated values like "side_profile (primary)"
+        for choice in spec.choices:
+            if token.startswith(choice):
+                return choice
+        warnings.append(f"{name}: unexpected value {value!r}")
+        return str(value).strip() or None
+
+    if spec.kind == "bool":
+        if isinstance(value, bool):
+            return value
+        token = str(value).strip().lower()
+        if token in _TRUE_WORDS:
+            return True
+        if token in _FALSE_WORDS:
+            return False
+        warnings.append(f"{name}: not a boolean {value!r}")
+        return None
+
+    if spec.kind in ("int", "float"):
+        number = _to_number(value)
+        if number is None and spec.kind == "float" and isinstance(value, str):
+            number = _CONFIDENCE_WORDS.get(value.strip().lower())
+        if number is None:
+            warnings.append(f"{name}: not a number {value!r}")
+            return None
+        if name == "confidence" and 1.0 < number <= 100.0 and ("%" in str(value) or number >= 2.0):
+            number = number / 100.0  # "85" or "85%"; 1.2 is more likely an overshoot, clamped below
+        if spec.minimum is not None and number < spec.minimum:
+            warnings.append(f"{name}: {number} clamped to {spec.minimum}")
+            number = spec.minimum
+        if spec.maximum is not None and number > spec.maximum:
+            warnings.append(f"{name}: {number} clamped to {spec.maximum}")
+            number = spec.maximum
+        return int(round(number)) if spec.kind == "int" else float(number)
+
+    if spec.kind == "list":
+        if isinstance(value, list):
+            return [v for v in value if v not in (None, "")]
+        text = str(value).strip()
+        if text.lower() in _NULL_STRINGS:
+            return []
+        return [part.strip() for part in re.split(r"[,;]", text) if part.strip()]
+
+    return value
+
+
+def _to_number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r"-?\d+(?:\.\d+)?", str(value))
+    return float(match.group()) if match else None
+
+
+def validate(data: Dict[str, Any], schema: Dict[str, FieldSpec], warnings: List[str]) -> Dict[str, Any]:
+    "Coerce known fields; unknown keys are passed through untouched."
+    result = dict(data)
+    for name, spec in schema.items():
+        if name in result:
+            result[name] = coerce_field(name, spec, result[name], warnings)
+    return result
+
+
+# ============================================================================
+# ENTRY POINT
+# ============================================================================
+
+def _repair_and_load(candidate: str, max_cuts: int = 3) -> Any:
+    """
+    Repair and parse; if that still fails (typically output truncated inside
+    a key), drop the last partial member and retry a few times.
+    """
+    attempt = candidate
+    for _ in range(max_cuts + 1):
+        try:
+            return json.loads(repair_json(attempt))
+        except json.JSONDecodeError as e:
+            error = e
+            cut = attempt.rfind(",")
+            if cut <= 0:
+                break
+            attempt = attempt[:cut]
+    raise ResponseParseError(f"Unrepairable JSON: {error}") from error
+
+
+@dataclass
+class ParseResult:
+    data: Dict[str, Any]
+    repaired: bool = False
+    warnings: List[str] = field(default_factory=list)
+
+
+def parse_response(text: str, phase: int = 1, schema: Optional[Dict[str, FieldSpec]] = None) -> ParseResult:
+    """
+    Recover and validate the classification object from a model response.
+
+    Raises ResponseParseError only when no JSON object can be found or
+    repaired at all.
+    """
+    if schema is None:
+        schema = SCHEMAS[phase]
+    if not text or not text.strip():
+        raise ResponseParseError("Empty response")
+
+    candidate = extract_json_object(strip_fences(text))
+    if candidate is None:
+        raise ResponseParseError(f"No JSON object found in response: {text[:80]!r}")
+
+    repaired = False
+    try:
+        data = json.loads(candidate)
+    except json.JSONDecodeError:
+        data = _repair_and_load(candidate)
+        repaired = True
+
+    if not isinstance(data, dict):
+        raise ResponseParseError(f"Expected a JSON object, got {type(data).__name__}")
+
+    warnings: List[str] = []
+    if repaired:
+        warnings.append("response JSON was repaired")
+    return ParseResult(data=validate(data, schema, warnings), repaired=repaired, warnings=warnings)
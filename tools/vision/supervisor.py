@@ -0,0 +1,117 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, IO, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    "Raised when the circuit breaker is open and calls should be paused."
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"MCP server circuit open; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Classic three-state circuit breaker.
+
+    closed    -> calls flow; consecutive failures are counted
+    open      -> calls are rejected with CircuitOpenError until reset_timeout elapses
+    half_open -> one trial call is let through; success closes, failure re-opens
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+    def retry_after(self) -> float:
+        "Seconds until an open breaker will allow a trial call."
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - self._clock())
+
+    def check(self) -> None:
+        "Raise CircuitOpenError if calls are currently blocked."
+        if self.state == self.OPEN:
+            remaining = self.retry_after()
+            if remaining > 0:
+                raise CircuitOpenError(remaining)
+            self.state = self.HALF_OPEN
+            logger.info("Circuit half-open: allowing a trial call")
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("Circuit closed: MCP server recovered")
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuit open after {self.failures} failures; pausing for {self.reset_timeout:.0f}s")
+            self.state = self.OPEN
+            self._opened_at = self._clock()
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0, jitter: float = 0.1) -> float:
+    "Exponential backoff delay for the given 1-based attempt number."
+    delay = min(cap, base * (2 ** max(0, attempt - 1)))
+    return delay * (1 + random.uniform(-jitter, jitter))
+
+
+class StderrDrain:
+    """
+    Background reader for a subprocess stderr pipe.
+
+    An undrained pipe fills its OS buffer and blocks the child on its next
+    write, so every line is read as it arrives, forwarded to the logs and
+    kept in a small ring buffer for error reports.
+    """
+
+    def __init__(self, stream: IO[bytes], name: str = "mcp.server", keep: int = 50):
+        self._stream = stream
+        self._logger = logging.getLogger(name)
+        self._tail = deque(maxlen=keep)
+        self._thread = threading.Thread(target=self._run, name=f"{name}-stderr", daemon=True)
+
+    def start(self) -> "StderrDrain":
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        try:
+            for raw in iter(self._stream.readline, b""):
+                line = raw.decode(errors="ignore").rstrip()
+                if not line:
+                    continue
+                self._tail.append(line)
+                self._logger.debug(line)
+        except (OSError, ValueError):
+            # Pipe closed underneath us during shutdown
+            pass
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        self._thread.join(timeout)
+
+    def tail(self) -> str:
+        "Most recent stderr output, oldest first."
+        return "\n".join(self._tail)